@@ -1,8 +1,6 @@
 import cv2
 import numpy as np
-from flask import Flask, Response, jsonify, request
-from picamera2 import Picamera2
-from libcamera import controls
+from flask import Flask, Response, g, jsonify, request
 import threading
 import time
 import socket
@@ -10,7 +8,16 @@ import json
 import logging
 import uuid
 import os
+import base64
+import struct
+import zlib
+import bisect
+import math
+import subprocess
 import requests
+from urllib.parse import urlparse
+from collections import deque
+from camera_source import open_source
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,269 +26,1244 @@ logger = logging.getLogger(__name__)
 # 設定
 NODE_NAME = os.environ.get('CAMERA_NODE_NAME', f'camera-{socket.gethostname()}')
 NODE_ID = str(uuid.uuid4())[:8]  # ユニークID
-CENTRAL_SERVER = os.environ.get('CENTRAL_SERVER', 'http://192.168.179.200:5001')  # 中央サーバーのアドレス
+CAMERA_GROUP = os.environ.get('CAMERA_GROUP')  # ダッシュボードでの表示グループ（ライン・エリアなど）
+# タグ（カンマ区切り、例: line=1,station=A,purpose=inspection）。中央サーバーでの絞り込みや一括操作に使う
+CAMERA_TAGS = sorted({tag.strip() for tag in os.environ.get('CAMERA_TAGS', '').split(',') if tag.strip()})
+# 管理するカメラの番号（カンマ区切り、例: 0,1）。カメラごとに /cam/<番号>/... で配信し、中央サーバーには別々のノードとして登録する
+CAMERA_NUMS = [int(num) for num in os.environ.get('CAMERA_NUMS', '0').split(',') if num.strip()]
+# カメラのバックエンド（picamera2, v4l2[:デバイス], synthetic, replay:<ファイル>。camera_source.py を参照）
+CAMERA_SOURCE = os.environ.get('CAMERA_SOURCE', 'picamera2')
+CENTRAL_SERVER = os.environ.get('CENTRAL_SERVER')  # 中央サーバーのアドレス（未指定の場合はLAN内で自動検出）
 API_PORT = int(os.environ.get('API_PORT', 8000))
 STREAM_QUALITY = int(os.environ.get('STREAM_QUALITY', 70))  # JPEG品質
+# 縮小配信のプロファイル（/stream?profile=thumb、中央サーバーのモザイク配信などで使用）
+STREAM_PROFILES = {
+    'thumb': {'width': 320, 'quality': 60, 'fps': 5},
+}
 RESOLUTION = (1280, 720)  # カメラ解像度
+TARGET_FPS = float(os.environ.get('TARGET_FPS', 30))  # 目標フレームレート（実行中に /api/config で変更可能）
+MAX_FPS = 120  # 設定できるフレームレートの上限
+OVERRUN_LOG_INTERVAL = 10  # フレーム落ちの警告ログを出す最小間隔（秒）
+# 真偽値の制御を変換（bool() では文字列 "false" や "0" も真になるため、明示的な値のみ受け付ける）
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', '1', 'false', '0'):
+        return value.strip().lower() in ('true', '1')
+    raise ValueError(f'not a boolean: {value!r}')
+
+# 実行中に変更できるカメラ制御項目と値の変換
+CAMERA_CONTROLS = {
+    'ExposureTime': int,  # 露光時間（マイクロ秒）
+    'AnalogueGain': float,
+    'AeEnable': parse_bool,
+    'AwbEnable': parse_bool,
+    'ColourGains': lambda v: (float(v[0]), float(v[1])),  # (赤, 青)
+    'Brightness': float,
+    'Contrast': float,
+    'Saturation': float,
+    'Sharpness': float,
+    'LensPosition': float,  # マニュアルフォーカス時のレンズ位置（ディオプター）
+    'AfMode': str,  # 'manual', 'auto', 'continuous'
+}
+STILL_RESOLUTION = (2592, 1944)  # 静止画（スナップショット）解像度
+SNAPSHOT_COALESCE_WINDOW = float(os.environ.get('SNAPSHOT_COALESCE_WINDOW', 1.0))  # この秒数内のスナップショット要求は同じ撮影結果を共有
+CALIBRATION_FILE = os.environ.get('CALIBRATION_FILE', 'calibration.json')  # カメラ内部パラメータの保存先（2台目以降は calibration-<番号>.json）
+RING_BUFFER_SIZE = int(os.environ.get('RING_BUFFER_SIZE', 15))  # 同期撮影用に保持する直近フレーム数
+MAX_CAPTURE_WAIT = 5.0  # 同期撮影で目標時刻を待つ最大時間（秒）
+MAX_CAPTURE_SKEW = float(os.environ.get('MAX_CAPTURE_SKEW', 1.0))  # 同期撮影で目標時刻からこれ以上離れたフレームは返さない（秒）
+CLOCK_SAMPLE_WINDOW = 8  # 時刻オフセット推定に使う直近の計測数
+UDP_HEARTBEAT_PORT = int(os.environ.get('UDP_HEARTBEAT_PORT', 5002))  # UDPハートビートの送信先ポート（0で無効）
+UDP_HEARTBEAT_INTERVAL = float(os.environ.get('UDP_HEARTBEAT_INTERVAL', 2.0))  # UDPハートビート間隔（秒）
+UDP_MAX_MISSED_ACKS = 5  # 応答のないUDPハートビートがこの回数続いたらHTTPで再登録
+REGISTRATION_REFRESH_INTERVAL = 300  # UDPハートビート使用時もこの間隔でHTTP登録を行う（秒）
 NODE_IP = os.environ.get('NODE_IP', None)  # 環境変数からノードのIPを取得
+DISCOVERY_PORT = int(os.environ.get('DISCOVERY_PORT', 5003))  # サーバー検出用のUDPポート
+DISCOVERY_TIMEOUT = 1.0  # 検出要求への応答待ち時間（秒）
+ANNOUNCE_BIND_RETRY_INTERVAL = 30  # 起動通知の受信ポートを使えない場合の再試行間隔（秒）
+IP_REFRESH_INTERVAL = 60  # netlinkが使えない環境でのローカルIPの再取得間隔（秒）
+
+# UDPハートビートのデータグラム形式（central_server.pyと一致させること）
+#   マジック, バージョン, ノードID, ステータス, シーケンス番号, ノード情報のCRC32, 送信時刻, FPS, CPU温度,
+#   時刻オフセット, 往復遅延
+HEARTBEAT_FORMAT = '!4sB8sBIIdffdf'
+HEARTBEAT_MAGIC = b'SBHB'
+#   マジック, バージョン, フラグ, t0（ノード送信時刻）, t1（サーバー受信時刻）, t2（サーバー送信時刻）
+HEARTBEAT_ACK_FORMAT = '!4sBBddd'
+HEARTBEAT_ACK_MAGIC = b'SBHA'
+HEARTBEAT_ACK_SIZE = struct.calcsize(HEARTBEAT_ACK_FORMAT)
+HEARTBEAT_VERSION = 1
+ACK_FLAG_REGISTER = 0x01  # サーバーがHTTPでの再登録を要求
+STATUS_CODES = {'initializing': 0, 'running': 1, 'error': 2}
+VOLATILE_INFO_KEYS = ('status', 'last_heartbeat', 'clock_offset', 'clock_rtt')  # UDPハートビートで送る/登録に不要な項目
+
+# サーバー検出のデータグラム形式（central_server.pyと一致させること）
+#   マジック, バージョン, HTTPポート, UDPハートビートポート
+DISCOVERY_FORMAT = '!4sBHH'
+DISCOVERY_QUERY_MAGIC = b'SBDQ'  # ノード -> ブロードキャスト: サーバーの問い合わせ
+DISCOVERY_REPLY_MAGIC = b'SBDR'  # サーバー -> ノード: 問い合わせへの応答
+DISCOVERY_ANNOUNCE_MAGIC = b'SBAN'  # サーバー -> ブロードキャスト: 起動の通知
+DISCOVERY_VERSION = 1
+# メトリクスのヒストグラムの区間（上限値）
+# 色変換はカメラソースの capture() 内で行うため capture_seconds に含まれる
+METRIC_HISTOGRAMS = {
+    'capture_seconds': ('フレームの取得・色変換の時間（秒）', (0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0)),
+    'undistort_seconds': ('歪み補正の時間（秒）', (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1)),
+    'encode_seconds': ('JPEGエンコード時間（秒）', (0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)),
+    'frame_bytes': ('ストリーム1フレームのJPEGサイズ（バイト）', (16384, 32768, 65536, 131072, 262144, 524288, 1048576)),
+    'frame_interval_seconds': ('フレームの取得間隔（秒）', (0.01, 0.02, 0.034, 0.05, 0.067, 0.1, 0.2, 0.5, 1.0)),
+}
+# vcgencmd get_throttled のビット（現在の状態）
+THROTTLE_FLAGS = {
+    0: 'under_voltage',
+    1: 'frequency_capped',
+    2: 'throttled',
+    3: 'soft_temperature_limit',
+}
+# netlinkのマルチキャストグループ（linux/rtnetlink.h）
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
 
 # Flaskアプリの初期化
 app = Flask(__name__)
 
 # グローバル変数
-frame = None
-lock = threading.Lock()
-camera_running = False
-node_info = {
-    'id': NODE_ID,
-    'name': NODE_NAME,
-    'ip': None,
-    'port': API_PORT,
-    'status': 'initializing',
-    'resolution': RESOLUTION,
-    'last_heartbeat': None
-}
+camera_states = {}  # カメラ番号 -> カメラごとの状態（new_camera_state を参照）
+snapshot_flights = {}  # キー -> 実行中または直近の撮影（同時の要求を1回の撮影にまとめる）
+snapshot_flight_lock = threading.Lock()
+calibration_lock = threading.Lock()
+clock_samples = deque(maxlen=CLOCK_SAMPLE_WINDOW)  # 時刻同期の計測結果 (オフセット, 往復遅延)
+clock_offset = 0.0  # 中央サーバーの時刻 - ノードの時刻（秒）
+central_server = CENTRAL_SERVER  # 現在の中央サーバーのアドレス（検出で更新される）
+heartbeat_port = UDP_HEARTBEAT_PORT  # 中央サーバーのUDPハートビートポート
+local_ip = None  # キャッシュしたローカルIP（ネットワーク変化時に破棄）
+local_ip_time = 0
+netlink_available = False
+registration_requested = False  # 次のループで必ずHTTP登録を行う
+registration_wakeup = threading.Event()  # ネットワーク変化やサーバー起動通知で登録スレッドを起こす
+metrics_lock = threading.Lock()
+
+# カメラごとの状態を作成（フレームバッファ・実行時設定・メトリクスと、中央サーバーに登録するノード情報）
+# 先頭のカメラはノード名をそのまま使い、2台目以降は番号を付けた名前のサブノードとして登録する
+def new_camera_state(num):
+    primary = num == CAMERA_NUMS[0]
+    lock = threading.Lock()
+    base, ext = os.path.splitext(CALIBRATION_FILE)
+    return {
+        'num': num,
+        'camera': None,
+        'running': False,
+        'frame': None,
+        'frame_timestamp': None,  # 最新フレームの露光時刻（UNIX時間）
+        'frame_seq': 0,  # 取得したフレームの通し番号（ストリームでの取りこぼし検出用）
+        'frame_buffer': deque(maxlen=RING_BUFFER_SIZE),  # 直近フレームのリングバッファ (露光時刻, 画像)
+        'lock': lock,
+        'frame_condition': threading.Condition(lock),  # 新しいフレームの到着通知
+        'camera_lock': threading.Lock(),  # カメラの再構成中にフレームを取得しないようにする
+        'target_fps': TARGET_FPS,
+        'resolution': RESOLUTION,
+        'stream_quality': STREAM_QUALITY,
+        'camera_settings': {'AfMode': 'continuous'},  # 現在適用しているカメラ制御（再構成後に再適用する）
+        'scaler_crop': None,  # センサー側の切り出し範囲（正規化座標 [x, y, w, h]、Noneは全体）
+        'calibration': None,  # カメラ内部パラメータ（中央サーバーで算出されたもの）
+        'calibration_file': CALIBRATION_FILE if primary else f'{base}-{num}{ext}',
+        'undistort_maps': {},  # 解像度 -> 歪み補正マップ (map1, map2)
+        'histograms': {
+            name: {'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            for name, (_, buckets) in METRIC_HISTOGRAMS.items()
+        },
+        'counters': {
+            'frames_captured_total': 0,
+            'capture_errors_total': 0,
+            'stream_frames_sent_total': 0,
+            'stream_bytes_sent_total': 0,
+            'stream_frames_dropped_total': 0,
+            'capture_overruns_total': 0,
+            'snapshot_captures_total': 0,
+            'snapshot_requests_coalesced_total': 0,
+        },
+        'stream_clients': 0,  # 配信中のストリーム数
+        'info': {
+            # UDPハートビートのノードIDは8バイト固定のため、末尾2桁をカメラ番号にする
+            'id': f'{NODE_ID[:6]}{num:02x}',
+            'name': NODE_NAME if primary else f'{NODE_NAME}-cam{num}',
+            'path': f'/cam/{num}',  # このカメラのエンドポイントの接頭辞
+            'camera_num': num,
+            'group': CAMERA_GROUP,
+            'tags': CAMERA_TAGS,
+            'ip': None,
+            'port': API_PORT,
+            'status': 'initializing',
+            'resolution': RESOLUTION,
+            'calibration_id': None,
+            'target_fps': TARGET_FPS,
+            'clock_offset': None,
+            'clock_rtt': None,
+            'last_heartbeat': None
+        }
+    }
+
+for num in CAMERA_NUMS:
+    camera_states[num] = new_camera_state(num)
 
 # ローカルIPアドレスを取得する関数
+# 結果はキャッシュし、netlinkでインターフェースの変化を検知したときのみ再取得する
 def get_local_ip():
+    global local_ip, local_ip_time
     # 環境変数でIPが指定されている場合はそれを使用
     if NODE_IP:
-        logger.info(f"環境変数から指定されたIPアドレスを使用します: {NODE_IP}")
         return NODE_IP
     
+    ip = local_ip
+    if ip is not None and (netlink_available or time.time() - local_ip_time < IP_REFRESH_INTERVAL):
+        return ip
+    
     try:
+        # UDPのconnectはパケットを送信せず、経路に対応する送信元アドレスだけが決まる
+        target = urlparse(central_server).hostname if central_server else '8.8.8.8'
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(('8.8.8.8', 80))
+        s.connect((target, 80))
         ip = s.getsockname()[0]
         s.close()
+        local_ip = ip
+        local_ip_time = time.time()
         return ip
     except Exception as e:
         logger.error(f"IPアドレス取得エラー: {e}")
         return '127.0.0.1'
 
+# ネットワークインターフェースの変化をnetlinkで監視するスレッド
+def netlink_monitor_thread():
+    global netlink_available, local_ip
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+    except (AttributeError, OSError) as e:
+        logger.warning(f"netlinkを利用できません。ローカルIPは{IP_REFRESH_INTERVAL}秒ごとに再取得します: {e}")
+        return
+    
+    netlink_available = True
+    while True:
+        try:
+            sock.recv(65536)
+            # リンクやアドレスが変わったらIPを取り直し、すぐに再登録する
+            logger.info("ネットワークインターフェースの変化を検知しました")
+            local_ip = None
+            registration_wakeup.set()
+        except Exception as e:
+            logger.error(f"netlink監視エラー: {e}")
+            time.sleep(1)
+
+# LAN内にブロードキャストして中央サーバーを検出（見つからなければNone）
+def discover_server():
+    global heartbeat_port
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.settimeout(DISCOVERY_TIMEOUT)
+        query = struct.pack(DISCOVERY_FORMAT, DISCOVERY_QUERY_MAGIC, DISCOVERY_VERSION, API_PORT, 0)
+        sock.sendto(query, ('<broadcast>', DISCOVERY_PORT))
+        
+        deadline = time.time() + DISCOVERY_TIMEOUT
+        while time.time() < deadline:
+            try:
+                data, address = sock.recvfrom(64)
+            except socket.timeout:
+                break
+            if len(data) != struct.calcsize(DISCOVERY_FORMAT):
+                continue
+            magic, version, http_port, udp_port = struct.unpack(DISCOVERY_FORMAT, data)
+            if magic == DISCOVERY_REPLY_MAGIC and version == DISCOVERY_VERSION:
+                heartbeat_port = udp_port
+                return f"http://{address[0]}:{http_port}"
+    except OSError as e:
+        logger.error(f"中央サーバーの検出エラー: {e}")
+    finally:
+        sock.close()
+    return None
+
+# 中央サーバーの起動通知を受信するスレッド（サーバー再起動後すぐに再登録する）
+def announce_listener_thread():
+    global central_server, heartbeat_port, registration_requested
+    
+    # 同じホストの別のノードプロセスともポートを共有できるようにする。
+    # それでも使えない場合は起動通知なしで動作し（再登録は通常のハートビートで行われる）、定期的に再試行する
+    while True:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('', DISCOVERY_PORT))
+            break
+        except OSError as e:
+            sock.close()
+            logger.warning(f"起動通知の受信ポート {DISCOVERY_PORT} を使用できません。{ANNOUNCE_BIND_RETRY_INTERVAL}秒後に再試行します: {e}")
+            time.sleep(ANNOUNCE_BIND_RETRY_INTERVAL)
+    
+    while True:
+        try:
+            data, address = sock.recvfrom(64)
+            if len(data) != struct.calcsize(DISCOVERY_FORMAT):
+                continue
+            magic, version, http_port, udp_port = struct.unpack(DISCOVERY_FORMAT, data)
+            if magic != DISCOVERY_ANNOUNCE_MAGIC or version != DISCOVERY_VERSION:
+                continue
+            
+            server = f"http://{address[0]}:{http_port}"
+            # 環境変数でサーバーが固定されている場合は、そのサーバーの通知のみ受け付ける
+            if CENTRAL_SERVER and urlparse(CENTRAL_SERVER).hostname != address[0]:
+                continue
+            logger.info(f"中央サーバーの起動通知を受信しました: {server}")
+            if not CENTRAL_SERVER:
+                central_server = server
+                heartbeat_port = udp_port
+            registration_requested = True
+            registration_wakeup.set()
+        except Exception as e:
+            logger.error(f"起動通知の受信エラー: {e}")
+            time.sleep(1)
+
+# 登録スレッドを待機させる（ネットワーク変化などで起こされた場合はTrue）
+def wait_for_wakeup(timeout):
+    if registration_wakeup.wait(timeout):
+        registration_wakeup.clear()
+        return True
+    return False
+
+# NTPと同様の4つの時刻から中央サーバーとの時刻オフセットを推定する
+#   t0: ノード送信時刻, t1: サーバー受信時刻, t2: サーバー送信時刻, t3: ノード受信時刻
+def update_clock_offset(t0, t1, t2, t3):
+    global clock_offset
+    offset = ((t1 - t0) + (t2 - t3)) / 2
+    rtt = (t3 - t0) - (t2 - t1)
+    if rtt < 0:
+        return
+    
+    clock_samples.append((offset, rtt))
+    # 往復遅延が最小の計測が最も正確（Wi-Fiの再送などによる非対称な遅延の影響が小さい）
+    best_offset, best_rtt = min(clock_samples, key=lambda sample: sample[1])
+    clock_offset = best_offset
+    for cam in camera_states.values():
+        cam['info']['clock_offset'] = best_offset
+        cam['info']['clock_rtt'] = best_rtt
+
+# ノードの時刻を中央サーバーの時刻に変換
+def to_server_time(timestamp):
+    return timestamp + clock_offset
+
+# 保存済みのカメラ内部パラメータを読み込む
+def load_calibration(cam):
+    path = cam['calibration_file']
+    if not os.path.exists(path):
+        return
+    
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            set_calibration(cam, json.load(f), save=False)
+        logger.info(f"カメラ内部パラメータを読み込みました: {path}")
+    except Exception as e:
+        logger.error(f"カメラ内部パラメータの読み込みエラー: {e}")
+
+# カメラ内部パラメータを設定（None で解除）し、補正マップのキャッシュを破棄する
+def set_calibration(cam, new_calibration, save=True):
+    with calibration_lock:
+        cam['calibration'] = new_calibration
+        cam['undistort_maps'].clear()
+        cam['info']['calibration_id'] = new_calibration.get('id') if new_calibration else None
+    
+    if save:
+        path = cam['calibration_file']
+        if new_calibration:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(new_calibration, f, indent=2)
+            os.replace(tmp_path, path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+# 指定解像度の歪み補正マップを取得（解像度ごとに一度だけ計算してキャッシュする）
+def get_undistort_maps(cam, size):
+    with calibration_lock:
+        calibration = cam['calibration']
+        if calibration is None:
+            return None
+        
+        maps = cam['undistort_maps'].get(size)
+        if maps is None:
+            # 校正時の解像度から内部パラメータを換算（センサー全域を使うモード間でのみ厳密）
+            calib_w, calib_h = calibration['image_size']
+            sx, sy = size[0] / calib_w, size[1] / calib_h
+            camera_matrix = np.array(calibration['camera_matrix'], dtype=np.float64)
+            camera_matrix[0] *= sx
+            camera_matrix[1] *= sy
+            dist_coeffs = np.array(calibration['dist_coeffs'], dtype=np.float64)
+            
+            # 固定小数点形式のマップにするとremapが高速になる
+            maps = cv2.initUndistortRectifyMap(
+                camera_matrix, dist_coeffs, None, camera_matrix, size, cv2.CV_16SC2
+            )
+            cam['undistort_maps'][size] = maps
+            logger.info(f"歪み補正マップを作成しました: カメラ{cam['num']} {size[0]}x{size[1]}")
+        
+        return maps
+
+# 歪み補正を適用（未校正の場合はそのまま返す）
+def undistort(cam, img):
+    maps = get_undistort_maps(cam, (img.shape[1], img.shape[0]))
+    if maps is None:
+        return img
+    return cv2.remap(img, maps[0], maps[1], cv2.INTER_LINEAR)
+
+# ROI（正規化座標 "x,y,w,h" または [x, y, w, h]）を検証して返す（未指定はNone）
+def parse_roi(value):
+    if value is None or value == '':
+        return None
+    parts = value.split(',') if isinstance(value, str) else value
+    try:
+        x, y, w, h = (float(v) for v in parts)
+    except (TypeError, ValueError):
+        raise ValueError('roi must be x,y,w,h in normalized coordinates')
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < w <= 1 and 0 < h <= 1 and x + w <= 1.0001 and y + h <= 1.0001):
+        raise ValueError('roi must be x,y,w,h in normalized coordinates')
+    return (x, y, w, h)
+
+# ROIを切り出す（NumPyのビューなのでコピーは発生せず、エンコードする画素だけが減る）
+def crop_roi(img, roi):
+    if roi is None:
+        return img
+    height, width = img.shape[:2]
+    x, y, w, h = roi
+    x0, y0 = int(x * width), int(y * height)
+    x1 = min(width, max(x0 + 1, int(round((x + w) * width))))
+    y1 = min(height, max(y0 + 1, int(round((y + h) * height))))
+    return img[y0:y1, x0:x1]
+
+# センサー側の切り出し（ScalerCrop）を設定する。全体の画素を読み出さないためデジタルズームとして画質も保たれる
+# （センサー側で切り出せないバックエンドでは画像を切り出して元の解像度に拡大する）
+def set_scaler_crop(cam, roi):
+    if cam['camera'] is not None:
+        cam['camera'].set_crop(roi)
+    cam['scaler_crop'] = roi
+    logger.info(f"カメラ{cam['num']}のセンサーの切り出し範囲を変更しました: {roi}")
+
+# カメラ制御の値を検証・変換（不正な場合はValueError）
+def validate_camera_controls(requested):
+    validated = {}
+    for name, value in requested.items():
+        if name not in CAMERA_CONTROLS:
+            raise ValueError(f'Unsupported control: {name}')
+        try:
+            validated[name] = CAMERA_CONTROLS[name](value)
+        except (TypeError, ValueError, IndexError):
+            raise ValueError(f'Invalid value for {name}: {value}')
+    if validated.get('AfMode', 'continuous') not in ('manual', 'auto', 'continuous'):
+        raise ValueError(f"Invalid value for AfMode: {validated['AfMode']}")
+    return validated
+
+# カメラ制御を実行中のカメラに適用
+def apply_camera_controls(cam, validated):
+    if cam['camera'] is not None:
+        cam['camera'].set_controls(validated)
+    cam['camera_settings'].update(validated)
+    logger.info(f"カメラ{cam['num']}の制御を変更しました: {validated}")
+
+# ストリーム解像度を変更（カメラを停止・再構成・再開し、制御を再適用する）
+def reconfigure_resolution(cam, size):
+    camera = cam['camera']
+    if camera is not None:
+        with cam['camera_lock']:
+            camera.reconfigure(size)
+    cam['resolution'] = size
+    cam['info']['resolution'] = size
+    logger.info(f"カメラ{cam['num']}のストリーム解像度を {size[0]}x{size[1]} に変更しました")
+
 # カメラの初期化
-def initialize_camera():
-    global camera_running
+def initialize_camera(cam):
     try:
-        camera = Picamera2()
-        camera.configure(camera.create_preview_configuration(main={
-            "format": 'XRGB8888',
-            "size": RESOLUTION
-        }))
-        camera.start()
-        camera.set_controls({'AfMode': controls.AfModeEnum.Continuous})
-        camera_running = True
-        node_info['status'] = 'running'
-        logger.info("カメラを初期化しました")
+        camera = open_source(CAMERA_SOURCE, cam['num'])
+        camera.start(cam['resolution'], cam['target_fps'], cam['camera_settings'])
+        cam['camera'] = camera
+        cam['running'] = True
+        cam['info']['status'] = 'running'
+        logger.info(f"カメラ{cam['num']}を初期化しました")
         return camera
     except Exception as e:
-        logger.error(f"カメラの初期化に失敗しました: {e}")
-        camera_running = False
-        node_info['status'] = 'error'
+        logger.error(f"カメラ{cam['num']}の初期化に失敗しました: {e}")
+        cam['running'] = False
+        cam['info']['status'] = 'error'
         return None
 
-# フレームをキャプチャするスレッド関数
-def capture_frames(camera):
-    global frame, camera_running
+# 目標フレームレートを変更（センサー側のフレーム時間も合わせて変更する）
+def set_target_fps(cam, fps):
+    if not 0 < fps <= MAX_FPS:
+        raise ValueError(f'fps must be between 0 and {MAX_FPS}')
+    if cam['camera'] is not None:
+        cam['camera'].set_fps(fps)
+    cam['target_fps'] = fps
+    cam['info']['target_fps'] = fps
+    logger.info(f"カメラ{cam['num']}の目標フレームレートを {fps}FPS に変更しました")
+
+# フレームをキャプチャするスレッド関数（カメラごとに1つ）
+def capture_frames(cam):
+    camera = cam['camera']
+    logger.info(f"カメラ{cam['num']}のフレームキャプチャスレッドを開始しました")
     
-    logger.info("フレームキャプチャスレッドを開始しました")
+    # 実カメラの capture() はセンサーのフレーム完成まで待機するため、通常はそれ自体がペースを決める。
+    # センサーが目標より速い場合や、合成画像・録画再生のようにすぐに返るソースでは、次の締め切りまでの残り時間だけ待機する
+    deadline = time.perf_counter()
+    last_frame_at = None
+    overruns_since_log = 0
+    last_overrun_log = 0
     
-    while camera_running:
+    while cam['running']:
         try:
-            # フレームのキャプチャ
-            img = camera.capture_array()
+            # フレームのキャプチャ（BGRに変換済みの画像と露光時刻を受け取る）
+            capture_started = time.perf_counter()
+            with cam['camera_lock']:
+                img, timestamp = camera.capture()
+            undistort_started = time.perf_counter()
+            observe(cam, 'capture_seconds', undistort_started - capture_started)
+            
+            # 歪み補正（校正済みの場合のみ。センサー側で切り出している場合は校正時と画角が異なるため行わない）
+            if cam['scaler_crop'] is None:
+                img = undistort(cam, img)
+            observe(cam, 'undistort_seconds', time.perf_counter() - undistort_started)
             
-            # 必要に応じてBGRに変換
-            channels = 1 if len(img.shape) == 2 else img.shape[2]
-            if channels == 1:
-                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-            elif channels == 4:
-                img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            # カメラのフレームの更新
+            with cam['lock']:
+                cam['frame'] = img
+                cam['frame_timestamp'] = timestamp
+                cam['frame_seq'] += 1
+                cam['frame_buffer'].append((timestamp, img))
+                cam['frame_condition'].notify_all()
+            increment(cam, 'frames_captured_total')
             
-            # グローバルフレームの更新
-            with lock:
-                frame = img
+            # フレーム間隔を記録し、予定より1.5フレーム以上遅れたら取りこぼしとして数える
+            now = time.perf_counter()
+            target_fps = cam['target_fps']
+            budget = 1.0 / target_fps
+            if last_frame_at is not None:
+                interval = now - last_frame_at
+                observe(cam, 'frame_interval_seconds', interval)
+                if interval > budget * 1.5:
+                    missed = int(round(interval / budget)) - 1
+                    increment(cam, 'capture_overruns_total', missed)
+                    overruns_since_log += missed
+            last_frame_at = now
             
-            # フレームレートの制御
-            time.sleep(0.03)  # 約30FPS
+            if overruns_since_log and now - last_overrun_log >= OVERRUN_LOG_INTERVAL:
+                logger.warning(f"カメラ{cam['num']}のフレーム取得が目標 {target_fps}FPS に間に合っていません（直近 {overruns_since_log} フレーム分の遅れ）")
+                overruns_since_log = 0
+                last_overrun_log = now
+            
+            # 次の締め切りまで待機（遅れている場合は待たずに締め切りを現在時刻に合わせ直す）
+            deadline += budget
+            if deadline > now:
+                time.sleep(deadline - now)
+            else:
+                deadline = now
         
         except Exception as e:
-            logger.error(f"フレームキャプチャエラー: {e}")
+            logger.error(f"カメラ{cam['num']}のフレームキャプチャエラー: {e}")
+            increment(cam, 'capture_errors_total')
             time.sleep(1)
     
-    logger.info("フレームキャプチャスレッドを停止しました")
+    logger.info(f"カメラ{cam['num']}のフレームキャプチャスレッドを停止しました")
 
 # ストリーミング用のフレーム生成
-def generate_frames():
-    global frame
+# 新しいフレームが届くまで待機し、同じフレームを重複してエンコードしない
+def generate_frames(cam, roi=None, profile=None):
+    with metrics_lock:
+        cam['stream_clients'] += 1
+    last_seq = None
+    last_sent = 0.0
+    try:
+        while True:
+            try:
+                # 最新のフレームを取得
+                with cam['frame_condition']:
+                    while cam['frame'] is None or cam['frame_seq'] == last_seq:
+                        cam['frame_condition'].wait(1.0)
+                    img = cam['frame']
+                    timestamp = cam['frame_timestamp']
+                    seq = cam['frame_seq']
+                
+                # 配信が追いつかずに飛ばしたフレームを記録
+                if last_seq is not None and seq - last_seq > 1:
+                    increment(cam, 'stream_frames_dropped_total', seq - last_seq - 1)
+                last_seq = seq
+                
+                img = crop_roi(img, roi)
+                quality = cam['stream_quality']
+                if profile is not None:
+                    # プロファイルのフレームレートを超える分は送らない
+                    if time.monotonic() - last_sent < 1.0 / profile['fps']:
+                        continue
+                    last_sent = time.monotonic()
+                    scale = profile['width'] / img.shape[1]
+                    if scale < 1.0:
+                        img = cv2.resize(img, (profile['width'], round(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+                    quality = profile['quality']
+                
+                # フレームをJPEGとしてエンコード
+                encode_started = time.perf_counter()
+                ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                observe(cam, 'encode_seconds', time.perf_counter() - encode_started)
+                if not ret:
+                    continue
+                
+                jpeg = buffer.tobytes()
+                observe(cam, 'frame_bytes', len(jpeg))
+                increment(cam, 'stream_frames_sent_total')
+                increment(cam, 'stream_bytes_sent_total', len(jpeg))
+                
+                # MJPEGフォーマットでフレームを返す（露光時刻は中央サーバーの時刻基準で付与）
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'X-Timestamp: ' + f'{to_server_time(timestamp):.6f}'.encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+            
+            except Exception as e:
+                logger.error(f"フレーム生成エラー: {e}")
+                time.sleep(0.5)
+    finally:
+        with metrics_lock:
+            cam['stream_clients'] -= 1
+
+# 同じキーの処理が実行中または直近に完了していればその結果を共有し、そうでなければ実行する
+# （失敗した結果は共有しない。キーにはカメラ番号を含める）
+def single_flight(cam, key, func):
+    key = (cam['num'], key)
+    now = time.time()
+    with snapshot_flight_lock:
+        for stale_key in [k for k, f in snapshot_flights.items()
+                          if f['event'].is_set() and now - f['time'] > SNAPSHOT_COALESCE_WINDOW]:
+            del snapshot_flights[stale_key]
+        flight = snapshot_flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = {'event': threading.Event(), 'result': None, 'error': None, 'time': None}
+            snapshot_flights[key] = flight
     
-    while True:
-        # フレームが利用可能になるまで待機
-        if frame is None:
-            time.sleep(0.1)
-            continue
-        
+    if not leader:
+        increment(cam, 'snapshot_requests_coalesced_total')
+        flight['event'].wait()
+    else:
         try:
-            # 最新のフレームを取得
-            with lock:
-                img = frame.copy()
-            
-            # フレームをJPEGとしてエンコード
-            ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, STREAM_QUALITY])
-            if not ret:
-                continue
-            
-            # MJPEGフォーマットでフレームを返す
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        
+            flight['result'] = func()
         except Exception as e:
-            logger.error(f"フレーム生成エラー: {e}")
-            time.sleep(0.5)
+            flight['error'] = e
+        flight['time'] = time.time()
+        if flight['error'] is not None:
+            with snapshot_flight_lock:
+                if snapshot_flights.get(key) is flight:
+                    del snapshot_flights[key]
+        flight['event'].set()
+    
+    if flight['error'] is not None:
+        raise flight['error']
+    return flight['result']
+
+# 高解像度の静止画を撮影（動作中のカメラを一時的に静止画モードに切り替え、撮影後にストリーム用の設定へ戻す）
+def capture_still(cam):
+    camera = cam['camera']
+    with cam['camera_lock']:
+        img, timestamp = camera.capture_still(STILL_RESOLUTION)
+    increment(cam, 'snapshot_captures_total')
+    return img, timestamp
+
+# スナップショットを作成（高解像度撮影に失敗した場合は現在のストリームフレームを使用）
+def create_snapshot(cam, raw, roi):
+    if cam['running'] and cam['camera'] is not None:
+        try:
+            # 補正やROIが異なる要求も、撮影は1回で共有する
+            img, timestamp = single_flight(cam, 'still', lambda: capture_still(cam))
+            if not raw:
+                img = undistort(cam, img)
+            ret, buffer = cv2.imencode('.jpg', crop_roi(img, roi), [cv2.IMWRITE_JPEG_QUALITY, 95])
+            if ret:
+                return {
+                    'timestamp': timestamp,
+                    'image': base64.b64encode(buffer).decode('utf-8'),
+                    'undistorted': cam['calibration'] is not None and not raw,
+                    'roi': roi
+                }
+            logger.warning("高解像度撮影に失敗しました。通常解像度で対応します。")
+        except Exception as e:
+            logger.error(f"高解像度撮影エラー: {e}")
+    
+    # ストリームフレームは常に補正済み（校正済みの場合）
+    with cam['lock']:
+        img = cam['frame']
+        timestamp = cam['frame_timestamp']
+    ret, buffer = cv2.imencode('.jpg', crop_roi(img, roi), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ret:
+        raise RuntimeError('Failed to encode image')
+    return {
+        'timestamp': timestamp,
+        'image': base64.b64encode(buffer).decode('utf-8'),
+        'undistorted': cam['calibration'] is not None,
+        'roi': roi
+    }
+
+# ノード情報のうちHTTP登録が必要な部分の変化を検出するためのチェックサム
+def node_info_crc(info):
+    static_info = {k: v for k, v in info.items() if k not in VOLATILE_INFO_KEYS}
+    return zlib.crc32(json.dumps(static_info, sort_keys=True).encode())
 
-# 中央サーバーへの登録スレッド
+# 直近のフレーム間隔から実効フレームレートを算出
+def measure_fps(cam):
+    with cam['lock']:
+        timestamps = [timestamp for timestamp, _ in cam['frame_buffer']]
+    if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+        return 0.0
+    return (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+# CPU温度（℃）を取得（取得できない場合はNaN）
+def read_cpu_temp():
+    try:
+        with open('/sys/class/thermal/thermal_zone0/temp') as f:
+            return int(f.read().strip()) / 1000
+    except (OSError, ValueError):
+        return float('nan')
+
+# スロットリング状態を取得（vcgencmdがない場合はNone）
+def read_throttled():
+    try:
+        output = subprocess.run(
+            ['vcgencmd', 'get_throttled'], capture_output=True, text=True, timeout=1
+        ).stdout
+        return int(output.strip().split('=')[1], 16)
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return None
+
+# ヒストグラムに計測値を追加
+def observe(cam, name, value):
+    _, buckets = METRIC_HISTOGRAMS[name]
+    index = bisect.bisect_left(buckets, value)
+    with metrics_lock:
+        histogram = cam['histograms'][name]
+        histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+# カウンターを加算
+def increment(cam, name, value=1):
+    with metrics_lock:
+        cam['counters'][name] += value
+
+# カメラの現在のメトリクスをまとめて取得（CPU温度などはノード共通）
+def collect_metrics(cam):
+    with metrics_lock:
+        snapshot_histograms = {
+            name: {
+                'buckets': list(METRIC_HISTOGRAMS[name][1]),
+                'counts': list(histogram['counts']),
+                'sum': histogram['sum'],
+                'count': histogram['count'],
+            }
+            for name, histogram in cam['histograms'].items()
+        }
+        counters = dict(cam['counters'])
+    
+    throttled = read_throttled()
+    cpu_temp = read_cpu_temp()
+    return {
+        'node_id': cam['info']['id'],
+        'name': cam['info']['name'],
+        'camera_num': cam['num'],
+        'timestamp': time.time(),
+        'fps': measure_fps(cam),
+        'stream_clients': cam['stream_clients'],
+        'cpu_temp': None if math.isnan(cpu_temp) else cpu_temp,
+        'throttled': throttled,
+        'throttle_flags': None if throttled is None else {
+            flag: bool(throttled & (1 << bit)) for bit, flag in THROTTLE_FLAGS.items()
+        },
+        'counters': counters,
+        'histograms': snapshot_histograms,
+    }
+
+# Prometheusのラベル値をエスケープ（\\, \", 改行）
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# メトリクスをPrometheusのテキスト形式に変換
+def format_prometheus(metrics):
+    labels = f'node="{escape_label_value(metrics["name"])}",id="{escape_label_value(metrics["node_id"])}"'
+    lines = []
+    
+    def gauge(name, help_text, value):
+        if value is None:
+            return
+        lines.append(f'# HELP camera_node_{name} {help_text}')
+        lines.append(f'# TYPE camera_node_{name} gauge')
+        lines.append(f'camera_node_{name}{{{labels}}} {value}')
+    
+    gauge('fps', '直近フレームから算出した実効フレームレート', round(metrics['fps'], 3))
+    gauge('stream_clients', '配信中のストリーム数', metrics['stream_clients'])
+    gauge('cpu_temperature_celsius', 'CPU温度', metrics['cpu_temp'])
+    gauge('throttled', 'vcgencmd get_throttled の値', metrics['throttled'])
+    if metrics['throttle_flags']:
+        for flag, active in metrics['throttle_flags'].items():
+            gauge(f'throttle_{flag}', f'スロットリング状態: {flag}', int(active))
+    
+    for name, value in metrics['counters'].items():
+        lines.append(f'# TYPE camera_node_{name} counter')
+        lines.append(f'camera_node_{name}{{{labels}}} {value}')
+    
+    for name, histogram in metrics['histograms'].items():
+        lines.append(f'# HELP camera_node_{name} {METRIC_HISTOGRAMS[name][0]}')
+        lines.append(f'# TYPE camera_node_{name} histogram')
+        cumulative = 0
+        for bound, count in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+            cumulative += count
+            lines.append(f'camera_node_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'camera_node_{name}_sum{{{labels}}} {histogram["sum"]}')
+        lines.append(f'camera_node_{name}_count{{{labels}}} {histogram["count"]}')
+    
+    return '\n'.join(lines) + '\n'
+
+# 中央サーバーにHTTPで完全なノード情報を登録（時刻同期も行う）
+def register_node(info, info_crc):
+    # ハートビートに時刻同期の送信時刻と、UDPハートビートで照合するチェックサムを含める
+    payload = dict(info, info_crc=info_crc, clock_sync={'t0': time.time()})
+    response = requests.post(f"{central_server}/api/register", json=payload, timeout=10)
+    t3 = time.time()
+    logger.debug(f"登録リクエスト送信完了。ステータスコード: {response.status_code}")
+    if response.status_code != 200:
+        logger.warning(f"中央サーバーへの登録に失敗しました: {response.status_code}, レスポンス: {response.text}")
+        return False
+    
+    result = response.json()
+    logger.debug(f"中央サーバーへの登録に成功しました: {result}")
+    clock_sync = result.get('clock_sync')
+    if clock_sync:
+        update_clock_offset(clock_sync['t0'], clock_sync['t1'], clock_sync['t2'], t3)
+        # 往復遅延が負の計測は捨てられるため、clock_rtt が未設定のこともある
+        if info['clock_rtt'] is not None:
+            logger.debug("時刻オフセット: %.1fms (往復遅延: %.1fms)", clock_offset * 1000, info['clock_rtt'] * 1000)
+    return True
+
+# すべてのカメラのUDPハートビートを1回ずつ送信し、応答を待つ
+# 戻り値: 'ok'（応答あり）, 'register'（HTTP登録が必要）, None（応答なし）
+def send_udp_heartbeat(sock, server_address, seq, info_crcs):
+    cpu_temp = read_cpu_temp()
+    for cam in camera_states.values():
+        info = cam['info']
+        datagram = struct.pack(
+            HEARTBEAT_FORMAT, HEARTBEAT_MAGIC, HEARTBEAT_VERSION, info['id'].encode()[:8],
+            STATUS_CODES.get(info['status'], 0), seq & 0xFFFFFFFF, info_crcs[info['id']],
+            time.time(), measure_fps(cam), cpu_temp,
+            clock_offset, info['clock_rtt'] if info['clock_rtt'] is not None else float('nan')
+        )
+        sock.sendto(datagram, server_address)
+    
+    # 応答にはノードIDが含まれないため、いずれかのカメラに再登録が要求されたらすべて再登録する
+    result = None
+    acks = 0
+    deadline = time.time() + UDP_HEARTBEAT_INTERVAL
+    while acks < len(camera_states):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        sock.settimeout(remaining)
+        try:
+            data, _ = sock.recvfrom(64)
+        except socket.timeout:
+            break
+        t3 = time.time()
+        if len(data) != HEARTBEAT_ACK_SIZE:
+            continue
+        magic, version, flags, t0, t1, t2 = struct.unpack(HEARTBEAT_ACK_FORMAT, data)
+        if magic != HEARTBEAT_ACK_MAGIC or version != HEARTBEAT_VERSION:
+            continue
+        update_clock_offset(t0, t1, t2, t3)
+        acks += 1
+        if flags & ACK_FLAG_REGISTER:
+            result = 'register'
+        elif result is None:
+            result = 'ok'
+    return result
+
+# 中央サーバーへの登録スレッド（すべてのカメラをまとめて登録・ハートビートする）
+# UDPハートビートが有効な場合、HTTP登録はノード情報の変化時とサーバーからの要求時のみ行う
 def registration_thread():
+    global central_server, registration_requested
     retry_count = 0
     retry_delay = 5  # 開始リトライ間隔（秒）
     max_retry_delay = 60  # 最大リトライ間隔（秒）
-    heartbeat_interval = 30  # 通常のハートビート間隔（秒）
+    heartbeat_interval = 30  # HTTPのみの場合のハートビート間隔（秒）
+    
+    udp_sock = None
+    if UDP_HEARTBEAT_PORT:
+        udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    
+    registered_crcs = {}  # ノードID -> 最後にHTTP登録したノード情報のチェックサム
+    registered_server = None  # 最後にHTTP登録した中央サーバー
+    last_registration = 0
+    seq = 0
+    missed_acks = 0
     
     while True:
         try:
+            # 中央サーバーのアドレスが未定の場合はLAN内で検出
+            if central_server is None:
+                central_server = discover_server()
+                if central_server is None:
+                    raise ConnectionError('中央サーバーが見つかりません')
+                logger.info(f"中央サーバーを検出しました: {central_server}")
+            
             # ノード情報を更新
-            node_info['ip'] = get_local_ip()
-            node_info['last_heartbeat'] = time.time()
+            ip = get_local_ip()
+            infos = [cam['info'] for cam in camera_states.values()]
+            for info in infos:
+                info['ip'] = ip
+                info['last_heartbeat'] = time.time()
+            info_crcs = {info['id']: node_info_crc(info) for info in infos}
             
-            # 中央サーバーに登録
-            logger.info(f"中央サーバーに登録を試みます: {CENTRAL_SERVER}/api/register")
-            try:
-                response = requests.post(f"{CENTRAL_SERVER}/api/register", json=node_info, timeout=10)
-                logger.info(f"登録リクエスト送信完了。ステータスコード: {response.status_code}")
-                if response.status_code == 200:
-                    logger.info(f"中央サーバーへの登録に成功しました: {response.json()}")
-                    # 成功したらリトライカウントとディレイをリセット
-                    retry_count = 0
-                    retry_delay = 5
-                    # 次のハートビートまで通常間隔で待機
-                    time.sleep(heartbeat_interval)
-                    continue
-                else:
-                    logger.warning(f"中央サーバーへの登録に失敗しました: {response.status_code}, レスポンス: {response.text}")
+            register_all = (
+                udp_sock is None
+                or registration_requested
+                or central_server != registered_server
+                or time.time() - last_registration > REGISTRATION_REFRESH_INTERVAL
+                or missed_acks >= UDP_MAX_MISSED_ACKS
+            )
+            # 情報が変わったカメラだけを登録し直す
+            pending = [info for info in infos if register_all or info_crcs[info['id']] != registered_crcs.get(info['id'])]
+            
+            if pending:
+                # 中央サーバーに登録
+                logger.debug(f"中央サーバーに登録を試みます: {central_server}/api/register ({len(pending)}台)")
+                registration_requested = False
+                try:
+                    registered = [info for info in pending if register_node(info, info_crcs[info['id']])]
+                    for info in registered:
+                        registered_crcs[info['id']] = info_crcs[info['id']]
+                    if len(registered) == len(pending):
+                        if not registered_server or central_server != registered_server:
+                            logger.info(f"中央サーバーへの登録に成功しました: {central_server}")
+                        registered_server = central_server
+                        last_registration = time.time()
+                        missed_acks = 0
+                        # 成功したらリトライカウントとディレイをリセット
+                        retry_count = 0
+                        retry_delay = 5
+                        if udp_sock is None:
+                            # 次のハートビートまで通常間隔で待機
+                            wait_for_wakeup(heartbeat_interval)
+                        continue
+                    retry_count += 1
+                except requests.exceptions.RequestException as req_err:
+                    logger.error(f"中央サーバーへのリクエスト中にエラーが発生: {req_err}")
                     retry_count += 1
-            except requests.exceptions.RequestException as req_err:
-                logger.error(f"中央サーバーへのリクエスト中にエラーが発生: {req_err}")
-                retry_count += 1
+            else:
+                # 軽量なUDPハートビート（応答待ちが送信間隔を兼ねる）
+                seq += 1
+                started = time.time()
+                server_address = (urlparse(central_server).hostname, heartbeat_port)
+                result = send_udp_heartbeat(udp_sock, server_address, seq, info_crcs)
+                if result is None:
+                    missed_acks += 1
+                    logger.debug(f"UDPハートビートの応答がありません（{missed_acks}回目）")
+                else:
+                    missed_acks = 0
+                    if result == 'register':
+                        logger.info("中央サーバーから再登録を要求されました")
+                        registration_requested = True
+                # 応答が早く返った場合は残りの間隔を待つ
+                wait_for_wakeup(max(0, UDP_HEARTBEAT_INTERVAL - (time.time() - started)))
+                continue
         
         except Exception as e:
             logger.error(f"中央サーバーへの登録エラー: {e}")
             retry_count += 1
         
-        # エラー発生時はバックオフ戦略でリトライ
+        # 自動検出したサーバーに繋がらない場合は、アドレスが変わった可能性があるので検出し直す
+        if not CENTRAL_SERVER and retry_count >= 2:
+            central_server = None
+        
+        # エラー発生時はバックオフ戦略でリトライ（ネットワーク変化時はすぐに再試行）
         if retry_count > 0:
             # 指数バックオフ（最大まで）
             current_delay = min(retry_delay * (2 ** (retry_count - 1)), max_retry_delay)
             logger.info(f"サーバーへの接続リトライを {current_delay}秒後に行います。(リトライ回数: {retry_count})")
-            time.sleep(current_delay)
+            if wait_for_wakeup(current_delay):
+                retry_count = 0
         else:
             # 通常のハートビート間隔
-            time.sleep(heartbeat_interval)
+            wait_for_wakeup(heartbeat_interval)
 
 # --- API エンドポイント ---
+# 各エンドポイントは /cam/<番号>/... でカメラを指定できる（番号なしは先頭のカメラ）
+
+# URLのカメラ番号を取り出して g.camera_num に設定する
+@app.url_value_preprocessor
+def select_camera(endpoint, values):
+    g.camera_num = values.pop('num', CAMERA_NUMS[0]) if values else CAMERA_NUMS[0]
+
+@app.before_request
+def check_camera():
+    if g.camera_num not in camera_states:
+        return jsonify({'error': f'Unknown camera: {g.camera_num}'}), 404
+
+# このノードで管理しているカメラの一覧
+@app.route('/api/cameras', methods=['GET'])
+def list_cameras():
+    return jsonify([cam['info'] for cam in camera_states.values()])
 
 # ノード情報
 @app.route('/api/info', methods=['GET'])
+@app.route('/cam/<int:num>/api/info', methods=['GET'])
 def get_node_info():
-    return jsonify(node_info)
+    return jsonify(camera_states[g.camera_num]['info'])
 
 # ヘルスチェック
 @app.route('/api/health', methods=['GET'])
+@app.route('/cam/<int:num>/api/health', methods=['GET'])
 def health_check():
-    if camera_running:
+    if camera_states[g.camera_num]['running']:
         return jsonify({'status': 'ok', 'camera': 'running'})
     else:
         return jsonify({'status': 'error', 'camera': 'not running'}), 500
 
-# ビデオストリーム
+# メトリクス（Prometheusのテキスト形式、?format=json でJSON）
+@app.route('/api/metrics', methods=['GET'])
+@app.route('/cam/<int:num>/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    metrics = collect_metrics(camera_states[g.camera_num])
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(metrics)
+    return Response(format_prometheus(metrics), mimetype='text/plain; version=0.0.4')
+
+# ビデオストリーム（?roi=x,y,w,h で切り出した範囲のみ配信）
 @app.route('/stream')
+@app.route('/cam/<int:num>/stream')
 def video_stream():
-    return Response(generate_frames(),
+    try:
+        roi = parse_roi(request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    profile_name = request.args.get('profile')
+    if profile_name is not None and profile_name not in STREAM_PROFILES:
+        return jsonify({'error': f'Unknown profile: {profile_name}'}), 400
+    return Response(generate_frames(camera_states[g.camera_num], roi, STREAM_PROFILES.get(profile_name)),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+# カメラの現在の実行時設定
+def current_config(cam):
+    return {
+        'target_fps': cam['target_fps'],
+        'stream_quality': cam['stream_quality'],
+        'resolution': list(cam['resolution']),
+        'controls': cam['camera_settings'],
+        'scaler_crop': cam['scaler_crop']
+    }
+
+# 実行時設定の取得・変更（カメラを再起動せずに適用する）
+#   {"target_fps": 15, "stream_quality": 80, "resolution": [1920, 1080],
+#    "controls": {"ExposureTime": 10000, "AfMode": "manual", "LensPosition": 2.0},
+#    "scaler_crop": [0.25, 0.25, 0.5, 0.5]}  # scaler_crop を null にすると全体に戻す
+@app.route('/api/config', methods=['GET', 'POST'])
+@app.route('/cam/<int:num>/api/config', methods=['GET', 'POST'])
+def config_endpoint():
+    cam = camera_states[g.camera_num]
+    if request.method == 'GET':
+        return jsonify(current_config(cam))
+    
+    data = request.json or {}
+    # 適用前にすべての値を検証し、一部だけ反映されることを避ける
+    try:
+        fps = float(data['target_fps']) if 'target_fps' in data else None
+        if fps is not None and not 0 < fps <= MAX_FPS:
+            raise ValueError(f'target_fps must be between 0 and {MAX_FPS}')
+        
+        quality = int(data['stream_quality']) if 'stream_quality' in data else None
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError('stream_quality must be between 1 and 100')
+        
+        size = None
+        if 'resolution' in data:
+            size = (int(data['resolution'][0]), int(data['resolution'][1]))
+            if not (0 < size[0] <= STILL_RESOLUTION[0] and 0 < size[1] <= STILL_RESOLUTION[1]):
+                raise ValueError(f'resolution must be within {STILL_RESOLUTION[0]}x{STILL_RESOLUTION[1]}')
+        
+        requested_controls = validate_camera_controls(data.get('controls') or {})
+        crop = parse_roi(data['scaler_crop']) if 'scaler_crop' in data else None
+    except (TypeError, ValueError, IndexError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if quality is not None:
+            cam['stream_quality'] = quality
+        if size is not None and size != tuple(cam['resolution']):
+            reconfigure_resolution(cam, size)
+        if fps is not None:
+            set_target_fps(cam, fps)
+        if requested_controls:
+            apply_camera_controls(cam, requested_controls)
+        if 'scaler_crop' in data:
+            set_scaler_crop(cam, crop)
+    except Exception as e:
+        logger.error(f"設定の変更エラー: {e}")
+        return jsonify({'error': str(e), 'config': current_config(cam)}), 500
+    
+    return jsonify(current_config(cam))
+
+# カメラを再起動（解像度・制御などの実行時設定は維持する）
+@app.route('/api/restart', methods=['POST'])
+@app.route('/cam/<int:num>/api/restart', methods=['POST'])
+def restart_camera():
+    cam = camera_states[g.camera_num]
+    if cam['camera'] is None:
+        return jsonify({'error': 'Camera not initialized'}), 400
+    try:
+        logger.info(f"カメラ{cam['num']}を再起動します")
+        reconfigure_resolution(cam, cam['resolution'])
+    except Exception as e:
+        logger.error(f"カメラの再起動エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'restarted', 'config': current_config(cam)})
+
+# 現在のストリームフレームをJPEGで取得（ライブ計測など軽量な用途向け）
+@app.route('/api/frame', methods=['GET'])
+@app.route('/cam/<int:num>/api/frame', methods=['GET'])
+def current_frame():
+    cam = camera_states[g.camera_num]
+    if cam['frame'] is None:
+        return jsonify({'error': 'No frame available'}), 400
+    try:
+        roi = parse_roi(request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # キャプチャスレッドは毎回新しい配列を代入するため、参照の取得だけロックすればよい
+    with cam['lock']:
+        img = cam['frame']
+    ret, buffer = cv2.imencode('.jpg', crop_roi(img, roi), [cv2.IMWRITE_JPEG_QUALITY, cam['stream_quality']])
+    
+    if not ret:
+        return jsonify({'error': 'Failed to encode image'}), 500
+    
+    response = Response(buffer.tobytes(), mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # スナップショット取得
 @app.route('/api/snapshot', methods=['GET'])
+@app.route('/cam/<int:num>/api/snapshot', methods=['GET'])
 def snapshot():
-    global frame, camera_running
-    if frame is None:
+    cam = camera_states[g.camera_num]
+    if cam['frame'] is None:
         return jsonify({'error': 'No frame available'}), 400
     
+    # raw=1 の場合は歪み補正を行わない（校正用の撮影など）
+    raw = request.args.get('raw') == '1'
     try:
-        # 一時的に高解像度で撮影
-        if camera_running:
-            try:
-                # 現在のカメラを使用して高解像度で撮影
-                camera = Picamera2()
-                high_res_config = camera.create_still_configuration(main={"size": (2592, 1944)})
-                camera.configure(high_res_config)
-                camera.start()
-                time.sleep(0.5)  # カメラの安定化を待つ
-                high_res_img = camera.capture_array()
-                camera.stop()
-                
-                # 必要に応じてBGRに変換
-                channels = 1 if len(high_res_img.shape) == 2 else high_res_img.shape[2]
-                if channels == 1:
-                    high_res_img = cv2.cvtColor(high_res_img, cv2.COLOR_GRAY2BGR)
-                elif channels == 4:
-                    high_res_img = cv2.cvtColor(high_res_img, cv2.COLOR_BGRA2BGR)
-                
-                # 高解像度画像をJPEGとしてエンコード
-                ret, buffer = cv2.imencode('.jpg', high_res_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                
-                if not ret:
-                    # 高解像度撮影に失敗した場合、通常のフレームを使用
-                    logger.warning("高解像度撮影に失敗しました。通常解像度で対応します。")
-                    with lock:
-                        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                
-            except Exception as e:
-                logger.error(f"高解像度撮影エラー: {e}")
-                # エラーが発生した場合、通常のフレームを使用
-                with lock:
-                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        else:
-            # カメラが実行中でない場合、通常のフレームを使用
-            with lock:
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        
-        if not ret:
-            return jsonify({'error': 'Failed to encode image'}), 500
-        
-        # Base64でエンコード
-        import base64
-        img_str = base64.b64encode(buffer).decode('utf-8')
-        
-        return jsonify({
-            'success': True,
-            'timestamp': time.time(),
-            'image': img_str
-        })
+        roi = parse_roi(request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # 同時に届いた同じ条件の要求は、撮影とエンコードを1回で済ませる
+        result = single_flight(cam, ('snapshot', raw, roi), lambda: create_snapshot(cam, raw, roi))
+        return jsonify(dict(result, success=True))
     
     except Exception as e:
         logger.error(f"スナップショットエラー: {e}")
         return jsonify({'error': str(e)}), 500
 
+# 同期撮影：目標時刻に最も近いフレームをリングバッファから取り出す
+@app.route('/api/capture', methods=['POST'])
+@app.route('/cam/<int:num>/api/capture', methods=['POST'])
+def synchronized_capture():
+    cam = camera_states[g.camera_num]
+    data = request.json or {}
+    try:
+        target_time = float(data.get('target_time', time.time()))
+        quality = int(data.get('quality', 95))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 目標時刻以降のフレームが届くまで待つ（目標時刻が過去ならすぐに返る）
+    wait_until = min(target_time, time.time() + MAX_CAPTURE_WAIT)
+    with cam['frame_condition']:
+        while cam['frame_timestamp'] is None or cam['frame_timestamp'] < target_time:
+            remaining = wait_until + 0.1 - time.time()
+            if remaining <= 0:
+                break
+            cam['frame_condition'].wait(remaining)
+        candidates = list(cam['frame_buffer'])
+    
+    if not candidates:
+        return jsonify({'error': 'No frame available'}), 400
+    
+    timestamp, img = min(candidates, key=lambda item: abs(item[0] - target_time))
+    # カメラが止まっているなどで目標時刻に近いフレームがない場合は、古いフレームを成功として返さない
+    if abs(timestamp - target_time) > MAX_CAPTURE_SKEW:
+        return jsonify({'error': 'No frame near target time', 'stale': True, 'skew': timestamp - target_time}), 409
+    
+    ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return jsonify({'error': 'Failed to encode image'}), 500
+    
+    return jsonify({
+        'success': True,
+        'timestamp': timestamp,
+        'target_time': target_time,
+        'skew': timestamp - target_time,
+        'image': base64.b64encode(buffer).decode('utf-8'),
+        'undistorted': cam['calibration'] is not None
+    })
+
+# カメラ内部パラメータの取得/設定（中央サーバーの校正結果を受け取る）
+@app.route('/api/calibration', methods=['GET', 'POST'])
+@app.route('/cam/<int:num>/api/calibration', methods=['GET', 'POST'])
+def calibration_endpoint():
+    cam = camera_states[g.camera_num]
+    if request.method == 'GET':
+        return jsonify({'calibration': cam['calibration']})
+    
+    data = request.json or {}
+    new_calibration = data.get('calibration')
+    if new_calibration is not None:
+        required = ('id', 'camera_matrix', 'dist_coeffs', 'image_size')
+        if not all(key in new_calibration for key in required):
+            return jsonify({'error': f'calibration requires {list(required)}'}), 400
+    
+    try:
+        set_calibration(cam, new_calibration)
+    except Exception as e:
+        logger.error(f"カメラ内部パラメータの保存エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    logger.info("カメラ内部パラメータを更新しました" if new_calibration else "カメラ内部パラメータを解除しました")
+    return jsonify({'success': True, 'calibration_id': cam['info']['calibration_id']})
+
 if __name__ == '__main__':
     # IPアドレスの取得と設定
-    node_info['ip'] = get_local_ip()
+    ip = get_local_ip()
     
-    # カメラの初期化
-    camera = initialize_camera()
+    for cam in camera_states.values():
+        cam['info']['ip'] = ip
+        # 保存済みの校正データを読み込み、カメラを初期化する
+        load_calibration(cam)
+        
+        if initialize_camera(cam) is not None:
+            # フレームキャプチャスレッドの開始
+            capture_thread = threading.Thread(target=capture_frames, args=(cam,))
+            capture_thread.daemon = True
+            capture_thread.start()
     
-    if camera is not None:
-        # フレームキャプチャスレッドの開始
-        capture_thread = threading.Thread(target=capture_frames, args=(camera,))
-        capture_thread.daemon = True
-        capture_thread.start()
+    # 一部のカメラが使えなくても、残りのカメラで動作を続ける（使えないカメラは状態 error で登録される）
+    if any(cam['running'] for cam in camera_states.values()):
+        # ネットワーク監視・サーバー起動通知の受信スレッドの開始
+        for target in (netlink_monitor_thread, announce_listener_thread):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
         
         # 登録スレッドの開始
         reg_thread = threading.Thread(target=registration_thread)
@@ -289,7 +1271,7 @@ if __name__ == '__main__':
         reg_thread.start()
         
         # サーバーの開始
-        logger.info(f"カメラノードサーバーを開始します: http://{node_info['ip']}:{API_PORT}")
+        logger.info(f"カメラノードサーバーを開始します: http://{ip}:{API_PORT} (カメラ: {CAMERA_NUMS})")
         app.run(host='0.0.0.0', port=API_PORT, threaded=True)
     else:
-        logger.error("カメラの初期化に失敗したため、アプリケーションを終了します")
\ No newline at end of file
+        logger.error("カメラの初期化に失敗したため、アプリケーションを終了します")
@@ -0,0 +1,376 @@
+import cv2
+import numpy as np
+import logging
+import time
+from abc import ABC, abstractmethod
+
+# Picamera2はRaspberry Pi以外では使えないため、他のバックエンドだけでも動くようにする
+try:
+    from picamera2 import Picamera2
+    from libcamera import controls
+except ImportError:
+    Picamera2 = None
+    controls = None
+
+logger = logging.getLogger(__name__)
+
+# カメラソースの共通処理
+# start() で解像度・フレームレート・制御を指定して開始し、capture() で (BGR画像, 露光時刻のUNIX時間) を返す。
+# 制御の値はノードの /api/config と同じ形式（AfMode は 'manual' / 'auto' / 'continuous'）で受け取り、
+# 各バックエンドが対応するものだけを適用する。capture() の呼び出し間隔（フレームレート）は呼び出し側が調整する
+class CameraSource(ABC):
+    backend = None
+
+    def __init__(self, num=0, arg=None):
+        self.num = num
+        self.arg = arg
+        self.size = None
+        self.fps = None
+        self.settings = {}
+        self.crop = None  # 切り出し範囲（正規化座標 (x, y, w, h)、Noneは全体）
+
+    # 解像度・フレームレート・制御を指定して開始
+    def start(self, size, fps=None, settings=None):
+        self.size = tuple(size)
+        self.fps = fps
+        self.settings.update(settings or {})
+        self.open()
+        self.restore_controls()
+        logger.info(f"カメラソースを開始しました: {self.backend} #{self.num} {self.size[0]}x{self.size[1]}")
+
+    # 解像度を変更（停止・再構成・再開し、フレームレートと制御を再適用する）
+    def reconfigure(self, size):
+        self.close()
+        self.start(size, self.fps)
+
+    # 目標フレームレートを変更
+    def set_fps(self, fps):
+        self.fps = fps
+
+    # カメラ制御を変更（対応していない項目は無視する）
+    def set_controls(self, settings):
+        self.settings.update(settings)
+        self.apply_controls(settings)
+
+    # 切り出し範囲を変更（センサー側で切り出せないバックエンドは画像を切り出して元の解像度に拡大する）
+    def set_crop(self, roi):
+        self.crop = roi
+
+    @abstractmethod
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def apply_controls(self, settings):
+        pass
+
+    # 開始・再構成後に、保存している制御を適用し直す
+    def restore_controls(self):
+        if self.settings:
+            self.apply_controls(self.settings)
+
+    @abstractmethod
+    def capture(self):
+        pass
+
+    # 高解像度の静止画を撮影（標準ではストリームのフレームを指定解像度に拡大する）
+    def capture_still(self, size):
+        img, timestamp = self.capture()
+        return cv2.resize(img, tuple(size), interpolation=cv2.INTER_LINEAR), timestamp
+
+    # ソフトウェアで切り出し範囲を適用（出力の解像度は変えない）
+    def apply_crop(self, img):
+        if self.crop is None:
+            return img
+        height, width = img.shape[:2]
+        x, y, w, h = self.crop
+        x0, y0 = int(x * width), int(y * height)
+        x1 = min(width, max(x0 + 1, int(round((x + w) * width))))
+        y1 = min(height, max(y0 + 1, int(round((y + h) * height))))
+        return cv2.resize(img[y0:y1, x0:x1], (width, height), interpolation=cv2.INTER_LINEAR)
+
+# 画像をBGRの3チャンネルに変換
+def to_bgr(img):
+    channels = 1 if len(img.shape) == 2 else img.shape[2]
+    if channels == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if channels == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+# フレームレートに対応するフレーム時間の制約（マイクロ秒）
+def frame_duration_limits(fps):
+    duration = int(1e6 / fps)
+    return (duration, duration)
+
+# センサーのタイムスタンプ（CLOCK_BOOTTIME, ns）をUNIX時間に変換
+def sensor_time_to_wall(sensor_timestamp):
+    if sensor_timestamp is None:
+        return time.time()
+    elapsed = time.clock_gettime(time.CLOCK_BOOTTIME) - sensor_timestamp / 1e9
+    return time.time() - elapsed
+
+# --- Picamera2（Raspberry Pi のカメラモジュール） ---
+
+class Picamera2Source(CameraSource):
+    backend = 'picamera2'
+
+    def __init__(self, num=0, arg=None):
+        super().__init__(num, arg)
+        if Picamera2 is None:
+            raise RuntimeError('picamera2 is not installed')
+        self.camera = None
+        self.crop_rect = None  # センサー側の切り出し範囲（ScalerCrop）
+
+    def open(self):
+        if self.camera is None:
+            self.camera = Picamera2(camera_num=self.num)
+        self.camera.configure(self.camera.create_preview_configuration(main={
+            "format": 'XRGB8888',
+            "size": self.size
+        }))
+        self.camera.start()
+
+    # 再構成ではカメラを開き直さずに停止・再開する
+    def close(self):
+        if self.camera is not None:
+            self.camera.stop()
+
+    def apply_controls(self, settings):
+        self.camera.set_controls(self.to_libcamera_controls(settings))
+
+    # フレームレートとセンサー側の切り出しも合わせて適用し直す
+    def restore_controls(self):
+        converted = self.to_libcamera_controls(self.settings)
+        if self.fps:
+            converted['FrameDurationLimits'] = frame_duration_limits(self.fps)
+        if self.crop_rect is not None:
+            converted['ScalerCrop'] = self.crop_rect
+        if converted:
+            self.camera.set_controls(converted)
+
+    # 保存しているカメラ制御をlibcameraの値に変換
+    def to_libcamera_controls(self, settings):
+        af_modes = {
+            'manual': controls.AfModeEnum.Manual,
+            'auto': controls.AfModeEnum.Auto,
+            'continuous': controls.AfModeEnum.Continuous
+        }
+        converted = dict(settings)
+        if 'AfMode' in converted:
+            converted['AfMode'] = af_modes[converted['AfMode']]
+        return converted
+
+    def set_fps(self, fps):
+        self.camera.set_controls({'FrameDurationLimits': frame_duration_limits(fps)})
+        self.fps = fps
+
+    # センサー側で切り出す（全体の画素を読み出さないためデジタルズームとして画質も保たれる）
+    def set_crop(self, roi):
+        max_x, max_y, max_w, max_h = self.camera.camera_properties['ScalerCropMaximum']
+        if roi is None:
+            rect = (max_x, max_y, max_w, max_h)
+        else:
+            x, y, w, h = roi
+            rect = (max_x + int(x * max_w), max_y + int(y * max_h), int(w * max_w), int(h * max_h))
+        self.camera.set_controls({'ScalerCrop': rect})
+        self.crop_rect = rect
+        self.crop = roi
+
+    # フレームを取得（メタデータから露光時刻も取得する）
+    def capture(self):
+        capture_request = self.camera.capture_request()
+        try:
+            img = capture_request.make_array('main')
+            metadata = capture_request.get_metadata()
+        finally:
+            capture_request.release()
+        return to_bgr(img), sensor_time_to_wall(metadata.get('SensorTimestamp'))
+
+    # 動作中のカメラを一時的に静止画モードに切り替えて撮影し、撮影後にストリーム用の設定へ戻す
+    # （モードの切り替えで制御・フレームレート・切り出し範囲が失われるため、撮影後に適用し直す）
+    def capture_still(self, size):
+        try:
+            img = self.camera.switch_mode_and_capture_array(
+                self.camera.create_still_configuration(main={"size": tuple(size)})
+            )
+        finally:
+            self.restore_controls()
+        return to_bgr(img), time.time()
+
+# --- V4L2（USBカメラなど、OpenCVのVideoCapture経由） ---
+
+# カメラ制御とV4L2のプロパティの対応（V4L2の露光時間は100マイクロ秒単位）
+V4L2_CONTROLS = {
+    'AeEnable': (cv2.CAP_PROP_AUTO_EXPOSURE, lambda value: 3 if value else 1),
+    'ExposureTime': (cv2.CAP_PROP_EXPOSURE, lambda value: value / 100),
+    'AwbEnable': (cv2.CAP_PROP_AUTO_WB, int),
+    'AfMode': (cv2.CAP_PROP_AUTOFOCUS, lambda value: int(value == 'continuous')),
+}
+
+class V4L2Source(CameraSource):
+    backend = 'v4l2'
+
+    # arg はデバイスのパス（省略時は /dev/video<番号>）
+    def __init__(self, num=0, arg=None):
+        super().__init__(num, arg)
+        self.device = arg or f'/dev/video{num}'
+        self.capture_device = None
+
+    def open(self):
+        self.capture_device = cv2.VideoCapture(self.device, cv2.CAP_V4L2)
+        if not self.capture_device.isOpened():
+            raise RuntimeError(f'Failed to open {self.device}')
+        # USBカメラは非圧縮だと帯域が足りず高解像度でフレームレートが出ないため、MJPEGで受け取る
+        self.capture_device.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.configure(self.size)
+        # 古いフレームが溜まらないようにする
+        self.capture_device.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def configure(self, size):
+        self.capture_device.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        self.capture_device.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        if self.fps:
+            self.capture_device.set(cv2.CAP_PROP_FPS, self.fps)
+
+    def close(self):
+        if self.capture_device is not None:
+            self.capture_device.release()
+            self.capture_device = None
+
+    def apply_controls(self, settings):
+        for name, value in settings.items():
+            if name in V4L2_CONTROLS:
+                prop, convert = V4L2_CONTROLS[name]
+                self.capture_device.set(prop, convert(value))
+            else:
+                logger.debug(f"V4L2では対応していないカメラ制御です: {name}")
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.capture_device.set(cv2.CAP_PROP_FPS, fps)
+
+    def read(self):
+        ret, img = self.capture_device.read()
+        if not ret:
+            raise RuntimeError(f'Failed to read frame from {self.device}')
+        return to_bgr(img)
+
+    def capture(self):
+        img = self.read()
+        return self.apply_crop(img), time.time()
+
+    # 一時的に静止画の解像度に切り替えて撮影する（切り替え前のフレームは捨てる）
+    def capture_still(self, size):
+        self.configure(size)
+        try:
+            self.read()
+            img = self.read()
+            timestamp = time.time()
+        finally:
+            self.configure(self.size)
+        return img, timestamp
+
+# --- 合成テスト画像（Pi以外での動作確認・負荷試験用） ---
+
+# カラーバー（JPEGのサイズが実写に近くなるよう固定のノイズを加える）
+def render_test_pattern(size):
+    width, height = size
+    colors = [(255, 255, 255), (0, 255, 255), (255, 255, 0), (0, 255, 0),
+              (255, 0, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0)]
+    bar_index = np.arange(width) * len(colors) // width
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = np.array(colors, dtype=np.uint8)[bar_index]
+    img[height * 3 // 4:] = np.linspace(0, 255, width, dtype=np.uint8)[:, None]
+    noise = np.random.default_rng(0).integers(-16, 17, img.shape, dtype=np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+class SyntheticSource(CameraSource):
+    backend = 'synthetic'
+
+    def open(self):
+        self.background = render_test_pattern(self.size)
+        self.seq = 0
+
+    # 背景の上に、動く四角形・フレーム番号・時刻を描画する
+    def render(self, background, timestamp):
+        img = background.copy()
+        height, width = img.shape[:2]
+        box = max(16, height // 6)
+        x = int((self.seq * 8) % max(1, width - box))
+        y = int((height - box) / 2 * (1 + np.sin(self.seq / 15)))
+        cv2.rectangle(img, (x, y), (x + box, y + box), (32, 32, 32), -1)
+        text = f'#{self.num} {self.seq:06d} {time.strftime("%H:%M:%S", time.localtime(timestamp))}.{int(timestamp * 1000) % 1000:03d}'
+        cv2.putText(img, text, (16, max(32, height // 12)), cv2.FONT_HERSHEY_SIMPLEX, max(0.5, height / 720), (0, 0, 0), 2)
+        return img
+
+    def capture(self):
+        timestamp = time.time()
+        img = self.render(self.background, timestamp)
+        self.seq += 1
+        return self.apply_crop(img), timestamp
+
+    def capture_still(self, size):
+        timestamp = time.time()
+        return self.render(render_test_pattern(tuple(size)), timestamp), timestamp
+
+# --- 録画ファイルの再生 ---
+
+class ReplaySource(CameraSource):
+    backend = 'replay'
+
+    # arg は動画ファイル、または連番画像のパターン（例: frames/%05d.jpg）。{num} はカメラ番号に置き換える
+    def __init__(self, num=0, arg=None):
+        super().__init__(num, arg)
+        if not arg:
+            raise ValueError('replay source requires a file path (replay:<path>)')
+        self.path = arg.format(num=num)
+        self.capture_device = None
+        self.last_frame = None
+
+    def open(self):
+        self.capture_device = cv2.VideoCapture(self.path)
+        if not self.capture_device.isOpened():
+            raise RuntimeError(f'Failed to open {self.path}')
+
+    def close(self):
+        if self.capture_device is not None:
+            self.capture_device.release()
+            self.capture_device = None
+
+    # 末尾まで再生したら先頭に戻る
+    def capture(self):
+        ret, img = self.capture_device.read()
+        if not ret:
+            self.capture_device.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, img = self.capture_device.read()
+            if not ret:
+                raise RuntimeError(f'Failed to read frame from {self.path}')
+        img = to_bgr(img)
+        if (img.shape[1], img.shape[0]) != self.size:
+            img = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        self.last_frame = img
+        return self.apply_crop(img), time.time()
+
+    def capture_still(self, size):
+        img = self.last_frame
+        if img is None:
+            img, _ = self.capture()
+        return cv2.resize(img, tuple(size), interpolation=cv2.INTER_LINEAR), time.time()
+
+SOURCE_BACKENDS = {
+    'picamera2': Picamera2Source,
+    'v4l2': V4L2Source,
+    'synthetic': SyntheticSource,
+    'replay': ReplaySource,
+}
+
+# 指定（"バックエンド" または "バックエンド:引数"）からカメラソースを作成する
+#   picamera2, v4l2, v4l2:/dev/video2, synthetic, replay:recordings/line1.mp4
+def open_source(spec, num=0):
+    backend, _, arg = spec.partition(':')
+    if backend not in SOURCE_BACKENDS:
+        raise ValueError(f'Unknown camera source: {backend} (available: {", ".join(SOURCE_BACKENDS)})')
+    return SOURCE_BACKENDS[backend](num, arg or None)
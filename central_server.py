@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, send_file
 import json
 import threading
 import time
@@ -8,2392 +8,377 @@ import requests
 from datetime import datetime
 import cv2
 import uuid
-from picamera2 import Picamera2
-from libcamera import controls
 import socket
 import base64
 import numpy as np
+import fnmatch
+import hashlib
+import gzip
+import math
+import re
+import sqlite3
+import struct
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from camera_source import open_source
 
-# ロギングの設定
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# Flaskアプリの初期化
-app = Flask(__name__)
-
-# グローバル変数
-cameras = {}  # カメラノード情報を格納する辞書
-camera_lock = threading.Lock()  # スレッドセーフな操作のためのロック
-HEARTBEAT_TIMEOUT = 300  # ハートビートタイムアウト（秒）- 5分に延長
-
-# サーバー設定
-SERVER_PORT = int(os.environ.get('SERVER_PORT', 5001))
-SERVER_IP = os.environ.get('SERVER_IP', '192.168.179.200')
-NODE_ID = str(uuid.uuid4())[:8]  # サーバー自身のユニークID
-NODE_NAME = os.environ.get('SERVER_NODE_NAME', 'server-camera')
-RESOLUTION = (1280, 720)  # カメラ解像度
-
-# ローカルカメラ変数
-frame = None
-frame_lock = threading.Lock()
-camera_running = False
-
-# --- ダッシュボードHTML ---
-# ダッシュボードのHTMLテンプレート
-DASHBOARD_HTML = """<!DOCTYPE html>
-<html>
-<head>
-    <title>カメラ監視システム | SCIEN, Inc</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <meta charset="utf-8">
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@300;400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        :root {
-            --primary-color: #0062cc;
-            --primary-light: #e6f0ff;
-            --primary-dark: #004c9e;
-            --secondary-color: #6c757d;
-            --success-color: #28a745;
-            --danger-color: #dc3545;
-            --warning-color: #ffc107;
-            --info-color: #17a2b8;
-            --light-color: #f8f9fa;
-            --dark-color: #343a40;
-            --border-radius: 8px;
-            --card-shadow: 0 4px 16px rgba(0, 0, 0, 0.08);
-            --transition-speed: 0.3s;
-        }
-        
-        body {
-            font-family: 'Noto Sans JP', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;
-            margin: 0;
-            padding: 0;
-            background-color: #f8f9fa;
-            color: #333;
-            display: flex;
-            min-height: 100vh;
-            line-height: 1.5;
-        }
-        
-        /* サイドバーナビゲーション */
-        .sidebar {
-            width: 240px;
-            background: linear-gradient(to bottom, #ffffff, #f8f9fa);
-            box-shadow: 0 0 20px rgba(0, 0, 0, 0.05);
-            z-index: 100;
-            padding: 0;
-            position: fixed;
-            top: 0;
-            left: 0;
-            bottom: 0;
-            display: flex;
-            flex-direction: column;
-            transition: transform var(--transition-speed) ease;
-            overflow: hidden;
-            border-right: 1px solid rgba(0,0,0,0.05);
-        }
-        
-        .sidebar-logo {
-            padding: 20px;
-            display: flex;
-            align-items: center;
-            justify-content: flex-start;
-            border-bottom: 1px solid rgba(0,0,0,0.05);
-            background-color: white;
-        }
-        
-        .logo-container {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .logo-img {
-            height: 36px;
-            width: auto;
-            margin-right: 10px;
-        }
-        
-        .sidebar-logo h1 {
-            font-size: 16px;
-            margin: 0;
-            font-weight: 600;
-            white-space: nowrap;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            color: var(--dark-color);
-        }
-        
-        .mobile-toggle {
-            display: none;
-            font-size: 24px;
-            background: none;
-            border: none;
-            color: var(--dark-color);
-            cursor: pointer;
-            margin-left: auto;
-        }
-        
-        .tabs {
-            display: flex;
-            flex-direction: column;
-            flex-grow: 1;
-            padding: 20px 0;
-        }
-        
-        .tab {
-            padding: 12px 20px;
-            cursor: pointer;
-            font-weight: 500;
-            color: var(--secondary-color);
-            position: relative;
-            display: flex;
-            align-items: center;
-            transition: all var(--transition-speed) ease;
-            border-left: 3px solid transparent;
-            margin: 4px 0;
-        }
-        
-        .tab:hover {
-            background-color: var(--primary-light);
-            color: var(--primary-color);
-        }
-        
-        .tab.active {
-            color: var(--primary-color);
-            background-color: var(--primary-light);
-            border-left-color: var(--primary-color);
-            font-weight: 600;
-        }
-        
-        .tab .tab-icon {
-            margin-right: 12px;
-            width: 20px;
-            text-align: center;
-            font-size: 18px;
-        }
-        
-        .sidebar-footer {
-            padding: 15px 20px;
-            border-top: 1px solid rgba(0,0,0,0.05);
-            font-size: 12px;
-            color: var(--secondary-color);
-            text-align: center;
-            background-color: white;
-        }
-        
-        .sidebar-footer img {
-            height: 24px;
-            margin-bottom: 10px;
-        }
-        
-        /* メインコンテンツエリア */
-        .main-content {
-            flex-grow: 1;
-            padding: 24px;
-            margin-left: 240px;
-            transition: margin-left var(--transition-speed) ease;
-            background-color: #f8f9fa;
-        }
-        
-        /* ヘッダー部分 */
-        .header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 24px;
-            padding: 20px;
-            background-color: white;
-            box-shadow: 0 2px 12px rgba(0,0,0,0.03);
-            border-radius: var(--border-radius);
-            border: 1px solid rgba(0,0,0,0.03);
-        }
-        
-        .header-title {
-            font-size: 1.5rem;
-            font-weight: 600;
-            margin: 0;
-            color: var(--dark-color);
-            position: relative;
-            padding-bottom: 5px;
-        }
-        
-        .header-title:after {
-            content: '';
-            position: absolute;
-            bottom: 0;
-            left: 0;
-            width: 40px;
-            height: 3px;
-            background-color: var(--primary-color);
-            border-radius: 3px;
-        }
-        
-        .controls {
-            display: flex;
-            gap: 12px;
-        }
-        
-        .button {
-            background-color: var(--primary-color);
-            color: white;
-            border: none;
-            padding: 10px 18px;
-            border-radius: var(--border-radius);
-            font-size: 14px;
-            font-weight: 500;
-            cursor: pointer;
-            transition: all var(--transition-speed) ease;
-            box-shadow: 0 2px 4px rgba(0, 98, 204, 0.2);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .button:hover {
-            background-color: var(--primary-dark);
-            transform: translateY(-1px);
-            box-shadow: 0 4px 8px rgba(0, 98, 204, 0.3);
-        }
-        
-        .button:active {
-            transform: translateY(1px);
-            box-shadow: 0 1px 2px rgba(0, 98, 204, 0.3);
-        }
-        
-        .button-icon {
-            margin-right: 8px;
-            font-size: 16px;
-        }
-        
-        /* タブコンテンツ */
-        .tab-content {
-            display: none;
-            animation: fadeIn 0.5s ease forwards;
-        }
-        
-        .tab-content.active {
-            display: block;
-        }
-        
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        /* カメラグリッド */
-        .camera-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(450px, 1fr));
-            gap: 24px;
-            margin-bottom: 30px;
-        }
-        
-        .camera-card {
-            background-color: white;
-            border-radius: var(--border-radius);
-            overflow: hidden;
-            box-shadow: var(--card-shadow);
-            transition: transform var(--transition-speed) ease, box-shadow var(--transition-speed) ease;
-            border: 1px solid rgba(0,0,0,0.03);
-        }
-        
-        .camera-card:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 8px 24px rgba(0, 0, 0, 0.12);
-        }
-        
-        .camera-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 15px 20px;
-            background-color: rgba(0,0,0,0.02);
-            border-bottom: 1px solid rgba(0,0,0,0.05);
-        }
-        
-        .camera-title {
-            font-weight: 600;
-            margin: 0;
-            display: flex;
-            align-items: center;
-            font-size: 1rem;
-            color: var(--dark-color);
-        }
-        
-        .status-indicator {
-            display: inline-block;
-            width: 10px;
-            height: 10px;
-            border-radius: 50%;
-            margin-right: 10px;
-            position: relative;
-        }
-        
-        .status-indicator::after {
-            content: '';
-            position: absolute;
-            top: -3px;
-            left: -3px;
-            right: -3px;
-            bottom: -3px;
-            border-radius: 50%;
-            background-color: transparent;
-            z-index: 1;
-        }
-        
-        .status-running {
-            background-color: var(--success-color);
-            box-shadow: 0 0 0 2px rgba(40, 167, 69, 0.2);
-        }
-        
-        .status-running::after {
-            animation: pulse 2s infinite;
-            border: 2px solid rgba(40, 167, 69, 0.4);
-        }
-        
-        @keyframes pulse {
-            0% { transform: scale(1); opacity: 1; }
-            70% { transform: scale(1.5); opacity: 0; }
-            100% { transform: scale(1.5); opacity: 0; }
-        }
-        
-        .status-error, .status-unreachable {
-            background-color: var(--danger-color);
-        }
-        
-        .status-initializing {
-            background-color: var(--warning-color);
-        }
-        
-        .camera-actions {
-            display: flex;
-            gap: 8px;
-        }
-        
-        .camera-actions button {
-            background-color: white;
-            border: 1px solid rgba(0,0,0,0.1);
-            border-radius: var(--border-radius);
-            padding: 6px 12px;
-            font-size: 13px;
-            font-weight: 500;
-            cursor: pointer;
-            transition: all var(--transition-speed) ease;
-            color: var(--secondary-color);
-        }
-        
-        .camera-actions button:hover {
-            background-color: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-        }
-        
-        .camera-stream {
-            width: 100%;
-            height: 300px;
-            background-color: #111;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .camera-stream img {
-            max-width: 100%;
-            max-height: 100%;
-            display: block;
-            transition: transform var(--transition-speed) ease;
-        }
-        
-        .camera-stream.zoomed {
-            cursor: move;
-        }
-        
-        .zoom-controls {
-            position: absolute;
-            bottom: 15px;
-            right: 15px;
-            display: flex;
-            gap: 8px;
-            z-index: 5;
-        }
-        
-        .zoom-controls button {
-            width: 36px;
-            height: 36px;
-            border-radius: 50%;
-            background-color: rgba(0, 0, 0, 0.6);
-            color: white;
-            border: none;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 18px;
-            cursor: pointer;
-            transition: all var(--transition-speed) ease;
-            backdrop-filter: blur(2px);
-        }
-        
-        .zoom-controls button:hover {
-            background-color: rgba(0, 98, 204, 0.8);
-            transform: translateY(-2px);
-        }
-        
-        .camera-info {
-            padding: 15px 20px;
-            font-size: 13px;
-            color: var(--secondary-color);
-            border-top: 1px solid rgba(0,0,0,0.05);
-            display: grid;
-            grid-template-columns: repeat(2, 1fr);
-            gap: 8px;
-            background: linear-gradient(to bottom, #ffffff, #fafafa);
-        }
-        
-        .camera-info p {
-            margin: 5px 0;
-            display: flex;
-            align-items: center;
-        }
-        
-        .camera-info p strong {
-            color: var(--dark-color);
-            margin-right: 6px;
-            display: inline-block;
-            width: 80px;
-            position: relative;
-        }
-        
-        .camera-info p strong::after {
-            content: ':';
-            position: absolute;
-            right: 6px;
-        }
-        
-        .loading {
-            color: white;
-            font-size: 14px;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            text-shadow: 0 1px 3px rgba(0,0,0,0.3);
-        }
-        
-        .loading::after {
-            content: '';
-            width: 40px;
-            height: 40px;
-            border: 3px solid rgba(255, 255, 255, 0.3);
-            border-radius: 50%;
-            border-top-color: white;
-            animation: spin 1s ease-in-out infinite;
-            margin-top: 15px;
-            box-shadow: 0 0 10px rgba(0,0,0,0.1);
-        }
-        
-        @keyframes spin {
-            to { transform: rotate(360deg); }
-        }
-        
-        .placeholder {
-            text-align: center;
-            padding: 40px;
-            background-color: white;
-            border-radius: var(--border-radius);
-            box-shadow: var(--card-shadow);
-            border: 1px solid rgba(0,0,0,0.05);
-        }
-        
-        .placeholder p {
-            color: var(--secondary-color);
-            margin: 10px 0;
-        }
-        
-        .placeholder-icon {
-            font-size: 48px;
-            color: var(--primary-light);
-            margin-bottom: 20px;
-        }
-        
-        /* モーダル用のスタイル */
-        .modal {
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background-color: rgba(0, 0, 0, 0.8);
-            z-index: 1000;
-            align-items: center;
-            justify-content: center;
-            opacity: 0;
-            transition: opacity var(--transition-speed) ease;
-            backdrop-filter: blur(3px);
-        }
-        
-        .modal.visible {
-            opacity: 1;
-        }
-        
-        .modal-content {
-            background-color: white;
-            border-radius: var(--border-radius);
-            max-width: 90%;
-            max-height: 90%;
-            overflow: auto;
-            position: relative;
-            padding: 25px;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            transform: scale(0.9);
-            opacity: 0;
-            transition: all var(--transition-speed) ease;
-        }
-        
-        .modal.visible .modal-content {
-            transform: scale(1);
-            opacity: 1;
-        }
-        
-        .modal-close {
-            position: absolute;
-            top: 15px;
-            right: 20px;
-            font-size: 28px;
-            font-weight: bold;
-            cursor: pointer;
-            color: var(--secondary-color);
-            transition: color var(--transition-speed) ease;
-            line-height: 1;
-            width: 30px;
-            height: 30px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            border-radius: 50%;
-        }
-        
-        .modal-close:hover {
-            color: var(--danger-color);
-            background-color: rgba(220, 53, 69, 0.1);
-        }
-        
-        .snapshot-img {
-            max-width: 100%;
-            height: auto;
-            display: block;
-            margin: 0 auto;
-            transition: transform var(--transition-speed) ease;
-            border-radius: 4px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        
-        .error-overlay {
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background-color: rgba(220, 53, 69, 0.8);
-            color: white;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            z-index: 10;
-            text-align: center;
-            padding: 20px;
-            backdrop-filter: blur(2px);
-        }
-        
-        .error-overlay button {
-            margin-top: 15px;
-            background-color: white;
-            color: var(--danger-color);
-            border: none;
-            padding: 8px 16px;
-            border-radius: var(--border-radius);
-            cursor: pointer;
-            font-weight: 500;
-            transition: all var(--transition-speed) ease;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-        }
-        
-        .error-overlay button:hover {
-            background-color: #f8f9fa;
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(0,0,0,0.3);
-        }
-        
-        /* 機能カード */
-        .camera-grid-function {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(500px, 1fr));
-            gap: 24px;
-            margin-top: 20px;
-        }
-        
-        .function-card {
-            background-color: white;
-            border-radius: var(--border-radius);
-            overflow: hidden;
-            box-shadow: var(--card-shadow);
-            padding: 0;
-            border: 1px solid rgba(0,0,0,0.03);
-            transition: transform var(--transition-speed) ease, box-shadow var(--transition-speed) ease;
-        }
-        
-        .function-card:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 8px 24px rgba(0, 0, 0, 0.12);
-        }
-        
-        .function-card h3 {
-            border-bottom: 1px solid rgba(0,0,0,0.05);
-            padding: 15px 20px;
-            margin: 0;
-            background-color: rgba(0,0,0,0.02);
-            font-weight: 600;
-            font-size: 1rem;
-            color: var(--dark-color);
-            position: relative;
-        }
-        
-        .function-card h3:after {
-            content: '';
-            position: absolute;
-            bottom: -1px;
-            left: 0;
-            width: 30px;
-            height: 3px;
-            background-color: var(--primary-color);
-        }
-        
-        .function-card-content {
-            padding: 20px;
-        }
-        
-        .capture-btn {
-            display: flex;
-            width: 100%;
-            padding: 14px;
-            margin-bottom: 15px;
-            background: linear-gradient(135deg, var(--primary-color), var(--primary-dark));
-            color: white;
-            border: none;
-            border-radius: var(--border-radius);
-            cursor: pointer;
-            font-weight: 600;
-            transition: all var(--transition-speed) ease;
-            justify-content: center;
-            align-items: center;
-            box-shadow: 0 2px 4px rgba(0, 98, 204, 0.2);
-        }
-        
-        .capture-btn:hover {
-            transform: translateY(-1px);
-            box-shadow: 0 4px 8px rgba(0, 98, 204, 0.3);
-        }
-        
-        .capture-btn:active {
-            transform: translateY(1px);
-        }
-        
-        .capture-btn::before {
-            content: "📷";
-            margin-right: 8px;
-            font-size: 1.2em;
-        }
-        
-        /* アノテーション用スタイル */
-        .annotation-container {
-            position: relative;
-            width: 100%;
-            height: 400px;
-            margin-bottom: 20px;
-            overflow: hidden;
-            border-radius: var(--border-radius);
-            box-shadow: var(--card-shadow);
-            background-color: #111;
-        }
-        
-        .annotation-image {
-            max-width: 100%;
-            max-height: 100%;
-            display: block;
-            margin: 0 auto;
-            transform-origin: center;
-            transition: transform var(--transition-speed) ease;
-        }
-        
-        .annotation-canvas {
-            position: absolute;
-            top: 0;
-            left: 0;
-            z-index: 2;
-            cursor: crosshair;
-            touch-action: none;
-            transition: transform var(--transition-speed) ease;
-        }
-        
-        .annotation-controls {
-            margin-top: 15px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            background-color: white;
-            padding: 15px;
-            border-radius: var(--border-radius);
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.05);
-        }
-        
-        .annotation-controls button {
-            margin-right: 10px;
-            background-color: white;
-            border: 1px solid rgba(0,0,0,0.1);
-            padding: 8px 14px;
-            border-radius: var(--border-radius);
-            font-weight: 500;
-            transition: all var(--transition-speed) ease;
-            color: var(--secondary-color);
-        }
-        
-        .annotation-controls button:hover {
-            background-color: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-            transform: translateY(-1px);
-        }
-        
-        .color-picker {
-            margin-right: 10px;
-            height: 30px;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-        }
-        
-        .size-control {
-            display: flex;
-            align-items: center;
-            background-color: rgba(0,0,0,0.02);
-            padding: 6px 12px;
-            border-radius: var(--border-radius);
-        }
-        
-        .size-control label {
-            margin-right: 8px;
-            font-weight: 500;
-            color: var(--secondary-color);
-        }
-        
-        .size-control input[type="range"] {
-            width: 80px;
-            accent-color: var(--primary-color);
-        }
-        
-        .zoom-annotation-controls {
-            position: absolute;
-            bottom: 15px;
-            right: 15px;
-            display: flex;
-            gap: 8px;
-            z-index: 5;
-        }
-        
-        .zoom-annotation-controls button {
-            width: 36px;
-            height: 36px;
-            border-radius: 50%;
-            background-color: rgba(0, 0, 0, 0.6);
-            color: white;
-            border: none;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 18px;
-            cursor: pointer;
-            transition: all var(--transition-speed) ease;
-            backdrop-filter: blur(2px);
-        }
-        
-        .zoom-annotation-controls button:hover {
-            background-color: rgba(0, 98, 204, 0.8);
-            transform: translateY(-2px);
-        }
-        
-        /* 寸法検知用スタイル */
-        .dimension-container {
-            position: relative;
-            width: 100%;
-            height: 400px;
-            margin-bottom: 20px;
-            overflow: hidden;
-            border-radius: var(--border-radius);
-            box-shadow: var(--card-shadow);
-            background-color: #111;
-        }
-        
-        .dimension-canvas {
-            position: absolute;
-            top: 0;
-            left: 0;
-            z-index: 2;
-            cursor: crosshair;
-            transition: transform var(--transition-speed) ease;
-        }
-        
-        .dimension-controls {
-            margin-top: 15px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            background-color: white;
-            padding: 15px;
-            border-radius: var(--border-radius);
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.05);
-        }
-        
-        .dimension-controls button {
-            margin-right: 10px;
-            background-color: white;
-            border: 1px solid rgba(0,0,0,0.1);
-            padding: 8px 14px;
-            border-radius: var(--border-radius);
-            font-weight: 500;
-            transition: all var(--transition-speed) ease;
-            color: var(--secondary-color);
-        }
-        
-        .dimension-controls button:hover {
-            background-color: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-            transform: translateY(-1px);
-        }
-        
-        .dimension-info {
-            margin-top: 15px;
-            padding: 15px;
-            border-radius: var(--border-radius);
-            background-color: white;
-            box-shadow: var(--card-shadow);
-            border: 1px solid var(--primary-light);
-        }
-        
-        /* 異常検知用スタイル */
-        .anomaly-container {
-            position: relative;
-            width: 100%;
-            height: 400px;
-            margin-bottom: 20px;
-            overflow: hidden;
-            border-radius: var(--border-radius);
-            box-shadow: var(--card-shadow);
-            background-color: #111;
-        }
-        
-        .anomaly-controls {
-            margin-top: 15px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            background-color: white;
-            padding: 15px;
-            border-radius: var(--border-radius);
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.05);
-        }
-        
-        .anomaly-controls button {
-            margin-right: 10px;
-            background-color: white;
-            border: 1px solid rgba(0,0,0,0.1);
-            padding: 8px 14px;
-            border-radius: var(--border-radius);
-            font-weight: 500;
-            transition: all var(--transition-speed) ease;
-            color: var(--secondary-color);
-        }
-        
-        .anomaly-controls button:hover {
-            background-color: var(--primary-color);
-            color: white;
-            border-color: var(--primary-color);
-            transform: translateY(-1px);
-        }
-        
-        .anomaly-info {
-            margin-top: 15px;
-            padding: 15px;
-            border-radius: var(--border-radius);
-            background-color: white;
-            box-shadow: var(--card-shadow);
-            border: 1px solid var(--primary-light);
-        }
-        
-        .heatmap-canvas {
-            position: absolute;
-            top: 0;
-            left: 0;
-            z-index: 2;
-            opacity: 0.6;
-            transition: transform var(--transition-speed) ease;
-        }
-        
-        /* モバイル対応 */
-        @media (max-width: 1024px) {
-            .camera-grid, .camera-grid-function {
-                grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            }
-            
-            .sidebar {
-                width: 80px;
-                transform: translateX(0);
-            }
-            
-            .sidebar.expanded {
-                width: 240px;
-            }
-            
-            .sidebar-logo h1 {
-                display: none;
-            }
-            
-            .sidebar.expanded .sidebar-logo h1 {
-                display: block;
-            }
-            
-            .tab .tab-text {
-                display: none;
-            }
-            
-            .sidebar.expanded .tab .tab-text {
-                display: inline;
-            }
-            
-            .sidebar-footer {
-                display: none;
-            }
-            
-            .sidebar.expanded .sidebar-footer {
-                display: block;
-            }
-            
-            .main-content {
-                margin-left: 80px;
-                padding: 15px;
-            }
-            
-            .sidebar.expanded + .main-content {
-                margin-left: 240px;
-            }
-            
-            .mobile-toggle {
-                display: block;
-            }
-        }
-        
-        @media (max-width: 768px) {
-            .sidebar {
-                transform: translateX(-100%);
-                width: 240px;
-            }
-            
-            .sidebar.mobile-visible {
-                transform: translateX(0);
-            }
-            
-            .tab .tab-text {
-                display: inline;
-            }
-            
-            .sidebar-logo h1 {
-                display: block;
-            }
-            
-            .sidebar-footer {
-                display: block;
-            }
-            
-            .main-content {
-                margin-left: 0;
-                width: 100%;
-                padding: 10px;
-            }
-            
-            .mobile-menu-overlay {
-                display: none;
-                position: fixed;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background-color: rgba(0, 0, 0, 0.5);
-                z-index: 99;
-            }
-            
-            .mobile-menu-overlay.visible {
-                display: block;
-            }
-            
-            .mobile-menu-button {
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                width: 48px;
-                height: 48px;
-                border-radius: 50%;
-                background-color: var(--primary-color);
-                color: white;
-                box-shadow: 0 3px 10px rgba(0, 98, 204, 0.3);
-                border: none;
-                position: fixed;
-                bottom: 20px;
-                right: 20px;
-                z-index: 98;
-                font-size: 24px;
-                cursor: pointer;
-                transition: all var(--transition-speed) ease;
-            }
-            
-            .mobile-menu-button:hover {
-                transform: scale(1.05);
-                box-shadow: 0 4px 15px rgba(0, 98, 204, 0.4);
-            }
-            
-            .camera-grid, .camera-grid-function {
-                grid-template-columns: 1fr;
-            }
-            
-            .camera-stream, .annotation-container, .dimension-container, .anomaly-container {
-                height: 250px;
-            }
-            
-            .header {
-                flex-direction: column;
-                align-items: flex-start;
-            }
-            
-            .controls {
-                margin-top: 15px;
-                width: 100%;
-                justify-content: space-between;
-            }
-        }
-    </style>
-</head>
-<body>
-    <!-- サイドバーナビゲーション -->
-    <nav class="sidebar" id="sidebar">
-        <div class="sidebar-logo">
-            <div class="logo-container">
-                <img src="/static/logo.png" alt="SCIEN Logo" class="logo-img">
-                <h1>カメラ監視システム</h1>
-            </div>
-            <button class="mobile-toggle" id="sidebar-toggle">≡</button>
-        </div>
-        <div class="tabs">
-            <div class="tab active" data-tab="streaming">
-                <span class="tab-icon">📹</span>
-                <span class="tab-text">ストリーミング</span>
-            </div>
-            <div class="tab" data-tab="annotation">
-                <span class="tab-icon">✏️</span>
-                <span class="tab-text">アノテーション</span>
-            </div>
-            <div class="tab" data-tab="dimension">
-                <span class="tab-icon">📏</span>
-                <span class="tab-text">寸法検知</span>
-            </div>
-            <div class="tab" data-tab="anomaly">
-                <span class="tab-icon">🔍</span>
-                <span class="tab-text">異常検知</span>
-            </div>
-        </div>
-        <div class="sidebar-footer">
-            <img src="/static/logo.png" alt="SCIEN Logo">
-            <p>© 2025 SCIEN, Inc</p>
-            <p>All rights reserved</p>
-        </div>
-    </nav>
-    
-    <!-- モバイルメニューオーバーレイ -->
-    <div class="mobile-menu-overlay" id="mobile-overlay"></div>
-    <button class="mobile-menu-button" id="mobile-menu-button">☰</button>
-    
-    <!-- メインコンテンツ -->
-    <div class="main-content">
-        <!-- ヘッダー -->
-        <div class="header">
-            <h2 class="header-title" id="page-title">ストリーミング</h2>
-            <div class="controls">
-                <button id="refresh-btn" class="button">
-                    <span class="button-icon">🔄</span>更新
-                </button>
-                <button id="grid-toggle-btn" class="button">
-                    <span class="button-icon">⊞</span>グリッド切替
-                </button>
-            </div>
-        </div>
-        
-        <!-- ストリーミングタブ -->
-        <div id="streaming-tab" class="tab-content active">
-            <div id="camera-grid" class="camera-grid">
-                <div class="placeholder">
-                    <div class="placeholder-icon">🎥</div>
-                    <p>カメラを読み込み中...</p>
-                </div>
-            </div>
-        </div>
-        
-        <!-- アノテーションタブ -->
-        <div id="annotation-tab" class="tab-content">
-            <div id="annotation-grid" class="camera-grid-function">
-                <div class="placeholder">
-                    <div class="placeholder-icon">✏️</div>
-                    <p>カメラを選択して静止画を撮影してください。</p>
-                </div>
-            </div>
-        </div>
-        
-        <!-- 寸法検知タブ -->
-        <div id="dimension-tab" class="tab-content">
-            <div id="dimension-grid" class="camera-grid-function">
-                <div class="placeholder">
-                    <div class="placeholder-icon">📏</div>
-                    <p>カメラを選択して静止画を撮影してください。</p>
-                </div>
-            </div>
-        </div>
-        
-        <!-- 異常検知タブ -->
-        <div id="anomaly-tab" class="tab-content">
-            <div id="anomaly-grid" class="camera-grid-function">
-                <div class="placeholder">
-                    <div class="placeholder-icon">🔍</div>
-                    <p>カメラを選択して静止画を撮影してください。</p>
-                </div>
-            </div>
-        </div>
-    </div>
-    
-    <!-- スナップショットモーダル -->
-    <div id="snapshot-modal" class="modal">
-        <div class="modal-content">
-            <span class="modal-close" id="close-modal">&times;</span>
-            <h2 id="snapshot-title">スナップショット</h2>
-            <img id="snapshot-img" class="snapshot-img" src="" alt="スナップショット">
-        </div>
-    </div>
-    
-    <script>
-        // DOM要素の取得
-        const sidebar = document.getElementById('sidebar');
-        const sidebarToggle = document.getElementById('sidebar-toggle');
-        const mobileMenuButton = document.getElementById('mobile-menu-button');
-        const mobileOverlay = document.getElementById('mobile-overlay');
-        const pageTitle = document.getElementById('page-title');
-        const cameraGrid = document.getElementById('camera-grid');
-        const annotationGrid = document.getElementById('annotation-grid');
-        const dimensionGrid = document.getElementById('dimension-grid');
-        const anomalyGrid = document.getElementById('anomaly-grid');
-        const refreshBtn = document.getElementById('refresh-btn');
-        const gridToggleBtn = document.getElementById('grid-toggle-btn');
-        const snapshotModal = document.getElementById('snapshot-modal');
-        const closeModalBtn = document.getElementById('close-modal');
-        const snapshotImg = document.getElementById('snapshot-img');
-        const snapshotTitle = document.getElementById('snapshot-title');
-        const tabs = document.querySelectorAll('.tab');
-        const tabContents = document.querySelectorAll('.tab-content');
-        
-        // カメラリスト
-        let cameras = {};
-        
-        // グリッド列数
-        let gridColumns = 'auto-fill';
-        
-        // 現在選択されているタブ
-        let currentTab = 'streaming';
-        
-        // 撮影された画像データを保存するオブジェクト
-        let capturedImages = {
-            annotation: {},
-            dimension: {},
-            anomaly: {}
-        };
-        
-        // サイドバーの切り替え
-        sidebarToggle.addEventListener('click', () => {
-            sidebar.classList.toggle('expanded');
-        });
-        
-        // モバイルメニュー
-        mobileMenuButton.addEventListener('click', () => {
-            sidebar.classList.toggle('mobile-visible');
-            mobileOverlay.classList.toggle('visible');
-        });
-        
-        mobileOverlay.addEventListener('click', () => {
-            sidebar.classList.remove('mobile-visible');
-            mobileOverlay.classList.remove('visible');
-        });
-        
-        // タブの切り替え
-        tabs.forEach(tab => {
-            tab.addEventListener('click', () => {
-                // 現在のアクティブなタブを非アクティブにする
-                document.querySelector('.tab.active').classList.remove('active');
-                document.querySelector('.tab-content.active').classList.remove('active');
-                
-                // クリックされたタブをアクティブにする
-                tab.classList.add('active');
-                currentTab = tab.dataset.tab;
-                pageTitle.textContent = tab.querySelector('.tab-text').textContent;
-                document.getElementById(`${currentTab}-tab`).classList.add('active');
-                
-                // モバイルメニューを閉じる
-                sidebar.classList.remove('mobile-visible');
-                mobileOverlay.classList.remove('visible');
-                
-                // タブが変更されたときに必要な処理
-                if (currentTab === 'streaming') {
-                    fetchCameras();
-                } else if (Object.keys(cameras).length === 0) {
-                    fetchCameras().then(() => {
-                        updateFunctionGrid(currentTab);
-                    });
-                } else {
-                    updateFunctionGrid(currentTab);
-                }
-            });
-        });
-        
-        // カメラ情報を取得する関数
-        async function fetchCameras() {
-            try {
-                const response = await fetch('/api/cameras');
-                if (!response.ok) {
-                    throw new Error('サーバーからのレスポンスエラー');
-                }
-                
-                cameras = await response.json();
-                
-                if (currentTab === 'streaming') {
-                    renderCameraGrid();
-                } else {
-                    updateFunctionGrid(currentTab);
-                }
-                
-                return cameras;
-            } catch (error) {
-                console.error('カメラ情報取得エラー:', error);
-                const errorMessage = `
-                    <div class="placeholder">
-                        <div class="placeholder-icon">⚠️</div>
-                        <p>カメラ情報の取得に失敗しました。</p>
-                        <p>${error.message}</p>
-                    </div>
-                `;
-                
-                cameraGrid.innerHTML = errorMessage;
-                annotationGrid.innerHTML = errorMessage;
-                dimensionGrid.innerHTML = errorMessage;
-                anomalyGrid.innerHTML = errorMessage;
-            }
-        }
-        
-        // 機能タブのグリッドを更新する関数
-        function updateFunctionGrid(tabName) {
-            const grid = document.getElementById(`${tabName}-grid`);
-            
-            if (Object.keys(cameras).length === 0) {
-                grid.innerHTML = `
-                    <div class="placeholder">
-                        <div class="placeholder-icon">⚠️</div>
-                        <p>カメラが見つかりません。</p>
-                        <p>カメラノードを起動して、このサーバーに接続してください。</p>
-                    </div>
-                `;
-                return;
-            }
-            
-            let gridHTML = '';
-            
-            for (const [nodeId, camera] of Object.entries(cameras)) {
-                if (camera.status !== 'running') continue;
-                
-                let functionContent = '';
-                
-                // 各タブごとの特有のコンテンツ
-                if (tabName === 'annotation') {
-                    functionContent = `
-                        <div class="function-card-content">
-                            <button id="capture-annotation-${nodeId}" class="capture-btn">静止画を撮影</button>
-                            <div id="annotation-container-${nodeId}" class="annotation-container" style="display: none;">
-                                <img id="annotation-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
-                                <canvas id="annotation-canvas-${nodeId}" class="annotation-canvas"></canvas>
-                                <div class="zoom-annotation-controls">
-                                    <button id="zoom-in-annotation-${nodeId}">+</button>
-                                    <button id="zoom-out-annotation-${nodeId}">-</button>
-                                    <button id="zoom-reset-annotation-${nodeId}">↺</button>
-                                </div>
-                            </div>
-                            <div id="annotation-controls-${nodeId}" class="annotation-controls" style="display: none;">
-                                <div>
-                                    <button id="clear-annotation-${nodeId}">消去</button>
-                                    <button id="save-annotation-${nodeId}">保存</button>
-                                    <button id="recapture-annotation-${nodeId}">再撮影</button>
-                                </div>
-                                <div class="size-control">
-                                    <label for="color-${nodeId}">色:</label>
-                                    <input type="color" id="color-${nodeId}" class="color-picker" value="#ff0000">
-                                    <label for="size-${nodeId}">太さ:</label>
-                                    <input type="range" id="size-${nodeId}" min="1" max="20" value="5">
-                                </div>
-                            </div>
-                        </div>
-                    `;
-                } else if (tabName === 'dimension') {
-                    functionContent = `
-                        <div class="function-card-content">
-                            <button id="capture-dimension-${nodeId}" class="capture-btn">静止画を撮影</button>
-                            <div id="dimension-container-${nodeId}" class="dimension-container" style="display: none;">
-                                <img id="dimension-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
-                                <canvas id="dimension-canvas-${nodeId}" class="dimension-canvas"></canvas>
-                                <div class="zoom-annotation-controls">
-                                    <button id="zoom-in-dimension-${nodeId}">+</button>
-                                    <button id="zoom-out-dimension-${nodeId}">-</button>
-                                    <button id="zoom-reset-dimension-${nodeId}">↺</button>
-                                </div>
-                            </div>
-                            <div id="dimension-controls-${nodeId}" class="dimension-controls" style="display: none;">
-                                <button id="clear-dimension-${nodeId}">リセット</button>
-                                <button id="recapture-dimension-${nodeId}">再撮影</button>
-                            </div>
-                            <div id="dimension-info-${nodeId}" class="dimension-info" style="display: none;">
-                                <p>2点間の距離を測定するには、画像上で2点をクリックしてください。</p>
-                                <p id="dimension-result-${nodeId}">測定結果: まだ測定されていません</p>
-                            </div>
-                        </div>
-                    `;
-                } else if (tabName === 'anomaly') {
-                    functionContent = `
-                        <div class="function-card-content">
-                            <button id="capture-anomaly-${nodeId}" class="capture-btn">静止画を撮影</button>
-                            <div id="anomaly-container-${nodeId}" class="anomaly-container" style="display: none;">
-                                <img id="anomaly-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
-                                <canvas id="anomaly-canvas-${nodeId}" class="heatmap-canvas"></canvas>
-                                <div class="zoom-annotation-controls">
-                                    <button id="zoom-in-anomaly-${nodeId}">+</button>
-                                    <button id="zoom-out-anomaly-${nodeId}">-</button>
-                                    <button id="zoom-reset-anomaly-${nodeId}">↺</button>
-                                </div>
-                            </div>
-                            <div id="anomaly-controls-${nodeId}" class="anomaly-controls" style="display: none;">
-                                <button id="detect-anomaly-${nodeId}">異常検知実行</button>
-                                <button id="recapture-anomaly-${nodeId}">再撮影</button>
-                            </div>
-                            <div id="anomaly-info-${nodeId}" class="anomaly-info" style="display: none;">
-                                <p>異常検知の結果がここに表示されます。</p>
-                                <p id="anomaly-result-${nodeId}">検知結果: まだ実行されていません</p>
-                            </div>
-                        </div>
-                    `;
-                }
-                
-                gridHTML += `
-                    <div class="function-card" data-id="${nodeId}">
-                        <h3>${camera.name}</h3>
-                        ${functionContent}
-                    </div>
-                `;
-            }
-            
-            if (gridHTML === '') {
-                grid.innerHTML = `
-                    <div class="placeholder">
-                        <div class="placeholder-icon">⚠️</div>
-                        <p>利用可能なカメラがありません。</p>
-                        <p>カメラノードを起動して、このサーバーに接続してください。</p>
-                    </div>
-                `;
-            } else {
-                grid.innerHTML = gridHTML;
-                
-                // 各タブごとのイベントリスナーを設定
-                if (tabName === 'annotation') {
-                    setupAnnotationEvents();
-                } else if (tabName === 'dimension') {
-                    setupDimensionEvents();
-                } else if (tabName === 'anomaly') {
-                    setupAnomalyEvents();
-                }
-            }
-        }
-        
-        // アノテーションタブのイベントセットアップ
-        function setupAnnotationEvents() {
-            for (const [nodeId, camera] of Object.entries(cameras)) {
-                if (camera.status !== 'running') continue;
-                
-                const captureBtn = document.getElementById(`capture-annotation-${nodeId}`);
-                const container = document.getElementById(`annotation-container-${nodeId}`);
-                const controls = document.getElementById(`annotation-controls-${nodeId}`);
-                const clearBtn = document.getElementById(`clear-annotation-${nodeId}`);
-                const saveBtn = document.getElementById(`save-annotation-${nodeId}`);
-                const recaptureBtn = document.getElementById(`recapture-annotation-${nodeId}`);
-                const canvas = document.getElementById(`annotation-canvas-${nodeId}`);
-                const img = document.getElementById(`annotation-img-${nodeId}`);
-                const colorPicker = document.getElementById(`color-${nodeId}`);
-                const sizeSlider = document.getElementById(`size-${nodeId}`);
-                
-                if (!captureBtn) continue;
-                
-                // 撮影ボタンのイベント
-                captureBtn.addEventListener('click', async () => {
-                    try {
-                        const response = await fetch(`/api/snapshot/${nodeId}`);
-                        if (!response.ok) {
-                            throw new Error('スナップショット取得エラー');
-                        }
-                        
-                        const data = await response.json();
-                        
-                        if (data.success && data.image) {
-                            // 画像データを保存
-                            capturedImages.annotation[nodeId] = `data:image/jpeg;base64,${data.image}`;
-                            
-                            // 画像を表示
-                            img.src = capturedImages.annotation[nodeId];
-                            container.style.display = 'block';
-                            controls.style.display = 'flex';
-                            captureBtn.style.display = 'none';
-                            
-                            // 画像読み込み完了後にキャンバスをセットアップ
-                            img.onload = () => {
-                                setupCanvas(canvas, img, nodeId);
-                            };
-                        } else {
-                            alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
-                        }
-                    } catch (error) {
-                        console.error('スナップショットエラー:', error);
-                        alert('スナップショット取得エラー: ' + error.message);
-                    }
-                });
-                
-                // クリアボタンのイベント
-                clearBtn.addEventListener('click', () => {
-                    const ctx = canvas.getContext('2d');
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                });
-                
-                // 保存ボタンのイベント
-                saveBtn.addEventListener('click', () => {
-                    const annotatedImage = combineImageAndCanvas(img, canvas);
-                    // ここで保存処理（サンプルではダウンロードとして実装）
-                    const link = document.createElement('a');
-                    link.download = `annotation_${camera.name}_${new Date().toISOString()}.png`;
-                    link.href = annotatedImage;
-                    link.click();
-                    alert('アノテーションを保存しました');
-                });
-                
-                // 再撮影ボタンのイベント
-                recaptureBtn.addEventListener('click', () => {
-                    container.style.display = 'none';
-                    controls.style.display = 'none';
-                    captureBtn.style.display = 'block';
-                    const ctx = canvas.getContext('2d');
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                });
-            }
-        }
-        
-        // 寸法検知タブのイベントセットアップ
-        function setupDimensionEvents() {
-            for (const [nodeId, camera] of Object.entries(cameras)) {
-                if (camera.status !== 'running') continue;
-                
-                const captureBtn = document.getElementById(`capture-dimension-${nodeId}`);
-                const container = document.getElementById(`dimension-container-${nodeId}`);
-                const controls = document.getElementById(`dimension-controls-${nodeId}`);
-                const infoBox = document.getElementById(`dimension-info-${nodeId}`);
-                const clearBtn = document.getElementById(`clear-dimension-${nodeId}`);
-                const recaptureBtn = document.getElementById(`recapture-dimension-${nodeId}`);
-                const canvas = document.getElementById(`dimension-canvas-${nodeId}`);
-                const img = document.getElementById(`dimension-img-${nodeId}`);
-                const resultText = document.getElementById(`dimension-result-${nodeId}`);
-                
-                if (!captureBtn) continue;
-                
-                // 撮影ボタンのイベント
-                captureBtn.addEventListener('click', async () => {
-                    try {
-                        const response = await fetch(`/api/snapshot/${nodeId}`);
-                        if (!response.ok) {
-                            throw new Error('スナップショット取得エラー');
-                        }
-                        
-                        const data = await response.json();
-                        
-                        if (data.success && data.image) {
-                            // 画像データを保存
-                            capturedImages.dimension[nodeId] = `data:image/jpeg;base64,${data.image}`;
-                            
-                            // 画像を表示
-                            img.src = capturedImages.dimension[nodeId];
-                            container.style.display = 'block';
-                            controls.style.display = 'flex';
-                            infoBox.style.display = 'block';
-                            captureBtn.style.display = 'none';
-                            
-                            // 画像読み込み完了後にキャンバスをセットアップ
-                            img.onload = () => {
-                                setupDimensionCanvas(canvas, img, nodeId, resultText);
-                            };
-                        } else {
-                            alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
-                        }
-                    } catch (error) {
-                        console.error('スナップショットエラー:', error);
-                        alert('スナップショット取得エラー: ' + error.message);
-                    }
-                });
-                
-                // クリアボタンのイベント
-                clearBtn.addEventListener('click', () => {
-                    const ctx = canvas.getContext('2d');
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                    resultText.textContent = '測定結果: まだ測定されていません';
-                    // 測定点をリセット
-                    canvas.points = [];
-                });
-                
-                // 再撮影ボタンのイベント
-                recaptureBtn.addEventListener('click', () => {
-                    container.style.display = 'none';
-                    controls.style.display = 'none';
-                    infoBox.style.display = 'none';
-                    captureBtn.style.display = 'block';
-                    const ctx = canvas.getContext('2d');
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                });
-            }
-        }
-        
-        // 異常検知タブのイベントセットアップ
-        function setupAnomalyEvents() {
-            for (const [nodeId, camera] of Object.entries(cameras)) {
-                if (camera.status !== 'running') continue;
-                
-                const captureBtn = document.getElementById(`capture-anomaly-${nodeId}`);
-                const container = document.getElementById(`anomaly-container-${nodeId}`);
-                const controls = document.getElementById(`anomaly-controls-${nodeId}`);
-                const infoBox = document.getElementById(`anomaly-info-${nodeId}`);
-                const detectBtn = document.getElementById(`detect-anomaly-${nodeId}`);
-                const recaptureBtn = document.getElementById(`recapture-anomaly-${nodeId}`);
-                const canvas = document.getElementById(`anomaly-canvas-${nodeId}`);
-                const img = document.getElementById(`anomaly-img-${nodeId}`);
-                const resultText = document.getElementById(`anomaly-result-${nodeId}`);
-                
-                if (!captureBtn) continue;
-                
-                // 撮影ボタンのイベント
-                captureBtn.addEventListener('click', async () => {
-                    try {
-                        const response = await fetch(`/api/snapshot/${nodeId}`);
-                        if (!response.ok) {
-                            throw new Error('スナップショット取得エラー');
-                        }
-                        
-                        const data = await response.json();
-                        
-                        if (data.success && data.image) {
-                            // 画像データを保存
-                            capturedImages.anomaly[nodeId] = `data:image/jpeg;base64,${data.image}`;
-                            
-                            // 画像を表示
-                            img.src = capturedImages.anomaly[nodeId];
-                            container.style.display = 'block';
-                            controls.style.display = 'flex';
-                            infoBox.style.display = 'block';
-                            captureBtn.style.display = 'none';
-                            
-                            // 画像読み込み完了後にキャンバスをセットアップ
-                            img.onload = () => {
-                                setupAnomalyCanvas(canvas, img);
-                            };
-                        } else {
-                            alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
-                        }
-                    } catch (error) {
-                        console.error('スナップショットエラー:', error);
-                        alert('スナップショット取得エラー: ' + error.message);
-                    }
-                });
-                
-                // 異常検知ボタンのイベント
-                detectBtn.addEventListener('click', () => {
-                    // 異常検知の実行（サンプルとして擬似的なヒートマップを生成）
-                    detectAnomalies(canvas, img, resultText);
-                });
-                
-                // 再撮影ボタンのイベント
-                recaptureBtn.addEventListener('click', () => {
-                    container.style.display = 'none';
-                    controls.style.display = 'none';
-                    infoBox.style.display = 'none';
-                    captureBtn.style.display = 'block';
-                    const ctx = canvas.getContext('2d');
-                    ctx.clearRect(0, 0, canvas.width, canvas.height);
-                    resultText.textContent = '検知結果: まだ実行されていません';
-                });
-            }
-        }
-        
-        // アノテーション用キャンバスのセットアップ
-        function setupCanvas(canvas, img, nodeId) {
-            const rect = img.getBoundingClientRect();
-            canvas.width = rect.width;
-            canvas.height = rect.height;
-            
-            const ctx = canvas.getContext('2d');
-            let isDrawing = false;
-            let lastX = 0;
-            let lastY = 0;
-            let scale = 1;
-            let translateX = 0;
-            let translateY = 0;
-            let startDist = 0;
-            
-            // タッチでの描画
-            canvas.addEventListener('touchstart', function(e) {
-                if (e.touches.length === 1) {
-                    // 1本指の場合は描画
-                    e.preventDefault();
-                    const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    lastX = (touch.clientX - rect.left) / scale - translateX;
-                    lastY = (touch.clientY - rect.top) / scale - translateY;
-                    isDrawing = true;
-                } else if (e.touches.length === 2) {
-                    // 2本指の場合はズーム
-                    e.preventDefault();
-                    const touch1 = e.touches[0];
-                    const touch2 = e.touches[1];
-                    startDist = Math.hypot(
-                        touch2.clientX - touch1.clientX,
-                        touch2.clientY - touch1.clientY
-                    );
-                }
-            });
-            
-            canvas.addEventListener('touchmove', function(e) {
-                if (e.touches.length === 1 && isDrawing) {
-                    // 1本指の場合は描画
-                    e.preventDefault();
-                    const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    const x = (touch.clientX - rect.left) / scale - translateX;
-                    const y = (touch.clientY - rect.top) / scale - translateY;
-                    
-                    ctx.beginPath();
-                    ctx.moveTo(lastX, lastY);
-                    ctx.lineTo(x, y);
-                    ctx.strokeStyle = document.getElementById(`color-${nodeId}`).value;
-                    ctx.lineWidth = document.getElementById(`size-${nodeId}`).value;
-                    ctx.lineCap = 'round';
-                    ctx.stroke();
-                    
-                    lastX = x;
-                    lastY = y;
-                } else if (e.touches.length === 2) {
-                    // 2本指の場合はズーム
-                    e.preventDefault();
-                    const touch1 = e.touches[0];
-                    const touch2 = e.touches[1];
-                    const dist = Math.hypot(
-                        touch2.clientX - touch1.clientX,
-                        touch2.clientY - touch1.clientY
-                    );
-                    
-                    const newScale = scale * (dist / startDist);
-                    if (newScale > 0.5 && newScale < 5) {  // スケール制限
-                        scale = newScale;
-                        
-                        // 中心点を計算
-                        const centerX = (touch1.clientX + touch2.clientX) / 2;
-                        const centerY = (touch1.clientY + touch2.clientY) / 2;
-                        const rect = canvas.getBoundingClientRect();
-                        const canvasCenterX = (centerX - rect.left) / scale - translateX;
-                        const canvasCenterY = (centerY - rect.top) / scale - translateY;
-                        
-                        // 変換を更新
-                        img.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
-                        canvas.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
-                    }
-                    
-                    startDist = dist;
-                }
-            });
-            
-            canvas.addEventListener('touchend', function(e) {
-                if (e.touches.length === 0) {
-                    isDrawing = false;
-                }
-            });
-            
-            // マウスでの描画（デスクトップ用）
-            canvas.addEventListener('mousedown', function(e) {
-                const rect = canvas.getBoundingClientRect();
-                lastX = (e.clientX - rect.left) / scale - translateX;
-                lastY = (e.clientY - rect.top) / scale - translateY;
-                isDrawing = true;
-            });
-            
-            canvas.addEventListener('mousemove', function(e) {
-                if (!isDrawing) return;
-                
-                const rect = canvas.getBoundingClientRect();
-                const x = (e.clientX - rect.left) / scale - translateX;
-                const y = (e.clientY - rect.top) / scale - translateY;
-                
-                ctx.beginPath();
-                ctx.moveTo(lastX, lastY);
-                ctx.lineTo(x, y);
-                ctx.strokeStyle = document.getElementById(`color-${nodeId}`).value;
-                ctx.lineWidth = document.getElementById(`size-${nodeId}`).value;
-                ctx.lineCap = 'round';
-                ctx.stroke();
-                
-                lastX = x;
-                lastY = y;
-            });
-            
-            canvas.addEventListener('mouseup', function() {
-                isDrawing = false;
-            });
-            
-            canvas.addEventListener('mouseout', function() {
-                isDrawing = false;
-            });
-        }
-        
-        // 寸法検知用キャンバスのセットアップ
-        function setupDimensionCanvas(canvas, img, nodeId, resultText) {
-            const rect = img.getBoundingClientRect();
-            canvas.width = rect.width;
-            canvas.height = rect.height;
-            
-            const ctx = canvas.getContext('2d');
-            canvas.points = [];
-            
-            // クリックイベント（タッチ含む）
-            function handleClick(e) {
-                e.preventDefault();
-                
-                const rect = canvas.getBoundingClientRect();
-                let x, y;
-                
-                if (e.type === 'touchstart') {
-                    x = e.touches[0].clientX - rect.left;
-                    y = e.touches[0].clientY - rect.top;
-                } else {
-                    x = e.clientX - rect.left;
-                    y = e.clientY - rect.top;
-                }
-                
-                // 点の描画
-                ctx.beginPath();
-                ctx.arc(x, y, 5, 0, Math.PI * 2);
-                ctx.fillStyle = 'red';
-                ctx.fill();
-                
-                // テキスト
-                ctx.fillStyle = 'white';
-                ctx.strokeStyle = 'black';
-                ctx.lineWidth = 2;
-                ctx.font = '12px Arial';
-                ctx.strokeText(`点${canvas.points.length + 1}`, x + 10, y - 10);
-                ctx.fillText(`点${canvas.points.length + 1}`, x + 10, y - 10);
-                
-                // 点を保存
-                canvas.points.push({x, y});
-                
-                // 2点目が追加されたら線を引く
-                if (canvas.points.length === 2) {
-                    const p1 = canvas.points[0];
-                    const p2 = canvas.points[1];
-                    
-                    // 線を引く
-                    ctx.beginPath();
-                    ctx.moveTo(p1.x, p1.y);
-                    ctx.lineTo(p2.x, p2.y);
-                    ctx.strokeStyle = 'yellow';
-                    ctx.lineWidth = 2;
-                    ctx.stroke();
-                    
-                    // 距離の計算
-                    const distance = Math.sqrt(Math.pow(p2.x - p1.x, 2) + Math.pow(p2.y - p1.y, 2));
-                    
-                    // 中間点に距離を表示
-                    const midX = (p1.x + p2.x) / 2;
-                    const midY = (p1.y + p2.y) / 2;
-                    
-                    ctx.fillStyle = 'white';
-                    ctx.strokeStyle = 'black';
-                    ctx.font = '14px Arial';
-                    
-                    const dimensionText = `${distance.toFixed(1)}px`;
-                    ctx.strokeText(dimensionText, midX, midY - 10);
-                    ctx.fillText(dimensionText, midX, midY - 10);
-                    
-                    // 結果テキストの更新
-                    resultText.textContent = `測定結果: 2点間の距離は ${distance.toFixed(1)}px です`;
-                    
-                    // リセットする（次の測定のため）
-                    setTimeout(() => {
-                        canvas.points = [];
-                    }, 500);
-                }
-            }
-            
-            canvas.addEventListener('mousedown', handleClick);
-            canvas.addEventListener('touchstart', handleClick);
-        }
-        
-        // 異常検知用キャンバスのセットアップ
-        function setupAnomalyCanvas(canvas, img) {
-            const rect = img.getBoundingClientRect();
-            canvas.width = rect.width;
-            canvas.height = rect.height;
-        }
-        
-        // 異常検知実行関数（サンプル実装）
-        function detectAnomalies(canvas, img, resultText) {
-            const ctx = canvas.getContext('2d');
-            ctx.clearRect(0, 0, canvas.width, canvas.height);
-            
-            // サンプルとして擬似的なヒートマップを生成
-            const gradients = [
-                {pos: [0.2, 0.3], radius: 30, intensity: 0.8},
-                {pos: [0.5, 0.6], radius: 40, intensity: 0.6},
-                {pos: [0.8, 0.2], radius: 25, intensity: 0.9}
-            ];
-            
-            // ヒートマップの描画
-            for (const grad of gradients) {
-                const centerX = canvas.width * grad.pos[0];
-                const centerY = canvas.height * grad.pos[1];
-                
-                const grd = ctx.createRadialGradient(
-                    centerX, centerY, 1,
-                    centerX, centerY, grad.radius
-                );
-                
-                grd.addColorStop(0, `rgba(255, 0, 0, ${grad.intensity})`);
-                grd.addColorStop(1, 'rgba(255, 0, 0, 0)');
-                
-                ctx.fillStyle = grd;
-                ctx.beginPath();
-                ctx.arc(centerX, centerY, grad.radius, 0, Math.PI * 2);
-                ctx.fill();
-            }
-            
-            // 結果テキストの更新
-            resultText.textContent = `検知結果: ${gradients.length}箇所の異常が検出されました`;
-        }
-        
-        // 画像とキャンバスを合成する関数
-        function combineImageAndCanvas(img, canvas) {
-            const combinedCanvas = document.createElement('canvas');
-            combinedCanvas.width = canvas.width;
-            combinedCanvas.height = canvas.height;
-            
-            const ctx = combinedCanvas.getContext('2d');
-            ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-            ctx.drawImage(canvas, 0, 0);
-            
-            return combinedCanvas.toDataURL('image/png');
-        }
-        
-        // カメラグリッドを描画する関数
-        function renderCameraGrid() {
-            const cameraCount = Object.keys(cameras).length;
-            
-            if (cameraCount === 0) {
-                cameraGrid.innerHTML = `
-                    <div class="placeholder">
-                        <div class="placeholder-icon">🎥</div>
-                        <p>カメラが見つかりません。</p>
-                        <p>カメラノードを起動して、このサーバーに接続してください。</p>
-                    </div>
-                `;
-                return;
-            }
-            
-            let gridHTML = '';
-            
-            for (const [nodeId, camera] of Object.entries(cameras)) {
-                gridHTML += `
-                    <div class="camera-card" data-id="${nodeId}">
-                        <div class="camera-header">
-                            <h3 class="camera-title">
-                                <span class="status-indicator status-${camera.status}"></span>
-                                ${camera.name}
-                            </h3>
-                            <div class="camera-actions">
-                                <button class="refresh-stream-btn" data-id="${nodeId}">リフレッシュ</button>
-                                <button class="snapshot-btn" data-id="${nodeId}">スナップショット</button>
-                            </div>
-                        </div>
-                        <div class="camera-stream" id="stream-${nodeId}" data-zoom="1" data-translate-x="0" data-translate-y="0">
-                            <div class="loading">読み込み中...</div>
-                            ${camera.status === 'running' 
-                                ? `<img src="${camera.url}" alt="${camera.name}" onerror="handleStreamError('${nodeId}')">`
-                                : `<div class="error-overlay">カメラ接続エラー</div>`
-                            }
-                            <div class="zoom-controls">
-                                <button class="zoom-in-btn" data-id="${nodeId}">+</button>
-                                <button class="zoom-out-btn" data-id="${nodeId}">-</button>
-                                <button class="zoom-reset-btn" data-id="${nodeId}">↺</button>
-                            </div>
-                        </div>
-                        <div class="camera-info">
-                            <p><strong>ID</strong> ${nodeId}</p>
-                            <p><strong>解像度</strong> ${camera.resolution ? camera.resolution.join(' x ') : '不明'}</p>
-                            <p><strong>ステータス</strong> ${getStatusText(camera.status)}</p>
-                            <p><strong>最終確認</strong> ${camera.last_seen}</p>
-                        </div>
-                    </div>
-                `;
-            }
-            
-            cameraGrid.innerHTML = gridHTML;
-            
-            // イベントリスナーを追加
-            document.querySelectorAll('.refresh-stream-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    const nodeId = e.target.dataset.id;
-                    refreshStream(nodeId);
-                });
-            });
-            
-            document.querySelectorAll('.snapshot-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    const nodeId = e.target.dataset.id;
-                    takeSnapshot(nodeId);
-                });
-            });
-            
-            // ズームコントロールのイベントリスナーを設定
-            setupZoomControls();
-        }
-        
-        // ズームコントロールの設定
-        function setupZoomControls() {
-            // ストリーミングタブのズームコントロール
-            document.querySelectorAll('.zoom-in-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    const nodeId = e.target.dataset.id;
-                    const streamContainer = document.getElementById(`stream-${nodeId}`);
-                    const img = streamContainer.querySelector('img');
-                    if (!img) return;
-                    
-                    let scale = parseFloat(streamContainer.dataset.zoom || 1);
-                    scale = Math.min(scale + 0.2, 3);  // 最大ズーム3倍
-                    streamContainer.dataset.zoom = scale;
-                    img.style.transform = `scale(${scale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
-                });
-            });
-            
-            document.querySelectorAll('.zoom-out-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    const nodeId = e.target.dataset.id;
-                    const streamContainer = document.getElementById(`stream-${nodeId}`);
-                    const img = streamContainer.querySelector('img');
-                    if (!img) return;
-                    
-                    let scale = parseFloat(streamContainer.dataset.zoom || 1);
-                    scale = Math.max(scale - 0.2, 1);  // 最小ズーム等倍
-                    streamContainer.dataset.zoom = scale;
-                    img.style.transform = `scale(${scale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
-                    
-                    // ズームアウト時に位置をリセットする場合
-                    if (scale === 1) {
-                        streamContainer.dataset.translateX = 0;
-                        streamContainer.dataset.translateY = 0;
-                    }
-                });
-            });
-            
-            document.querySelectorAll('.zoom-reset-btn').forEach(btn => {
-                btn.addEventListener('click', (e) => {
-                    const nodeId = e.target.dataset.id;
-                    const streamContainer = document.getElementById(`stream-${nodeId}`);
-                    const img = streamContainer.querySelector('img');
-                    if (!img) return;
-                    
-                    streamContainer.dataset.zoom = 1;
-                    streamContainer.dataset.translateX = 0;
-                    streamContainer.dataset.translateY = 0;
-                    img.style.transform = 'scale(1) translate(0px, 0px)';
-                });
-            });
-            
-            // ストリーミングタブでの画像ドラッグ機能
-            document.querySelectorAll('.camera-stream img').forEach(img => {
-                let isDragging = false;
-                let startX, startY;
-                let translateX = 0;
-                let translateY = 0;
-                
-                // ドラッグ開始
-                img.addEventListener('mousedown', (e) => {
-                    const streamContainer = e.target.closest('.camera-stream');
-                    const scale = parseFloat(streamContainer.dataset.zoom || 1);
-                    if (scale <= 1) return;  // ズームインしていない場合はドラッグ無効
-                    
-                    isDragging = true;
-                    startX = e.clientX;
-                    startY = e.clientY;
-                    translateX = parseFloat(streamContainer.dataset.translateX || 0);
-                    translateY = parseFloat(streamContainer.dataset.translateY || 0);
-                    
-                    streamContainer.classList.add('zoomed');
-                });
-                
-                // ドラッグ中
-                window.addEventListener('mousemove', (e) => {
-                    if (!isDragging) return;
-                    
-                    const x = e.clientX;
-                    const y = e.clientY;
-                    const deltaX = (x - startX) / 5;
-                    const deltaY = (y - startY) / 5;
-                    
-                    const newTranslateX = translateX + deltaX;
-                    const newTranslateY = translateY + deltaY;
-                    
-                    const streamContainer = img.closest('.camera-stream');
-                    const scale = parseFloat(streamContainer.dataset.zoom || 1);
-                    
-                    streamContainer.dataset.translateX = newTranslateX;
-                    streamContainer.dataset.translateY = newTranslateY;
-                    
-                    img.style.transform = `scale(${scale}) translate(${newTranslateX}px, ${newTranslateY}px)`;
-                });
-                
-                // ドラッグ終了
-                window.addEventListener('mouseup', () => {
-                    isDragging = false;
-                    document.querySelectorAll('.camera-stream.zoomed').forEach(el => {
-                        el.classList.remove('zoomed');
-                    });
-                });
-            });
-            
-            // タッチデバイス用の処理
-            document.querySelectorAll('.camera-stream img').forEach(img => {
-                const streamContainer = img.closest('.camera-stream');
-                
-                // ピンチズーム用の変数
-                let initialDistance = 0;
-                let initialScale = 1;
-                
-                // タッチ開始
-                streamContainer.addEventListener('touchstart', (e) => {
-                    if (e.touches.length === 2) {
-                        // ピンチズームの場合
-                        const touch1 = e.touches[0];
-                        const touch2 = e.touches[1];
-                        initialDistance = Math.hypot(
-                            touch2.clientX - touch1.clientX,
-                            touch2.clientY - touch1.clientY
-                        );
-                        initialScale = parseFloat(streamContainer.dataset.zoom || 1);
-                        e.preventDefault();
-                    } else if (e.touches.length === 1) {
-                        // ドラッグの場合
-                        const scale = parseFloat(streamContainer.dataset.zoom || 1);
-                        if (scale <= 1) return;  // ズームインしていない場合はドラッグ無効
-                        
-                        const touch = e.touches[0];
-                        streamContainer.dataset.startX = touch.clientX;
-                        streamContainer.dataset.startY = touch.clientY;
-                        streamContainer.dataset.translateStartX = parseFloat(streamContainer.dataset.translateX || 0);
-                        streamContainer.dataset.translateStartY = parseFloat(streamContainer.dataset.translateY || 0);
-                        streamContainer.classList.add('zoomed');
-                        e.preventDefault();
-                    }
-                });
-                
-                // タッチ移動
-                streamContainer.addEventListener('touchmove', (e) => {
-                    if (e.touches.length === 2) {
-                        // ピンチズームの場合
-                        const touch1 = e.touches[0];
-                        const touch2 = e.touches[1];
-                        const currentDistance = Math.hypot(
-                            touch2.clientX - touch1.clientX,
-                            touch2.clientY - touch1.clientY
-                        );
-                        
-                        // スケールの計算
-                        let newScale = initialScale * (currentDistance / initialDistance);
-                        newScale = Math.max(1, Math.min(3, newScale));  // 1～3倍に制限
-                        
-                        streamContainer.dataset.zoom = newScale;
-                        img.style.transform = `scale(${newScale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
-                        
-                        e.preventDefault();
-                    } else if (e.touches.length === 1) {
-                        // ドラッグの場合
-                        const scale = parseFloat(streamContainer.dataset.zoom || 1);
-                        if (scale <= 1) return;
-                        
-                        const touch = e.touches[0];
-                        const startX = parseFloat(streamContainer.dataset.startX || 0);
-                        const startY = parseFloat(streamContainer.dataset.startY || 0);
-                        const translateStartX = parseFloat(streamContainer.dataset.translateStartX || 0);
-                        const translateStartY = parseFloat(streamContainer.dataset.translateStartY || 0);
-                        
-                        const deltaX = (touch.clientX - startX) / 5;
-                        const deltaY = (touch.clientY - startY) / 5;
-                        
-                        const newTranslateX = translateStartX + deltaX;
-                        const newTranslateY = translateStartY + deltaY;
-                        
-                        streamContainer.dataset.translateX = newTranslateX;
-                        streamContainer.dataset.translateY = newTranslateY;
-                        
-                        img.style.transform = `scale(${scale}) translate(${newTranslateX}px, ${newTranslateY}px)`;
-                        
-                        e.preventDefault();
-                    }
-                });
-                
-                // タッチ終了
-                streamContainer.addEventListener('touchend', () => {
-                    streamContainer.classList.remove('zoomed');
-                });
-            });
-            
-            // アノテーション、寸法、異常検知のズームコントロール
-            ['annotation', 'dimension', 'anomaly'].forEach(tabType => {
-                for (const [nodeId, camera] of Object.entries(cameras)) {
-                    const zoomInBtn = document.getElementById(`zoom-in-${tabType}-${nodeId}`);
-                    const zoomOutBtn = document.getElementById(`zoom-out-${tabType}-${nodeId}`);
-                    const zoomResetBtn = document.getElementById(`zoom-reset-${tabType}-${nodeId}`);
-                    const img = document.getElementById(`${tabType}-img-${nodeId}`);
-                    const canvas = document.getElementById(`${tabType}-canvas-${nodeId}`);
-                    
-                    if (!zoomInBtn || !zoomOutBtn || !zoomResetBtn || !img || !canvas) continue;
-                    
-                    let scale = 1;
-                    let translateX = 0;
-                    let translateY = 0;
-                    
-                    // ズームイン
-                    zoomInBtn.addEventListener('click', () => {
-                        scale = Math.min(scale + 0.2, 3);
-                        updateTransform();
-                    });
-                    
-                    // ズームアウト
-                    zoomOutBtn.addEventListener('click', () => {
-                        scale = Math.max(scale - 0.2, 1);
-                        if (scale === 1) {
-                            translateX = 0;
-                            translateY = 0;
-                        }
-                        updateTransform();
-                    });
-                    
-                    // リセット
-                    zoomResetBtn.addEventListener('click', () => {
-                        scale = 1;
-                        translateX = 0;
-                        translateY = 0;
-                        updateTransform();
-                    });
-                    
-                    // 変換を更新する関数
-                    function updateTransform() {
-                        img.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
-                        canvas.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
-                    }
-                }
-            });
-        }
-        
-        // ストリームをリフレッシュする関数
-        function refreshStream(nodeId) {
-            if (!cameras[nodeId]) return;
-            
-            const streamContainer = document.getElementById(`stream-${nodeId}`);
-            const camera = cameras[nodeId];
-            
-            if (camera.status === 'running') {
-                streamContainer.innerHTML = `
-                    <div class="loading">読み込み中...</div>
-                    <img src="${camera.url}?t=${new Date().getTime()}" alt="${camera.name}" 
-                         onerror="handleStreamError('${nodeId}')">
-                    <div class="zoom-controls">
-                        <button class="zoom-in-btn" data-id="${nodeId}">+</button>
-                        <button class="zoom-out-btn" data-id="${nodeId}">-</button>
-                        <button class="zoom-reset-btn" data-id="${nodeId}">↺</button>
-                    </div>
-                `;
-                
-                // ズームコントロールを再設定
-                setupZoomControls();
-            }
-        }
-        
-        // スナップショットを取得する関数
-        async function takeSnapshot(nodeId) {
-            if (!cameras[nodeId]) return;
-            
-            try {
-                const response = await fetch(`/api/snapshot/${nodeId}`);
-                if (!response.ok) {
-                    throw new Error('スナップショット取得エラー');
-                }
-                
-                const data = await response.json();
-                
-                if (data.success && data.image) {
-                    // スナップショットをモーダルに表示
-                    snapshotTitle.textContent = `スナップショット: ${cameras[nodeId].name}`;
-                    snapshotImg.src = `data:image/jpeg;base64,${data.image}`;
-                    
-                    // モーダルを表示
-                    showModal(snapshotModal);
-                } else {
-                    alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
-                }
-            } catch (error) {
-                console.error('スナップショットエラー:', error);
-alert('スナップショット取得エラー: ' + error.message);
-            }
-        }
-        
-        // ストリームエラーを処理する関数
-        function handleStreamError(nodeId) {
-            if (!cameras[nodeId]) return;
-            
-            const streamContainer = document.getElementById(`stream-${nodeId}`);
-            
-            if (streamContainer) {
-                streamContainer.innerHTML = `
-                    <div class="error-overlay">
-                        ストリーム読み込みエラー
-                        <button onclick="refreshStream('${nodeId}')">
-                            再試行
-                        </button>
-                    </div>
-                    <div class="zoom-controls">
-                        <button class="zoom-in-btn" data-id="${nodeId}">+</button>
-                        <button class="zoom-out-btn" data-id="${nodeId}">-</button>
-                        <button class="zoom-reset-btn" data-id="${nodeId}">↺</button>
-                    </div>
-                `;
-            }
-        }
-        
-        // ステータスのテキストを取得する関数
-        function getStatusText(status) {
-            switch (status) {
-                case 'running': return '正常';
-                case 'error': return 'エラー';
-                case 'initializing': return '初期化中';
-                case 'unreachable': return '接続不可';
-                default: return status;
-            }
-        }
-        
-        // グリッドの列数を切り替える関数
-        function toggleGridColumns() {
-            if (gridColumns === 'auto-fill') {
-                gridColumns = '1';
-                cameraGrid.style.gridTemplateColumns = '1fr';
-                document.querySelectorAll('.camera-grid-function').forEach(grid => {
-                    grid.style.gridTemplateColumns = '1fr';
-                });
-            } else {
-                gridColumns = 'auto-fill';
-                cameraGrid.style.gridTemplateColumns = 'repeat(auto-fill, minmax(450px, 1fr))';
-                document.querySelectorAll('.camera-grid-function').forEach(grid => {
-                    grid.style.gridTemplateColumns = 'repeat(auto-fill, minmax(500px, 1fr))';
-                });
-            }
-        }
-        
-        // モーダルの表示/非表示切り替え関数
-        function showModal(modal) {
-            modal.style.display = 'flex';
-            setTimeout(() => {
-                modal.classList.add('visible');
-            }, 10);
-        }
-        
-        function hideModal(modal) {
-            modal.classList.remove('visible');
-            setTimeout(() => {
-                modal.style.display = 'none';
-            }, 300);
-        }
-        
-        // イベントリスナー
-        refreshBtn.addEventListener('click', fetchCameras);
-        gridToggleBtn.addEventListener('click', toggleGridColumns);
-        
-        // モーダルを閉じる
-        closeModalBtn.addEventListener('click', () => {
-            hideModal(snapshotModal);
-        });
-        
-        // モーダル外をクリックして閉じる
-        snapshotModal.addEventListener('click', (e) => {
-            if (e.target === snapshotModal) {
-                hideModal(snapshotModal);
-            }
-        });
-        
-        // グローバル関数を定義（グローバルスコープでアクセスできるように）
-        window.handleStreamError = handleStreamError;
-        window.refreshStream = refreshStream;
-        
-        // ページロード時にカメラ情報を取得
-        document.addEventListener('DOMContentLoaded', () => {
-            fetchCameras();
-            
-            // 1分ごとに自動更新（ストリーミングタブがアクティブの場合のみ）
-            setInterval(() => {
-                if (currentTab === 'streaming') {
-                    fetchCameras();
-                }
-            }, 60000);
-        });
-    </script>
-</body>
-</html>
-"""
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ロギングの設定
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Flaskアプリの初期化
+app = Flask(__name__)
+
+# グローバル変数
+cameras = {}  # カメラノード情報を格納する辞書
+camera_lock = threading.Lock()  # スレッドセーフな操作のためのロック
+tag_index = {}  # タグ -> ノードIDの集合（camera_lockで保護）
+group_index = {}  # グループ -> ノードIDの集合（camera_lockで保護）
+indexed_keys = {}  # ノードID -> 索引に登録済みの (タグの集合, グループ)
+HEARTBEAT_TIMEOUT = 300  # 応答のないノードを一覧から削除するまでの時間（秒）
+
+# ノードの故障検出（phi accrual failure detector）の設定
+PHI_THRESHOLD = float(os.environ.get('PHI_THRESHOLD', 8.0))  # この疑わしさ（phi）を超えたノードを接続不可とする
+HEARTBEAT_WINDOW = 100  # 到着間隔の統計に使う直近のハートビート数
+HEARTBEAT_MIN_STD = 0.5  # 到着間隔の標準偏差の下限（秒）。Wi-Fiの揺らぎで誤検出しないようにする
+HEARTBEAT_ACCEPTABLE_PAUSE = 3.0  # 平均間隔に加えて許容する遅れ（秒）
+HEARTBEAT_FIRST_ESTIMATE = 30.0  # 到着間隔の統計がまだないノードの想定間隔（秒）
+MAX_LIVENESS_CHECK_INTERVAL = 30  # 故障検出の最大確認間隔（秒）
+heartbeat_history = {}  # ノードID -> {'last': 最終到着時刻, 'intervals': 到着間隔} (camera_lockで保護)
+liveness_wakeup = threading.Event()  # 新しいノードの登録時に故障検出スレッドを起こす
+
+# サーバー設定
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 5001))
+SERVER_IP = os.environ.get('SERVER_IP', '192.168.179.200')
+NODE_ID = str(uuid.uuid4())[:8]  # サーバー自身のユニークID
+NODE_NAME = os.environ.get('SERVER_NODE_NAME', 'server-camera')
+SERVER_CAMERA_GROUP = os.environ.get('SERVER_CAMERA_GROUP')  # サーバーカメラの表示グループ
+SERVER_CAMERA_TAGS = os.environ.get('SERVER_CAMERA_TAGS', '')  # サーバーカメラのタグ（カンマ区切り）
+SERVER_CAMERA_SOURCE = os.environ.get('SERVER_CAMERA_SOURCE', 'picamera2')  # サーバーカメラのバックエンド（camera_source.py を参照）
+RESOLUTION = (1280, 720)  # カメラ解像度
+TARGET_FPS = float(os.environ.get('TARGET_FPS', 30))  # サーバーカメラの目標フレームレート
+OVERRUN_LOG_INTERVAL = 10  # フレーム落ちの警告ログを出す最小間隔（秒）
+STILL_RESOLUTION = (2592, 1944)  # 静止画（スナップショット）解像度
+DATA_DIR = os.path.abspath(os.environ.get('DATA_DIR', 'data'))  # 設定や画像の保存先ディレクトリ（send_file は相対パスをアプリ基準で解決するため絶対パスにする）
+
+# ノード登録情報の永続化（再起動後にすぐ一覧を復元する）
+REGISTRY_DB = os.path.join(DATA_DIR, 'registry.db')
+REGISTRY_RETENTION = 7 * 24 * 3600  # この期間登録のないノードは復元せず、圧縮時に削除する（秒）
+REGISTRY_COMPACT_INTERVAL = 24 * 3600  # 登録情報の圧縮間隔（秒）
+REGISTRY_PROBE_TIMEOUT = 2  # 復元したノードへの確認リクエストのタイムアウト（秒）
+REGISTRY_PROBE_MAX_WORKERS = 32  # 復元したノードへの同時確認数の上限
+REGISTRY_VOLATILE_KEYS = (
+    'status', 'phi', 'fps', 'cpu_temp', 'clock_offset', 'clock_rtt',
+    'heartbeat_seq', 'last_heartbeat', 'last_checked'
+)  # 保存しない項目（再起動後はハートビートで更新される）
+registry_db = None
+registry_db_lock = threading.Lock()
+
+# 自動寸法測定の設定
+DIMENSION_CONFIG_FILE = os.path.join(DATA_DIR, 'dimension_config.json')
+LIVE_DIMENSION_REDUCTION = int(os.environ.get('LIVE_DIMENSION_REDUCTION', 2))  # ライブ計測時のデコード縮小率（1, 2, 4, 8）
+DEFAULT_DIMENSION_CONFIG = {
+    'roi': [0.0, 0.0, 1.0, 1.0],  # 測定領域（正規化座標 x, y, w, h）
+    'threshold': 'otsu',          # 'otsu'、'adaptive' または 0〜255 の固定値
+    'invert': False,              # 背景より暗い部品を検出する場合は True
+    'min_area': 2000,             # 最小輪郭面積（静止画解像度でのピクセル²）
+    'max_objects': 20,            # 返す輪郭の最大数
+    'mm_per_px': None,            # 静止画解像度での1ピクセルあたりのmm（未設定ならpx単位）
+    'auto': False                 # True の場合はすべてのスナップショットで自動測定
+}
+dimension_configs = {}  # カメラ名 -> 寸法測定設定
+dimension_config_lock = threading.Lock()
+
+# 関心領域（ROI）の設定
+ROI_FILE = os.path.join(DATA_DIR, 'roi.json')
+ROI_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+roi_presets = {}  # カメラ名 -> {ROI名: [x, y, w, h]（正規化座標）}
+roi_lock = threading.Lock()
+
+# カメラ校正の設定
+CALIBRATION_FILE = os.path.join(DATA_DIR, 'calibration.json')
+CHECKERBOARD_SIZE = tuple(int(v) for v in os.environ.get('CHECKERBOARD_SIZE', '9x6').split('x'))  # チェッカーボードの内側コーナー数（列x行）
+CHECKERBOARD_SQUARE_MM = float(os.environ.get('CHECKERBOARD_SQUARE_MM', 25.0))  # チェッカーボードのマス目の大きさ（mm）
+CHECKERBOARD_DETECT_WIDTH = 1024  # コーナー検出時の縮小幅（検出後に元解像度でサブピクセル補正する）
+MIN_CALIBRATION_VIEWS = 5  # 校正に必要な最小撮影枚数
+calibrations = {}  # カメラ名 -> カメラ内部パラメータ
+calibration_sessions = {}  # カメラ名 -> 撮影中のチェッカーボード検出結果
+undistort_maps = {}  # 解像度 -> サーバーカメラの歪み補正マップ (map1, map2)
+calibration_lock = threading.Lock()
+
+# スナップショットとアノテーションの保存設定
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshots')  # スナップショット（内容のハッシュ値で命名）
+THUMBNAIL_DIR = os.path.join(DATA_DIR, 'thumbnails')  # スナップショットのサムネイル
+SNAPSHOT_DB = os.path.join(DATA_DIR, 'snapshots.db')  # スナップショットの索引（SQLite）
+THUMBNAIL_SIZE = 320  # サムネイルの長辺（ピクセル）
+TILE_DIR = os.path.join(DATA_DIR, 'tiles')  # スナップショットのタイルピラミッド（必要になったタイルのみ生成）
+TILE_QUALITY = 85  # タイルのJPEG品質
+PYRAMID_LEVEL_CACHE_SIZE = 6  # メモリに保持する縮小レベル画像の数
+ANNOTATION_DIR = os.path.join(DATA_DIR, 'annotations')  # アノテーション（スナップショットID単位）
+SNAPSHOT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+TILE_SIZE = 256  # タイルの一辺（ピクセル）
+ANNOTATION_OVERLAY_CACHE_SIZE = 4  # キャッシュするフル解像度オーバーレイの数
+ANNOTATION_TILE_CACHE_SIZE = 1024  # キャッシュするオーバーレイタイルの数
+annotation_lock = threading.Lock()
+annotation_overlays = OrderedDict()  # (スナップショットID, 版) -> フル解像度BGRAオーバーレイ
+annotation_tiles = OrderedDict()  # (スナップショットID, 版, レベル, 列, 行) -> PNGバイト列
+pyramid_levels = OrderedDict()  # (スナップショットID, レベル) -> 縮小済み画像
+pyramid_lock = threading.Lock()
+snapshot_db = None  # スナップショット索引のDB接続
+snapshot_db_lock = threading.Lock()
+SNAPSHOT_COALESCE_WINDOW = float(os.environ.get('SNAPSHOT_COALESCE_WINDOW', 1.0))  # この秒数内の同じスナップショット要求は結果を共有
+snapshot_flights = {}  # (ノードID, ROI) -> 実行中または直近のスナップショット取得
+snapshot_flight_lock = threading.Lock()
+
+# ノードごとのライブサムネイルのキャッシュ（/api/thumbnail、ダッシュボードのカードや画面外のタイルで使用）
+LIVE_THUMBNAIL_REFRESH_INTERVAL = float(os.environ.get('LIVE_THUMBNAIL_REFRESH_INTERVAL', 10))  # バックグラウンドで更新する間隔（秒）
+LIVE_THUMBNAIL_TTL = 120.0  # この秒数要求のなかったサムネイルは破棄し、更新も止める
+LIVE_THUMBNAIL_CACHE_SIZE = 64  # 保持するノード数の上限（超えた場合は最も長く要求のないものから破棄）
+LIVE_THUMBNAIL_WORKERS = 8  # 更新時に並行して取得するノード数
+LIVE_THUMBNAIL_QUALITY = 70
+live_thumbnails = OrderedDict()  # ノードID -> {'jpeg', 'updated', 'requested'}（要求の古い順）
+live_thumbnail_lock = threading.Lock()
+
+# 全カメラを1枚に並べたモザイク配信（/mosaic）
+MOSAIC_FPS = float(os.environ.get('MOSAIC_FPS', 5))  # 既定のフレームレート
+MOSAIC_MAX_FPS = 15
+MOSAIC_COLUMNS = int(os.environ.get('MOSAIC_COLUMNS', 0))  # 既定の列数（0の場合は台数から自動決定）
+MOSAIC_TILE_SIZE = (320, 180)  # 1台分のタイル（幅, 高さ）
+MOSAIC_QUALITY = 70
+MOSAIC_SOURCE_PROFILE = 'thumb'  # ノードに要求する縮小配信のプロファイル
+MOSAIC_SOURCE_IDLE = 10.0  # モザイクの視聴者がいなくなってからノードの受信を止めるまでの秒数
+MOSAIC_STALE_AFTER = 5.0  # これより古いフレームはオフライン扱い
+MOSAIC_SOURCE_MAX_BUFFER = 2 * 1024 * 1024  # 縮小配信の受信バッファの上限（バイト）
+mosaic_sources = {}  # ノードID -> 縮小配信の受信状態
+mosaic_lock = threading.Lock()
+
+# ローカルカメラ変数
+frame = None
+frame_timestamp = None  # 最新フレームの取得時刻
+frame_updated_at = None  # 最新フレームを受け取ったサーバー時刻（ステータス判定用）
+frame_lock = threading.Lock()
+camera = None  # サーバーカメラ
+server_camera_lock = threading.Lock()  # 静止画モードへの切り替え中にフレームを取得しないようにする
+camera_running = False  # キャプチャループの継続フラグ（キャプチャループ側だけが管理する）
+SERVER_FRAME_STALE_TIMEOUT = 5  # 最新フレームがこれより古ければサーバーカメラを異常とみなす（秒）
+
+# 同期撮影の設定
+RING_BUFFER_SIZE = int(os.environ.get('RING_BUFFER_SIZE', 15))  # サーバーカメラで保持する直近フレーム数
+CAPTURE_ALL_DELAY = 0.3  # 一括撮影の目標時刻までの既定の猶予（秒）。全ノードへの配信にかかる時間より長くする
+CAPTURE_ALL_MAX_WORKERS = 32  # 一括撮影の同時リクエスト数の上限
+MAX_CAPTURE_WAIT = 5.0  # 同期撮影で目標時刻を待つ最大時間（秒）
+MAX_CAPTURE_SKEW = float(os.environ.get('MAX_CAPTURE_SKEW', 1.0))  # 同期撮影で目標時刻からこれ以上離れたフレームは失敗扱い（秒）
+CONFIG_MAX_WORKERS = 32  # 設定の一括変更の同時リクエスト数の上限
+CONFIG_TIMEOUT = 10  # 設定変更のタイムアウト（秒）。解像度変更ではカメラの再構成を待つ
+# 複数ノードへの一括コマンド（/api/fleet/command）
+FLEET_COMMANDS = {
+    'health': ('GET', '/api/health'),
+    'info': ('GET', '/api/info'),
+    'metrics': ('GET', '/api/metrics?format=json'),
+    'config': ('POST', '/api/config'),
+    'restart': ('POST', '/api/restart'),
+}  # ノードのAPIをそのまま呼ぶコマンド（他に snapshot と calibration_capture はサーバー側で処理）
+FLEET_COMMAND_MAX_WORKERS = 64  # 同時に実行するノード数の上限
+FLEET_COMMAND_DEFAULT_WORKERS = 16
+FLEET_COMMAND_TIMEOUT = 5.0  # ノードごとの既定のタイムアウト（秒）
+FLEET_COMMAND_MAX_TIMEOUT = 60.0
+frame_buffer = deque(maxlen=RING_BUFFER_SIZE)  # サーバーカメラの直近フレーム (取得時刻, 画像)
+frame_condition = threading.Condition(frame_lock)  # サーバーカメラの新しいフレームの到着通知
+
+# UDPハートビートの設定
+UDP_HEARTBEAT_PORT = int(os.environ.get('UDP_HEARTBEAT_PORT', 5002))  # UDPハートビートの受信ポート（0で無効）
+# データグラム形式（camera_node.pyと一致させること）
+#   マジック, バージョン, ノードID, ステータス, シーケンス番号, ノード情報のCRC32, 送信時刻, FPS, CPU温度,
+#   時刻オフセット, 往復遅延
+HEARTBEAT_FORMAT = '!4sB8sBIIdffdf'
+HEARTBEAT_MAGIC = b'SBHB'
+HEARTBEAT_SIZE = struct.calcsize(HEARTBEAT_FORMAT)
+#   マジック, バージョン, フラグ, t0（ノード送信時刻）, t1（サーバー受信時刻）, t2（サーバー送信時刻）
+HEARTBEAT_ACK_FORMAT = '!4sBBddd'
+HEARTBEAT_ACK_MAGIC = b'SBHA'
+HEARTBEAT_VERSION = 1
+ACK_FLAG_REGISTER = 0x01  # ノードにHTTPでの再登録を要求
+STATUS_NAMES = {0: 'initializing', 1: 'running', 2: 'error'}
+
+# ノード検出の設定
+DISCOVERY_PORT = int(os.environ.get('DISCOVERY_PORT', 5003))  # ノード検出用のUDPポート（0で無効）
+DISCOVERY_ANNOUNCE_COUNT = 3  # 起動時に通知をブロードキャストする回数（取りこぼし対策）
+# データグラム形式（camera_node.pyと一致させること）
+#   マジック, バージョン, HTTPポート, UDPハートビートポート
+DISCOVERY_FORMAT = '!4sBHH'
+DISCOVERY_QUERY_MAGIC = b'SBDQ'  # ノード -> ブロードキャスト: サーバーの問い合わせ
+DISCOVERY_REPLY_MAGIC = b'SBDR'  # サーバー -> ノード: 問い合わせへの応答
+DISCOVERY_ANNOUNCE_MAGIC = b'SBAN'  # サーバー -> ブロードキャスト: 起動の通知
+DISCOVERY_VERSION = 1
+
+# フリートメトリクスの設定
+FLEET_SCRAPE_INTERVAL = int(os.environ.get('FLEET_SCRAPE_INTERVAL', 10))  # ノードのメトリクスの収集間隔（秒）
+FLEET_SCRAPE_TIMEOUT = 3  # 1ノードあたりの収集タイムアウト（秒）
+FLEET_SCRAPE_MAX_WORKERS = 16  # 同時に収集するノード数の上限
+FLEET_ROLLUP_INTERVAL = 300  # 24時間分の系列に集約する間隔（秒）
+FLEET_RANGES = {
+    '1h': 3600 // FLEET_SCRAPE_INTERVAL,  # 収集間隔のまま直近1時間
+    '24h': 86400 // FLEET_ROLLUP_INTERVAL,  # 5分平均で直近24時間
+}
+# 時系列に記録する項目
+FLEET_FIELDS = (
+    'fps', 'cpu_temp', 'throttled', 'stream_clients', 'bytes_per_sec',
+    'dropped_per_sec', 'capture_errors_per_sec', 'capture_ms', 'encode_ms', 'frame_kb'
+)
+FLEET_TEMP_ALERT = float(os.environ.get('FLEET_TEMP_ALERT', 80.0))  # 過熱とみなすCPU温度（℃）
+FLEET_DROP_ALERT = 1.0  # フレーム落ちとみなす取りこぼし数（フレーム/秒）
+FLEET_NETWORK_ALERT = float(os.environ.get('FLEET_NETWORK_ALERT', 5e6))  # 帯域逼迫とみなす送信量（バイト/秒）
+fleet_series = {}  # ノードID -> 時系列と直近の収集結果
+fleet_lock = threading.Lock()
+
+# --- ダッシュボードアセット ---
+# HTML/CSS/JSは dashboard/ に分離し、起動時に一度だけハッシュ化・圧縮して配信する
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard')
+ASSET_FILES = {
+    '__DASHBOARD_CSS__': ('dashboard.css', 'text/css; charset=utf-8'),
+    '__DASHBOARD_JS__': ('dashboard.js', 'application/javascript; charset=utf-8'),
+}
+ASSET_ENCODINGS = ('br', 'gzip')  # 優先順（brotliは導入されている場合のみ）
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+assets = {}  # 公開ファイル名 -> アセット（内容ハッシュ入りの名前なので長期キャッシュ可能）
+dashboard_index = None  # ダッシュボードのHTML（URLが固定のため毎回ETagで再検証させる）
+logo_asset = None
+
+# --- ダッシュボードアセット ---
+
+# 圧縮済みの本文を用意したアセットを作成
+def make_asset(data, content_type, compress=True):
+    bodies = {'identity': data}
+    if compress:
+        bodies['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(data, quality=11)
+    return {
+        'content_type': content_type,
+        'etag': hashlib.sha256(data).hexdigest()[:16],
+        'bodies': bodies
+    }
+
+# ロゴ画像を生成
+def render_logo():
+    img = np.ones((50, 150, 3), dtype=np.uint8) * 255
+    cv2.putText(img, "SCIEN", (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 98, 204), 2)
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes()
+
+# dashboard/ のファイルを読み込み、ハッシュ付きの名前で公開する
+def build_assets():
+    global assets, dashboard_index, logo_asset
+    
+    built = {}
+    with open(os.path.join(ASSET_DIR, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    
+    for placeholder, (filename, content_type) in ASSET_FILES.items():
+        with open(os.path.join(ASSET_DIR, filename), 'rb') as f:
+            asset = make_asset(f.read(), content_type)
+        stem, ext = os.path.splitext(filename)
+        name = f"{stem}.{asset['etag'][:12]}{ext}"
+        built[name] = asset
+        html = html.replace(placeholder, f'/assets/{name}')
+    
+    # PNGは圧縮済みなのでそのまま配信
+    logo_asset = make_asset(render_logo(), 'image/png', compress=False)
+    logo_name = f"logo.{logo_asset['etag'][:12]}.png"
+    built[logo_name] = logo_asset
+    html = html.replace('/static/logo.png', f'/assets/{logo_name}')
+    
+    assets = built
+    dashboard_index = make_asset(html.encode('utf-8'), 'text/html; charset=utf-8')
+    
+    sizes = ', '.join(
+        f"{name}: {len(asset['bodies']['identity'])}→{min(len(b) for b in asset['bodies'].values())}B"
+        for name, asset in built.items()
+    )
+    logger.info(f"ダッシュボードアセットを構築しました ({sizes})")
+
+# Accept-Encodingに応じて圧縮済み本文を返す（If-None-Matchには304で応答）
+def asset_response(asset, cache_control):
+    encoding = 'identity'
+    for candidate in ASSET_ENCODINGS:
+        if candidate in asset['bodies'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    
+    response = Response(asset['bodies'][encoding], content_type=asset['content_type'])
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    if len(asset['bodies']) > 1:
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    # 圧縮形式ごとに表現が異なるためETagも分ける
+    response.set_etag(f"{asset['etag']}-{encoding}")
+    return response.make_conditional(request)
 
 # --- 内部ヘルパー関数 ---
 
 # ノードの活性チェック
 def is_node_alive(node_info):
-    last_heartbeat = node_info.get('last_heartbeat', 0)
-    return (time.time() - last_heartbeat) < HEARTBEAT_TIMEOUT
+    history = heartbeat_history.get(node_info.get('id'))
+    if history is None:
+        return False
+    return compute_phi(history, time.time()) < PHI_THRESHOLD
+
+# ハートビートの到着を記録（camera_lockを保持して呼ぶ）
+def record_heartbeat(node_id, arrival):
+    history = heartbeat_history.get(node_id)
+    if history is None:
+        heartbeat_history[node_id] = {'last': arrival, 'intervals': deque(maxlen=HEARTBEAT_WINDOW)}
+        liveness_wakeup.set()
+        return
+    
+    interval = arrival - history['last']
+    history['last'] = arrival
+    if interval > 0:
+        history['intervals'].append(interval)
+
+# 到着間隔の平均と標準偏差
+def heartbeat_stats(history):
+    intervals = history['intervals']
+    if not intervals:
+        return HEARTBEAT_FIRST_ESTIMATE, HEARTBEAT_FIRST_ESTIMATE / 4
+    mean = sum(intervals) / len(intervals)
+    std = math.sqrt(sum((x - mean) ** 2 for x in intervals) / len(intervals))
+    return mean, max(std, HEARTBEAT_MIN_STD)
+
+# 到着間隔を正規分布とみなし、最後のハートビートからの経過時間に対する疑わしさ phi = -log10(P(まだ届かない)) を算出
+def compute_phi(history, now):
+    mean, std = heartbeat_stats(history)
+    y = (now - history['last'] - mean - HEARTBEAT_ACCEPTABLE_PAUSE) / std
+    p_later = 0.5 * math.erfc(y / math.sqrt(2))
+    return -math.log10(max(p_later, 1e-300))
+
+# phiが閾値に達する標準化偏差（二分法で求める）
+def phi_threshold_deviation(threshold):
+    low, high = -10.0, 40.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if -math.log10(max(0.5 * math.erfc(mid / math.sqrt(2)), 1e-300)) < threshold:
+            low = mid
+        else:
+            high = mid
+    return high
+
+PHI_THRESHOLD_DEVIATION = phi_threshold_deviation(PHI_THRESHOLD)
+
+# 次のハートビートが届かなければphiが閾値に達する時刻
+def suspicion_deadline(history):
+    mean, std = heartbeat_stats(history)
+    return history['last'] + mean + HEARTBEAT_ACCEPTABLE_PAUSE + std * PHI_THRESHOLD_DEVIATION
+
+# ノードのエンドポイントの基準URL（1台のノードが複数のカメラを持つ場合は /cam/<番号> まで含む）
+def node_base_url(node):
+    return f"http://{node['ip']}:{node['port']}{node.get('path') or ''}"
 
 # ノードにリクエストを送信する関数
 def request_node(node_id, endpoint, method='GET', data=None, timeout=3):
@@ -2401,15 +386,12 @@ def request_node(node_id, endpoint, method='GET', data=None, timeout=3):
         return None, 'Node not found'
     
     node = cameras[node_id]
-    url = f"http://{node['ip']}:{node['port']}{endpoint}"
+    url = f"{node_base_url(node)}{endpoint}"
     
     try:
-        if method == 'GET':
-            response = requests.get(url, timeout=timeout)
-        elif method == 'POST':
-            response = requests.post(url, json=data, timeout=timeout)
-        else:
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
             return None, f'Unsupported method: {method}'
+        response = requests.request(method, url, json=data, timeout=timeout)
         
         return response.json() if response.status_code == 200 else None, response.status_code
     
@@ -2417,64 +399,326 @@ def request_node(node_id, endpoint, method='GET', data=None, timeout=3):
         logger.error(f"ノード {node_id} へのリクエストエラー: {e}")
         return None, str(e)
 
-# ノードのクリーンアップを行うスレッド
-def cleanup_thread():
-    while True:
-        try:
-            current_time = time.time()
+# --- カメラの索引 ---
+
+# タグを重複のない文字列のリストに正規化（カンマ区切りの文字列や、その要素を含むリストも受け付ける）
+def normalize_tags(tags):
+    if isinstance(tags, str):
+        tags = [tags]
+    if not isinstance(tags, (list, tuple)):
+        return []
+    return sorted({tag.strip() for value in tags for tag in str(value).split(',') if tag.strip()})
+
+# グループ名を正規化（前後の空白を除き、空の場合はNone）
+def normalize_group(group):
+    if group is None:
+        return None
+    return str(group).strip() or None
+
+# ノードのタグ・グループの索引を更新（camera_lockを保持して呼ぶ。一覧から削除されたノードは索引からも外す）
+def reindex_node(node_id):
+    info = cameras.get(node_id)
+    new_tags = set(info.get('tags') or []) if info else set()
+    new_group = info.get('group') if info else None
+    old_tags, old_group = indexed_keys.pop(node_id, (set(), None))
+    
+    for tag in old_tags - new_tags:
+        tag_index[tag].discard(node_id)
+        if not tag_index[tag]:
+            del tag_index[tag]
+    for tag in new_tags - old_tags:
+        tag_index.setdefault(tag, set()).add(node_id)
+    if old_group != new_group:
+        if old_group is not None:
+            group_index[old_group].discard(node_id)
+            if not group_index[old_group]:
+                del group_index[old_group]
+        if new_group is not None:
+            group_index.setdefault(new_group, set()).add(node_id)
+    
+    if info is not None:
+        indexed_keys[node_id] = (new_tags, new_group)
+
+# すべてのタグとグループに一致するノードIDの集合（条件がなければNone。camera_lockを保持して呼ぶ）
+def lookup_nodes(tags=(), group=None):
+    sets = [tag_index.get(tag, set()) for tag in tags]
+    if group:
+        sets.append(group_index.get(group, set()))
+    if not sets:
+        return None
+    sets.sort(key=len)
+    return sets[0].intersection(*sets[1:])
+
+# --- ノード登録情報の永続化 ---
+
+# 登録情報のDBを開く
+def init_registry_db():
+    global registry_db
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db = sqlite3.connect(REGISTRY_DB, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS nodes (
+            node_id TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            updated REAL NOT NULL
+        )
+    ''')
+    db.commit()
+    with registry_db_lock:
+        registry_db = db
+
+# ノードの登録情報を保存（変化しやすい項目は除く）
+def save_registry_entry(node_id, info):
+    if registry_db is None:
+        return
+    stored = {k: v for k, v in info.items() if k not in REGISTRY_VOLATILE_KEYS}
+    try:
+        with registry_db_lock:
+            registry_db.execute(
+                'INSERT INTO nodes (node_id, info, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(node_id) DO UPDATE SET info = excluded.info, updated = excluded.updated',
+                (node_id, json.dumps(stored, ensure_ascii=False), info.get('last_heartbeat') or time.time())
+            )
+            registry_db.commit()
+    except sqlite3.Error as e:
+        logger.error(f"ノード {node_id} の登録情報の保存エラー: {e}")
+
+# ノードの登録情報を削除
+def delete_registry_entries(node_ids):
+    if registry_db is None or not node_ids:
+        return
+    try:
+        with registry_db_lock:
+            registry_db.executemany('DELETE FROM nodes WHERE node_id = ?', [(node_id,) for node_id in node_ids])
+            registry_db.commit()
+    except sqlite3.Error as e:
+        logger.error(f"登録情報の削除エラー: {e}")
+
+# 保存期間を過ぎた登録情報を削除してDBを圧縮
+def compact_registry():
+    if registry_db is None:
+        return
+    try:
+        with registry_db_lock:
+            removed = registry_db.execute(
+                'DELETE FROM nodes WHERE updated < ?', (time.time() - REGISTRY_RETENTION,)
+            ).rowcount
+            registry_db.commit()
+            registry_db.execute('VACUUM')
+            registry_db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        logger.info(f"登録情報を圧縮しました（{removed} 件削除）")
+    except sqlite3.Error as e:
+        logger.error(f"登録情報の圧縮エラー: {e}")
+
+# 保存済みの登録情報を「未確認」として読み込み、復元したノードIDを返す
+def load_registry():
+    with registry_db_lock:
+        rows = registry_db.execute(
+            'SELECT node_id, info, updated FROM nodes WHERE updated >= ?', (time.time() - REGISTRY_RETENTION,)
+        ).fetchall()
+    
+    restored = []
+    with camera_lock:
+        for node_id, info_json, updated in rows:
+            if node_id in cameras:
+                continue
+            info = json.loads(info_json)
+            info['status'] = 'unverified'
+            info['last_heartbeat'] = updated
+            cameras[node_id] = info
+            reindex_node(node_id)
+            restored.append(node_id)
+    logger.info(f"保存済みのノード {len(restored)} 台を復元しました")
+    return restored
+
+# 復元したノードに直接問い合わせる（応答がなければNone）
+def probe_node(node_id):
+    node = cameras.get(node_id)
+    if node is None:
+        return node_id, None
+    try:
+        response = requests.get(f"{node_base_url(node)}/api/info", timeout=REGISTRY_PROBE_TIMEOUT)
+        return node_id, response.json() if response.status_code == 200 else None
+    except (requests.exceptions.RequestException, ValueError):
+        return node_id, None
+
+# 復元したノードを並行して確認し、応答したノードは稼働中として扱う
+def probe_restored_nodes(node_ids):
+    if not node_ids:
+        return
+    
+    verified = 0
+    stale = []
+    with ThreadPoolExecutor(max_workers=min(REGISTRY_PROBE_MAX_WORKERS, len(node_ids))) as executor:
+        for future in as_completed([executor.submit(probe_node, node_id) for node_id in node_ids]):
+            node_id, node_info = future.result()
+            now = time.time()
             with camera_lock:
-                # タイムアウトしたノードを特定（サーバー自身は除外）
-                timed_out_nodes = [
-                    node_id for node_id, info in cameras.items()
-                    if (current_time - info.get('last_heartbeat', 0) > HEARTBEAT_TIMEOUT) and (node_id != NODE_ID)
-                ]
+                info = cameras.get(node_id)
+                if info is None or info.get('status') != 'unverified':
+                    continue  # 確認中にハートビートや再登録があった
                 
-                # タイムアウトしたノードを削除
-                for node_id in timed_out_nodes:
-                    logger.info(f"ノード {node_id} ({cameras[node_id].get('name', 'unknown')}) がタイムアウトしました")
+                if node_info is not None and node_info.get('id') == node_id:
+                    info.update({k: v for k, v in node_info.items() if k not in ('ip', 'last_heartbeat')})
+                    info['last_heartbeat'] = now
+                    record_heartbeat(node_id, now)
+                    verified += 1
+                elif node_info is not None:
+                    # ノードが再起動してIDが変わっている（新しいIDで登録し直される）
                     cameras.pop(node_id, None)
+                    reindex_node(node_id)
+                    stale.append(node_id)
+                else:
+                    # 応答がない場合は最後の登録時刻を基準に通常のタイムアウト処理に任せる
+                    heartbeat_history[node_id] = {'last': info['last_heartbeat'], 'intervals': deque(maxlen=HEARTBEAT_WINDOW)}
+                    liveness_wakeup.set()
+    
+    delete_registry_entries(stale)
+    logger.info(f"復元したノードの確認が完了しました（稼働中 {verified} 台 / {len(node_ids)} 台）")
+
+# 登録情報を定期的に圧縮するスレッド
+def registry_compaction_thread():
+    while True:
+        time.sleep(REGISTRY_COMPACT_INTERVAL)
+        compact_registry()
+
+# UDPハートビートを処理し、(応答のフラグ, ノード送信時刻) を返す（不正なデータグラムの場合はNone）
+def handle_udp_heartbeat(data, received_at):
+    if len(data) != HEARTBEAT_SIZE:
+        return None
+    (magic, version, node_id, status, seq, info_crc, sent_at,
+     fps, cpu_temp, clock_offset, clock_rtt) = struct.unpack(HEARTBEAT_FORMAT, data)
+    if magic != HEARTBEAT_MAGIC or version != HEARTBEAT_VERSION:
+        return None
+    node_id = node_id.rstrip(b'\0').decode('ascii', errors='replace')
+    
+    with camera_lock:
+        info = cameras.get(node_id)
+        # 未登録のノード、またはノード情報が変わっている場合はHTTPでの再登録を要求
+        if info is None or info.get('info_crc') != info_crc:
+            return ACK_FLAG_REGISTER, sent_at
+        
+        record_heartbeat(node_id, received_at)
+        info['last_heartbeat'] = received_at
+        info['status'] = STATUS_NAMES.get(status, 'unknown')
+        info['heartbeat_seq'] = seq
+        info['fps'] = round(fps, 2)
+        info['cpu_temp'] = None if math.isnan(cpu_temp) else round(cpu_temp, 1)
+        info['clock_offset'] = clock_offset
+        info['clock_rtt'] = None if math.isnan(clock_rtt) else clock_rtt
+    return 0, sent_at
+
+# UDPハートビートを受信するスレッド
+def udp_heartbeat_thread():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('0.0.0.0', UDP_HEARTBEAT_PORT))
+    logger.info(f"UDPハートビートの受信を開始します: ポート {UDP_HEARTBEAT_PORT}")
+    
+    while True:
+        try:
+            data, address = sock.recvfrom(256)
+            received_at = time.time()
+            result = handle_udp_heartbeat(data, received_at)
+            if result is None:
+                continue
+            
+            # 送信時刻をそのまま返し、ノード側で時刻オフセットを計算できるようにする
+            flags, sent_at = result
+            ack = struct.pack(HEARTBEAT_ACK_FORMAT, HEARTBEAT_ACK_MAGIC, HEARTBEAT_VERSION, flags, sent_at, received_at, time.time())
+            sock.sendto(ack, address)
+        except Exception as e:
+            logger.error(f"UDPハートビートの処理エラー: {e}")
+
+# ノード検出の問い合わせに応答するスレッド
+# 起動時に通知をブロードキャストし、稼働中のノードにすぐ再登録してもらう
+def discovery_thread():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(('', DISCOVERY_PORT))
+    logger.info(f"ノード検出の応答を開始します: ポート {DISCOVERY_PORT}")
+    
+    announce = struct.pack(DISCOVERY_FORMAT, DISCOVERY_ANNOUNCE_MAGIC, DISCOVERY_VERSION, SERVER_PORT, UDP_HEARTBEAT_PORT)
+    for _ in range(DISCOVERY_ANNOUNCE_COUNT):
+        try:
+            sock.sendto(announce, ('<broadcast>', DISCOVERY_PORT))
+        except OSError as e:
+            logger.warning(f"起動通知の送信エラー: {e}")
+        time.sleep(0.2)
+    
+    reply = struct.pack(DISCOVERY_FORMAT, DISCOVERY_REPLY_MAGIC, DISCOVERY_VERSION, SERVER_PORT, UDP_HEARTBEAT_PORT)
+    while True:
+        try:
+            data, address = sock.recvfrom(64)
+            if len(data) != struct.calcsize(DISCOVERY_FORMAT):
+                continue
+            magic, version, _, _ = struct.unpack(DISCOVERY_FORMAT, data)
+            if magic != DISCOVERY_QUERY_MAGIC or version != DISCOVERY_VERSION:
+                continue
+            logger.debug(f"ノード検出の問い合わせに応答します: {address[0]}")
+            sock.sendto(reply, address)
+        except Exception as e:
+            logger.error(f"ノード検出の処理エラー: {e}")
+
+# ノードの故障検出とクリーンアップを行うスレッド
+# 固定間隔で巡回せず、いずれかのノードのphiが閾値に達する時刻まで待機する
+def cleanup_thread():
+    while True:
+        current_time = time.time()
+        next_check = current_time + MAX_LIVENESS_CHECK_INTERVAL
+        timed_out = []
+        try:
+            with camera_lock:
+                for node_id, info in list(cameras.items()):
+                    if node_id == NODE_ID:
+                        continue  # サーバー自身はスキップ
+                    
+                    history = heartbeat_history.get(node_id)
+                    if history is None:
+                        continue
+                    
+                    phi = compute_phi(history, current_time)
+                    info['phi'] = round(phi, 2)
+                    if phi < PHI_THRESHOLD:
+                        next_check = min(next_check, suspicion_deadline(history))
+                        continue
+                    
+                    # 長時間応答のないノードを削除
+                    if current_time - history['last'] > HEARTBEAT_TIMEOUT:
+                        logger.info(f"ノード {node_id} ({info.get('name', 'unknown')}) がタイムアウトしました")
+                        cameras.pop(node_id, None)
+                        reindex_node(node_id)
+                        heartbeat_history.pop(node_id, None)
+                        with live_thumbnail_lock:
+                            live_thumbnails.pop(node_id, None)
+                        timed_out.append(node_id)
+                        continue
+                    
+                    if info.get('status') != 'unreachable':
+                        logger.warning(f"ノード {node_id} ({info.get('name', 'unknown')}) からのハートビートが途絶えました (phi={phi:.1f})")
+                        info['status'] = 'unreachable'
+                    next_check = min(next_check, history['last'] + HEARTBEAT_TIMEOUT)
                 
                 # サーバー自身のハートビートを更新
                 if NODE_ID in cameras:
                     cameras[NODE_ID]['last_heartbeat'] = current_time
-                    cameras[NODE_ID]['status'] = 'running' if camera_running else 'error'
-                
-                # 各ノードのステータスを更新（サーバー自身は除外）
-                for node_id, info in list(cameras.items()):
-                    if node_id == NODE_ID:
-                        continue  # サーバー自身はスキップ
-                        
-                    # 30秒ごとにヘルスチェック
-                    if current_time - info.get('last_checked', 0) > 30:
-                        try:
-                            response = requests.get(
-                                f"http://{info['ip']}:{info['port']}/api/health", 
-                                timeout=2
-                            )
-                            info['status'] = 'running' if response.status_code == 200 else 'error'
-                        except:
-                            info['status'] = 'unreachable'
-                        
-                        info['last_checked'] = current_time
-                        cameras[node_id] = info  # 更新
+                    cameras[NODE_ID]['status'] = server_camera_status()
         
         except Exception as e:
             logger.error(f"クリーンアップスレッドエラー: {e}")
+        delete_registry_entries(timed_out)
         
-        # 10秒待機
-        time.sleep(10)
+        # 次に確認が必要な時刻まで待機（新しいノードが登録されたらすぐに再計算）
+        liveness_wakeup.wait(max(0.1, next_check - time.time()))
+        liveness_wakeup.clear()
 
 # カメラ初期化関数（サーバー自身のカメラ）
 def initialize_camera():
     global camera_running
     try:
-        camera = Picamera2()
-        camera.configure(camera.create_preview_configuration(main={
-            "format": 'XRGB8888',
-            "size": RESOLUTION
-        }))
-        camera.start()
-        camera.set_controls({'AfMode': controls.AfModeEnum.Continuous})
+        camera = open_source(SERVER_CAMERA_SOURCE)
+        camera.start(RESOLUTION, TARGET_FPS, {'AfMode': 'continuous'})
         camera_running = True
         logger.info("サーバーカメラを初期化しました")
         return camera
@@ -2485,120 +729,1526 @@ def initialize_camera():
 
 # フレームをキャプチャするスレッド関数
 def capture_frames(camera):
-    global frame, camera_running
+    global frame, frame_timestamp, frame_updated_at
     
     logger.info("サーバーカメラのフレームキャプチャスレッドを開始しました")
     
+    # 実カメラの capture() はセンサーのフレーム完成まで待機する。センサーが目標より速い場合や、すぐに返るソースでは残り時間を待つ
+    budget = 1.0 / TARGET_FPS
+    deadline = time.perf_counter()
+    last_frame_at = None
+    overruns_since_log = 0
+    last_overrun_log = 0
+    
     while camera_running:
         try:
-            # フレームのキャプチャ
-            img = camera.capture_array()
+            # フレームのキャプチャ（BGRに変換済みの画像と露光時刻を受け取る）
+            with server_camera_lock:
+                img, timestamp = camera.capture()
             
-            # 必要に応じてBGRに変換
-            channels = 1 if len(img.shape) == 2 else img.shape[2]
-            if channels == 1:
-                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-            elif channels == 4:
-                img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            # 歪み補正（校正済みの場合のみ）
+            img = undistort(img)
             
             # グローバルフレームの更新
             with frame_lock:
                 frame = img
-            
-            # フレームレートの制御
-            time.sleep(0.03)  # 約30FPS
+                frame_timestamp = timestamp
+                frame_updated_at = time.time()
+                frame_buffer.append((frame_timestamp, img))
+                frame_condition.notify_all()
+            
+            # 予定より1.5フレーム以上遅れたら取りこぼしとして数える
+            now = time.perf_counter()
+            if last_frame_at is not None and now - last_frame_at > budget * 1.5:
+                overruns_since_log += int(round((now - last_frame_at) / budget)) - 1
+            last_frame_at = now
+            if overruns_since_log and now - last_overrun_log >= OVERRUN_LOG_INTERVAL:
+                logger.warning(f"サーバーカメラのフレーム取得が目標 {TARGET_FPS}FPS に間に合っていません（直近 {overruns_since_log} フレーム分の遅れ）")
+                overruns_since_log = 0
+                last_overrun_log = now
+            
+            # 次の締め切りまで待機（遅れている場合は待たずに締め切りを現在時刻に合わせ直す）
+            deadline += budget
+            if deadline > now:
+                time.sleep(deadline - now)
+            else:
+                deadline = now
         
         except Exception as e:
             logger.error(f"サーバーカメラのフレームキャプチャエラー: {e}")
             time.sleep(1)
     
-    logger.info("サーバーカメラのフレームキャプチャスレッドを停止しました")
+    logger.info("サーバーカメラのフレームキャプチャスレッドを停止しました")
+
+# ストリーミング用のフレーム生成（サーバーカメラ用）
+def generate_frames(roi=None):
+    global frame
+    
+    while True:
+        # フレームが利用可能になるまで待機
+        if frame is None:
+            time.sleep(0.1)
+            continue
+        
+        try:
+            # 最新のフレームを取得
+            with frame_lock:
+                img = frame.copy()
+            
+            # フレームをJPEGとしてエンコード
+            ret, buffer = cv2.imencode('.jpg', crop_roi(img, roi), [cv2.IMWRITE_JPEG_QUALITY, 70])
+            if not ret:
+                continue
+            
+            # MJPEGフォーマットでフレームを返す
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+        
+        except Exception as e:
+            logger.error(f"サーバーカメラのフレーム生成エラー: {e}")
+            time.sleep(0.5)
+
+# サーバー自身をカメラノードとして登録
+def register_server_camera():
+    global cameras
+    
+    server_info = {
+        'id': NODE_ID,
+        'name': NODE_NAME,
+        'group': normalize_group(SERVER_CAMERA_GROUP),
+        'tags': normalize_tags(SERVER_CAMERA_TAGS),
+        'ip': SERVER_IP,
+        'port': SERVER_PORT,
+        'status': server_camera_status(),
+        'resolution': RESOLUTION,
+        'last_heartbeat': time.time(),
+        'last_checked': time.time()
+    }
+    
+    with camera_lock:
+        cameras[NODE_ID] = server_info
+        reindex_node(NODE_ID)
+        logger.info(f"サーバー自身をカメラノードとして登録しました: {NODE_ID}")
+
+# サーバーカメラのステータス（キャプチャループが動作中で、最新フレームが新しい場合のみ running）
+def server_camera_status():
+    updated_at = frame_updated_at
+    if camera_running and updated_at is not None and time.time() - updated_at <= max(SERVER_FRAME_STALE_TIMEOUT, 3.0 / TARGET_FPS):
+        return 'running'
+    return 'error'
+
+# サーバー自身のカメラステータスを更新するスレッド（ステータスの表示のみ。キャプチャループの開始・停止は行わない）
+def server_camera_status_thread():
+    logger.info("サーバーカメラステータス監視スレッドを開始しました")
+    
+    while True:
+        try:
+            with camera_lock:
+                if NODE_ID in cameras:
+                    # 最新フレームの経過時間からカメラが動作しているか判定
+                    cameras[NODE_ID]['status'] = server_camera_status()
+                    
+                    # ハートビートを更新
+                    cameras[NODE_ID]['last_heartbeat'] = time.time()
+                    cameras[NODE_ID]['last_checked'] = time.time()
+        except Exception as e:
+            logger.error(f"サーバーカメラステータス更新エラー: {e}")
+        
+        time.sleep(10)
+
+# --- スナップショット ---
+
+# サーバー自身のカメラで高解像度スナップショットを撮影（raw=True の場合は歪み補正しない）
+def capture_server_snapshot(raw=False, roi=None):
+    if frame is None:
+        return None, 'No frame available', 404
+    
+    try:
+        # サーバーカメラでも高解像度撮影を試みる（動作中のカメラを一時的に静止画モードに切り替える）
+        if camera_running and camera is not None:
+            try:
+                with server_camera_lock:
+                    high_res_img, timestamp = camera.capture_still(STILL_RESOLUTION)
+                
+                # 歪み補正
+                if not raw:
+                    high_res_img = undistort(high_res_img)
+                
+                # 高解像度画像をエンコード
+                ret, buffer = cv2.imencode('.jpg', crop_roi(high_res_img, roi), [cv2.IMWRITE_JPEG_QUALITY, 95])
+                if ret:
+                    return {
+                        'success': True,
+                        'timestamp': timestamp,
+                        'image': base64.b64encode(buffer).decode('utf-8'),
+                        'undistorted': NODE_NAME in calibrations and not raw,
+                        'roi': roi
+                    }, None, 200
+            except Exception as e:
+                logger.error(f"サーバー高解像度撮影エラー: {e}")
+        
+        # ストリームフレームは常に補正済み（校正済みの場合）
+        with frame_lock:
+            img = frame
+            timestamp = frame_timestamp
+        ret, buffer = cv2.imencode('.jpg', crop_roi(img, roi), [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ret:
+            return None, 'Failed to encode image', 500
+        
+        return {
+            'success': True,
+            'timestamp': timestamp,
+            'image': base64.b64encode(buffer).decode('utf-8'),
+            'undistorted': NODE_NAME in calibrations,
+            'roi': roi
+        }, None, 200
+    
+    except Exception as e:
+        logger.error(f"サーバーカメラのスナップショットエラー: {e}")
+        return None, str(e), 500
+
+# ノードの時刻オフセット（サーバーの時刻 - ノードの時刻、未計測なら0）
+def get_clock_offset(node_id):
+    return cameras.get(node_id, {}).get('clock_offset') or 0.0
+
+# ノードの時刻をサーバーの時刻に変換
+def node_to_server_time(node_id, timestamp):
+    return timestamp + get_clock_offset(node_id)
+
+# サーバーカメラまたはノードからスナップショットを取得し (data, error, status_code) を返す
+# roi は正規化座標の (x, y, w, h)。指定した範囲だけをエンコード・転送する
+def take_snapshot(node_id, raw=False, roi=None, timeout=3):
+    # サーバー自身のカメラの場合
+    if node_id == NODE_ID:
+        return capture_server_snapshot(raw=raw, roi=roi)
+    
+    # 他のカメラノードの場合
+    if node_id not in cameras:
+        return None, 'Camera not found', 404
+    
+    params = []
+    if raw:
+        params.append('raw=1')
+    if roi:
+        params.append('roi=' + ','.join(f'{v:.6f}' for v in roi))
+    endpoint = '/api/snapshot' + ('?' + '&'.join(params) if params else '')
+    data, status = request_node(node_id, endpoint, timeout=timeout)
+    if not data:
+        return None, f'Failed to get snapshot: {status}', 500
+    
+    # ノードの時刻をサーバーの時刻基準に揃える
+    if 'timestamp' in data:
+        data['node_timestamp'] = data['timestamp']
+        data['timestamp'] = node_to_server_time(node_id, data['timestamp'])
+    return data, None, 200
+
+# 同じ条件のスナップショット要求をまとめる（実行中または直近に完了した取得があればその結果を共有する）
+# func は (data, error, status_code) を返す。失敗した結果は後続の要求と共有しない
+def coalesce_snapshot(key, func):
+    now = time.time()
+    with snapshot_flight_lock:
+        for stale_key in [k for k, f in snapshot_flights.items()
+                          if f['event'].is_set() and now - f['time'] > SNAPSHOT_COALESCE_WINDOW]:
+            del snapshot_flights[stale_key]
+        flight = snapshot_flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = {'event': threading.Event(), 'result': None, 'time': None}
+            snapshot_flights[key] = flight
+    
+    if not leader:
+        logger.debug(f"スナップショット要求を実行中の取得にまとめました: {key}")
+        flight['event'].wait()
+        return flight['result']
+    
+    try:
+        flight['result'] = func()
+    except Exception as e:
+        logger.error(f"スナップショット取得エラー: {e}")
+        flight['result'] = (None, str(e), 500)
+    flight['time'] = time.time()
+    if flight['result'][0] is None:
+        with snapshot_flight_lock:
+            if snapshot_flights.get(key) is flight:
+                del snapshot_flights[key]
+    flight['event'].set()
+    return flight['result']
+
+# スナップショットを取得して保存する（まとめられた要求はこの結果を共有する）
+def take_and_persist_snapshot(node_id, roi, purpose):
+    data, error, status_code = take_snapshot(node_id, roi=roi)
+    if data is not None:
+        # 撮影画像を内容アドレス方式で保存し、索引に登録
+        persist_snapshot(node_id, data, purpose)
+    return data, error, status_code
+
+# スナップショットIDの形式チェック（パス操作を防ぐ）
+def is_valid_snapshot_id(snapshot_id):
+    return bool(SNAPSHOT_ID_PATTERN.match(snapshot_id))
+
+# スナップショットのファイルパス（ディレクトリあたりのファイル数を抑えるため先頭2文字で分ける）
+def snapshot_path(snapshot_id):
+    return os.path.join(SNAPSHOT_DIR, snapshot_id[:2], f'{snapshot_id}.jpg')
+
+# サムネイルのファイルパス
+def thumbnail_path(snapshot_id):
+    return os.path.join(THUMBNAIL_DIR, snapshot_id[:2], f'{snapshot_id}.jpg')
+
+# 保存済みのスナップショットかどうか
+def snapshot_exists(snapshot_id):
+    return is_valid_snapshot_id(snapshot_id) and os.path.exists(snapshot_path(snapshot_id))
+
+# ファイルを一時ファイル経由で書き込む（書き込み途中のファイルが読まれないようにする）
+def write_file_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+# サムネイルを作成（縮小デコードで元画像の全画素を展開せずに済ませる）
+def create_thumbnail(jpeg_bytes):
+    img = cv2.imdecode(np.frombuffer(jpeg_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        raise ValueError('Failed to decode snapshot image')
+    scale = THUMBNAIL_SIZE / max(img.shape[:2])
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return buffer.tobytes()
+
+# JPEGとサムネイルをディスクに保存し、内容のハッシュ値をIDとして返す（同一内容は一度だけ書き込まれる）
+def store_snapshot(jpeg_bytes):
+    snapshot_id = hashlib.sha256(jpeg_bytes).hexdigest()
+    path = snapshot_path(snapshot_id)
+    if not os.path.exists(path):
+        write_file_atomic(path, jpeg_bytes)
+    if not os.path.exists(thumbnail_path(snapshot_id)):
+        write_file_atomic(thumbnail_path(snapshot_id), create_thumbnail(jpeg_bytes))
+    return snapshot_id
+
+# スナップショット索引のDBを初期化
+def init_snapshot_db():
+    global snapshot_db
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db = sqlite3.connect(SNAPSHOT_DB, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript('''
+        CREATE TABLE IF NOT EXISTS snapshots (
+            capture_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            snapshot_id TEXT NOT NULL,
+            node_id TEXT NOT NULL,
+            node_name TEXT,
+            timestamp REAL NOT NULL,
+            purpose TEXT NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            size INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_snapshots_node_time ON snapshots (node_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_snapshots_name_time ON snapshots (node_name, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_snapshots_purpose_time ON snapshots (purpose, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_snapshots_time ON snapshots (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_snapshots_id ON snapshots (snapshot_id);
+    ''')
+    db.commit()
+    with snapshot_db_lock:
+        snapshot_db = db
+    logger.info(f"スナップショット索引を開きました: {SNAPSHOT_DB}")
+
+# 撮影記録を索引に追加
+def index_snapshot(snapshot_id, node_id, node_name, timestamp, purpose, width, height, size):
+    if snapshot_db is None:
+        return
+    with snapshot_db_lock:
+        snapshot_db.execute(
+            'INSERT INTO snapshots (snapshot_id, node_id, node_name, timestamp, purpose, width, height, size) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (snapshot_id, node_id, node_name, timestamp, purpose, width, height, size)
+        )
+        snapshot_db.commit()
+
+# 撮影記録の行をAPI応答の形式に変換
+def snapshot_record(row):
+    record = dict(row)
+    record['image_url'] = f"/api/snapshots/{record['snapshot_id']}/image"
+    record['thumbnail_url'] = f"/api/snapshots/{record['snapshot_id']}/thumbnail"
+    return record
+
+# 条件に一致する撮影記録を新しい順に検索
+def query_snapshots(node_id=None, node_name=None, purpose=None, start=None, end=None, limit=100, offset=0):
+    if snapshot_db is None:
+        return []
+    
+    conditions, params = [], []
+    for column, value in (('node_id', node_id), ('node_name', node_name), ('purpose', purpose)):
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    if start is not None:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    with snapshot_db_lock:
+        rows = snapshot_db.execute(
+            f'SELECT * FROM snapshots {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+    return [snapshot_record(row) for row in rows]
+
+# JPEGのヘッダーから画像サイズを読み取る（デコードせずに済む）
+def read_jpeg_size(path):
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise ValueError('Not a JPEG file')
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError('Invalid JPEG marker')
+            length = int.from_bytes(f.read(2), 'big')
+            # SOFマーカー（DHT/JPG/DACを除く）に画像サイズが格納されている
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                header = f.read(5)
+                return int.from_bytes(header[3:5], 'big'), int.from_bytes(header[1:3], 'big')
+            f.seek(length - 2, os.SEEK_CUR)
+
+# 撮影結果を保存・索引登録し、data にIDと画像URLを追加する
+def persist_snapshot(node_id, data, purpose):
+    try:
+        jpeg_bytes = base64.b64decode(data['image'])
+        snapshot_id = store_snapshot(jpeg_bytes)
+        width, height = read_jpeg_size(snapshot_path(snapshot_id))
+        index_snapshot(
+            snapshot_id, node_id, cameras.get(node_id, {}).get('name'), data.get('timestamp', time.time()),
+            purpose, width, height, len(jpeg_bytes)
+        )
+        data['snapshot_id'] = snapshot_id
+        data['image_url'] = f'/api/snapshots/{snapshot_id}/image'
+        data['thumbnail_url'] = f'/api/snapshots/{snapshot_id}/thumbnail'
+    except Exception as e:
+        logger.error(f"スナップショットの保存エラー: {e}")
+    return data
+
+# サーバーカメラのリングバッファから目標時刻に最も近いフレームを取り出す
+def capture_server_frame_at(target_time, quality=95):
+    wait_until = min(target_time, time.time() + MAX_CAPTURE_WAIT)
+    with frame_condition:
+        while frame_timestamp is None or frame_timestamp < target_time:
+            remaining = wait_until + 0.1 - time.time()
+            if remaining <= 0:
+                break
+            frame_condition.wait(remaining)
+        candidates = list(frame_buffer)
+    
+    if not candidates:
+        return None, 'No frame available'
+    
+    timestamp, img = min(candidates, key=lambda item: abs(item[0] - target_time))
+    # カメラが止まっているなどで目標時刻に近いフレームがない場合は、古いフレームを成功として返さない
+    if abs(timestamp - target_time) > MAX_CAPTURE_SKEW:
+        return None, f'Stale frame (skew {(timestamp - target_time) * 1000:.0f}ms)'
+    
+    ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return None, 'Failed to encode image'
+    
+    return {
+        'success': True,
+        'timestamp': timestamp,
+        'target_time': target_time,
+        'skew': timestamp - target_time,
+        'image': base64.b64encode(buffer).decode('utf-8'),
+        'undistorted': NODE_NAME in calibrations
+    }, None
+
+# 1台のノードで同期撮影を行う（一括撮影の各スレッドから呼ばれる）
+def capture_node_at(node_id, target_time, quality, timeout):
+    if node_id == NODE_ID:
+        return capture_server_frame_at(target_time, quality)
+    
+    # 目標時刻はノードの時刻に変換して送り、結果はサーバーの時刻基準に戻す
+    offset = get_clock_offset(node_id)
+    data, status = request_node(
+        node_id, '/api/capture', method='POST',
+        data={'target_time': target_time - offset, 'quality': quality}, timeout=timeout
+    )
+    if data is None:
+        return None, f'Capture failed: {status}'
+    
+    data['node_timestamp'] = data['timestamp']
+    data['timestamp'] = data['timestamp'] + offset
+    data['target_time'] = target_time
+    data['skew'] = data['timestamp'] - target_time
+    # 時刻オフセットで換算した後も目標時刻から離れている場合は失敗扱い（一括撮影のずれの統計から除く）
+    if abs(data['skew']) > MAX_CAPTURE_SKEW:
+        return None, f"Stale frame (skew {data['skew'] * 1000:.0f}ms)"
+    return data, None
+
+# スナップショットのBase64画像をデコード
+def decode_snapshot_image(data):
+    buffer = np.frombuffer(base64.b64decode(data['image']), dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Failed to decode snapshot image')
+    return img
+
+# ライブ計測用に現在のフレームを縮小して取得
+def fetch_live_frame(node_id, reduction=1):
+    # 縮小率に対応したデコードフラグ（JPEGのDCTスケーリングで高速にデコードされる）
+    flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }.get(reduction, cv2.IMREAD_COLOR)
+    
+    if node_id == NODE_ID:
+        with frame_lock:
+            img = frame
+        if img is None or reduction <= 1:
+            return img
+        return cv2.resize(img, (img.shape[1] // reduction, img.shape[0] // reduction), interpolation=cv2.INTER_AREA)
+    
+    node = cameras.get(node_id)
+    if node is None:
+        return None
+    
+    try:
+        response = requests.get(f"{node_base_url(node)}/api/frame", timeout=3)
+        if response.status_code != 200:
+            return None
+        return cv2.imdecode(np.frombuffer(response.content, dtype=np.uint8), flags)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"ノード {node_id} からのフレーム取得エラー: {e}")
+        return None
+
+# --- ライブサムネイル ---
+
+# ノードの現在のフレームからサムネイルを作成（モザイク用に縮小配信を受信中であればそれを流用する）
+def capture_live_thumbnail(node_id):
+    img = None
+    with mosaic_lock:
+        source = mosaic_sources.get(node_id)
+        if source is not None and time.time() - source['time'] <= MOSAIC_STALE_AFTER:
+            img = source['frame']
+    if img is None:
+        img = fetch_live_frame(node_id, reduction=4)
+    if img is None:
+        return None
+    
+    scale = THUMBNAIL_SIZE / max(img.shape[:2])
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, LIVE_THUMBNAIL_QUALITY])
+    return buffer.tobytes()
+
+# サムネイルをキャッシュに格納（更新中に破棄されたノードは requested=None のため再追加しない）
+def store_live_thumbnail(node_id, jpeg, requested=None):
+    with live_thumbnail_lock:
+        entry = live_thumbnails.get(node_id)
+        if entry is None:
+            if requested is None:
+                return None
+            entry = {'requested': requested}
+            live_thumbnails[node_id] = entry
+        entry['jpeg'] = jpeg
+        entry['updated'] = time.time()
+        while len(live_thumbnails) > LIVE_THUMBNAIL_CACHE_SIZE:
+            live_thumbnails.popitem(last=False)
+        return dict(entry)
+
+# キャッシュ済みのサムネイルを返す（初回のみノードから取得し、以降の更新はバックグラウンドで行う）
+def get_live_thumbnail(node_id):
+    now = time.time()
+    with live_thumbnail_lock:
+        entry = live_thumbnails.get(node_id)
+        if entry is not None:
+            entry['requested'] = now
+            live_thumbnails.move_to_end(node_id)
+            return dict(entry)
+    
+    jpeg = capture_live_thumbnail(node_id)
+    if jpeg is None:
+        return None
+    return store_live_thumbnail(node_id, jpeg, requested=now)
+
+# 要求のあったサムネイルを一定間隔で更新し、期限切れのものを破棄するスレッド
+def live_thumbnail_thread():
+    while True:
+        time.sleep(LIVE_THUMBNAIL_REFRESH_INTERVAL / 2)
+        now = time.time()
+        
+        with live_thumbnail_lock:
+            for node_id in [node_id for node_id, entry in live_thumbnails.items()
+                            if now - entry['requested'] > LIVE_THUMBNAIL_TTL or node_id not in cameras]:
+                del live_thumbnails[node_id]
+            due = [node_id for node_id, entry in live_thumbnails.items()
+                   if now - entry['updated'] >= LIVE_THUMBNAIL_REFRESH_INTERVAL]
+        if not due:
+            continue
+        
+        with ThreadPoolExecutor(max_workers=LIVE_THUMBNAIL_WORKERS) as executor:
+            futures = {executor.submit(capture_live_thumbnail, node_id): node_id for node_id in due}
+            for future in as_completed(futures):
+                node_id = futures[future]
+                try:
+                    jpeg = future.result()
+                except Exception as e:
+                    logger.error(f"ノード {node_id} のサムネイル更新エラー: {e}")
+                    continue
+                if jpeg is not None:
+                    store_live_thumbnail(node_id, jpeg)
+
+# --- モザイク配信 ---
+
+# ノードの縮小MJPEG配信を受信し、最新フレームを保持する（モザイクの視聴者がいる間のみ動作）
+def mosaic_source_thread(node_id):
+    source = mosaic_sources[node_id]
+    
+    # どのような理由で終了しても登録を外し、次の視聴時に受信を開始し直せるようにする
+    try:
+        while time.time() - source['last_used'] < MOSAIC_SOURCE_IDLE:
+            node = cameras.get(node_id)
+            if node is None:
+                break
+            
+            url = f"{node_base_url(node)}/stream?profile={MOSAIC_SOURCE_PROFILE}"
+            try:
+                with requests.get(url, stream=True, timeout=5) as response:
+                    response.raise_for_status()
+                    buffer = bytearray()
+                    for chunk in response.iter_content(chunk_size=16384):
+                        buffer.extend(chunk)
+                        # JPEGの開始・終了マーカーでフレームを切り出す
+                        start = buffer.find(b'\xff\xd8')
+                        end = buffer.find(b'\xff\xd9', start + 2) if start >= 0 else -1
+                        if end >= 0:
+                            img = cv2.imdecode(np.frombuffer(bytes(buffer[start:end + 2]), dtype=np.uint8), cv2.IMREAD_COLOR)
+                            del buffer[:end + 2]
+                            if img is not None:
+                                source['frame'] = img
+                                source['time'] = time.time()
+                        elif len(buffer) > MOSAIC_SOURCE_MAX_BUFFER:
+                            # 終了マーカーが届かない壊れたストリームでメモリを使い切らないよう破棄する
+                            logger.warning(f"ノード {node_id} の縮小配信にフレームの区切りが見つからないため破棄します")
+                            buffer.clear()
+                        if time.time() - source['last_used'] >= MOSAIC_SOURCE_IDLE:
+                            break
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"ノード {node_id} の縮小配信の受信エラー: {e}")
+                time.sleep(2)
+            except Exception as e:
+                logger.error(f"ノード {node_id} の縮小配信の処理エラー: {e}")
+                time.sleep(2)
+    finally:
+        with mosaic_lock:
+            mosaic_sources.pop(node_id, None)
+        logger.debug(f"ノード {node_id} の縮小配信の受信を終了しました")
+
+# モザイクに表示するノードの最新フレーム（受信していなければ受信を開始する）
+def mosaic_frame(node_id):
+    if node_id == NODE_ID:
+        with frame_lock:
+            return frame
+    
+    now = time.time()
+    with mosaic_lock:
+        source = mosaic_sources.get(node_id)
+        if source is None:
+            source = {'frame': None, 'time': 0.0, 'last_used': now}
+            mosaic_sources[node_id] = source
+            threading.Thread(target=mosaic_source_thread, args=(node_id,), daemon=True).start()
+        source['last_used'] = now
+        if now - source['time'] > MOSAIC_STALE_AFTER:
+            return None
+        return source['frame']
+
+# モザイクに並べるノード（名前順）
+def mosaic_node_ids(group=None):
+    with camera_lock:
+        nodes = [(info.get('name') or node_id, node_id) for node_id, info in cameras.items()
+                 if group is None or info.get('group') == group]
+    return [node_id for _, node_id in sorted(nodes)]
+
+# モザイクのMJPEGを生成（キャンバスは配置が変わったときのみ確保し直し、各タイルへ直接縮小して書き込む）
+def generate_mosaic(columns, fps, group=None):
+    tile_width, tile_height = MOSAIC_TILE_SIZE
+    interval = 1.0 / fps
+    canvas = None
+    deadline = time.monotonic()
+    
+    while True:
+        try:
+            node_ids = mosaic_node_ids(group)
+            cols = columns or max(1, math.ceil(math.sqrt(len(node_ids))))
+            rows = max(1, math.ceil(len(node_ids) / cols))
+            shape = (rows * tile_height, cols * tile_width, 3)
+            if canvas is None or canvas.shape != shape:
+                canvas = np.zeros(shape, dtype=np.uint8)
+            
+            for index in range(rows * cols):
+                y, x = divmod(index, cols)
+                tile = canvas[y * tile_height:(y + 1) * tile_height, x * tile_width:(x + 1) * tile_width]
+                if index >= len(node_ids):
+                    tile[:] = 0
+                    continue
+                
+                node_id = node_ids[index]
+                img = mosaic_frame(node_id)
+                if img is None:
+                    tile[:] = 32
+                    cv2.putText(tile, 'Offline', (tile_width // 2 - 45, tile_height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (160, 160, 160), 2)
+                else:
+                    cv2.resize(img, (tile_width, tile_height), dst=tile, interpolation=cv2.INTER_AREA)
+                name = cameras.get(node_id, {}).get('name') or node_id
+                cv2.putText(tile, name, (8, tile_height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+            
+            ret, buffer = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, MOSAIC_QUALITY])
+            if ret:
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+        except Exception as e:
+            logger.error(f"モザイク生成エラー: {e}")
+        
+        # 処理時間を差し引いて次のフレーム時刻まで待機（遅れた場合は基準を現在時刻に戻す）
+        deadline += interval
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        else:
+            deadline = time.monotonic()
+
+# --- カメラ校正 ---
+
+# 保存済みのカメラ内部パラメータを読み込む
+def load_calibrations():
+    global calibrations
+    if not os.path.exists(CALIBRATION_FILE):
+        return
+    
+    try:
+        with open(CALIBRATION_FILE, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        with calibration_lock:
+            calibrations = loaded
+            undistort_maps.clear()
+        logger.info(f"カメラ内部パラメータを読み込みました: {len(loaded)}台分")
+    except Exception as e:
+        logger.error(f"カメラ内部パラメータの読み込みエラー: {e}")
+
+# カメラ内部パラメータをファイルに保存（calibration_lock を保持した状態で呼ぶこと）
+def save_calibrations():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = CALIBRATION_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(calibrations, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, CALIBRATION_FILE)
+
+# サーバーカメラの指定解像度の歪み補正マップを取得（解像度ごとに一度だけ計算してキャッシュする）
+def get_undistort_maps(size):
+    with calibration_lock:
+        calibration = calibrations.get(NODE_NAME)
+        if calibration is None:
+            return None
+        
+        maps = undistort_maps.get(size)
+        if maps is None:
+            # 校正時の解像度から内部パラメータを換算（センサー全域を使うモード間でのみ厳密）
+            calib_w, calib_h = calibration['image_size']
+            camera_matrix = np.array(calibration['camera_matrix'], dtype=np.float64)
+            camera_matrix[0] *= size[0] / calib_w
+            camera_matrix[1] *= size[1] / calib_h
+            dist_coeffs = np.array(calibration['dist_coeffs'], dtype=np.float64)
+            
+            # 固定小数点形式のマップにするとremapが高速になる
+            maps = cv2.initUndistortRectifyMap(
+                camera_matrix, dist_coeffs, None, camera_matrix, size, cv2.CV_16SC2
+            )
+            undistort_maps[size] = maps
+            logger.info(f"サーバーカメラの歪み補正マップを作成しました: {size[0]}x{size[1]}")
+        
+        return maps
+
+# サーバーカメラの画像に歪み補正を適用（未校正の場合はそのまま返す）
+def undistort(img):
+    maps = get_undistort_maps((img.shape[1], img.shape[0]))
+    if maps is None:
+        return img
+    return cv2.remap(img, maps[0], maps[1], cv2.INTER_LINEAR)
+
+# チェッカーボードのコーナーを検出（縮小画像で検出し、元解像度でサブピクセル補正する）
+def find_checkerboard(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, CHECKERBOARD_DETECT_WIDTH / gray.shape[1])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+    found, corners = cv2.findChessboardCorners(small, CHECKERBOARD_SIZE, flags)
+    if not found:
+        return None
+    
+    corners = corners / scale
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    return cv2.cornerSubPix(gray, corners.astype(np.float32), (11, 11), (-1, -1), criteria)
+
+# 校正用のチェッカーボード画像を撮影して検出結果を蓄積し、(result, error, status_code) を返す
+def capture_calibration_view(node_id):
+    if node_id not in cameras:
+        return None, 'Camera not found', 404
+    
+    # 校正には歪み補正前の画像が必要
+    data, error, status_code = take_snapshot(node_id, raw=True)
+    if data is None:
+        return None, error, status_code
+    if data.get('undistorted'):
+        return None, 'Node returned an undistorted image; raw still capture failed', 500
+    
+    try:
+        img = decode_snapshot_image(data)
+        corners = find_checkerboard(img)
+    except Exception as e:
+        logger.error(f"チェッカーボード検出エラー: {e}")
+        return None, str(e), 500
+    
+    name = cameras[node_id].get('name')
+    image_size = [img.shape[1], img.shape[0]]
+    
+    with calibration_lock:
+        session = calibration_sessions.setdefault(name, {'image_points': [], 'image_size': image_size})
+        if session['image_size'] != image_size:
+            return None, f'Image size changed during calibration: {image_size}', 409
+        if corners is not None:
+            session['image_points'].append(corners)
+        views = len(session['image_points'])
+    
+    return {
+        'found': corners is not None,
+        'views': views,
+        'min_views': MIN_CALIBRATION_VIEWS,
+        'image_size': image_size
+    }, None, 200
+
+# 撮影済みのチェッカーボード画像からカメラ内部パラメータを算出して保存
+def compute_calibration(name):
+    with calibration_lock:
+        session = calibration_sessions.get(name)
+        if not session or len(session['image_points']) < MIN_CALIBRATION_VIEWS:
+            raise ValueError(f'At least {MIN_CALIBRATION_VIEWS} checkerboard views are required')
+        image_points = list(session['image_points'])
+        image_size = tuple(session['image_size'])
+    
+    # チェッカーボードの実寸座標（Z=0平面）
+    cols, rows = CHECKERBOARD_SIZE
+    object_grid = np.zeros((cols * rows, 3), np.float32)
+    object_grid[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2) * CHECKERBOARD_SQUARE_MM
+    object_points = [object_grid] * len(image_points)
+    
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+        object_points, image_points, image_size, None, None
+    )
+    
+    calibration = {
+        'id': uuid.uuid4().hex[:8],
+        'camera_matrix': camera_matrix.tolist(),
+        'dist_coeffs': dist_coeffs.ravel().tolist(),
+        'image_size': list(image_size),
+        'rms': float(rms),
+        'views': len(image_points),
+        'checkerboard': list(CHECKERBOARD_SIZE),
+        'square_mm': CHECKERBOARD_SQUARE_MM,
+        'created': time.time()
+    }
+    
+    with calibration_lock:
+        calibrations[name] = calibration
+        calibration_sessions.pop(name, None)
+        if name == NODE_NAME:
+            undistort_maps.clear()
+        save_calibrations()
+    
+    logger.info(f"カメラ {name} の校正が完了しました (RMS: {rms:.4f}px, {len(image_points)}枚)")
+    return calibration
+
+# ノードにカメラ内部パラメータを送信（None で解除）
+def push_calibration(node_id, calibration):
+    if node_id == NODE_ID:
+        return True
+    
+    data, status = request_node(node_id, '/api/calibration', method='POST', data={'calibration': calibration})
+    if data is None:
+        logger.error(f"ノード {node_id} への校正データ送信に失敗しました: {status}")
+        return False
+    
+    logger.info(f"ノード {node_id} に校正データを送信しました")
+    return True
+
+# --- タイル ---
+
+# DeepZoom形式のピラミッド情報（最大レベルがフル解像度、1レベル下がるごとに1/2）
+def pyramid_info(width, height):
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': TILE_SIZE,
+        'max_level': max_level
+    }
+
+# 指定レベルの画像サイズ
+def level_size(width, height, level):
+    scale = 2.0 ** (level - math.ceil(math.log2(max(width, height, 1))))
+    return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+# タイルに対応するフル解像度上の領域と出力サイズを計算（範囲外なら None）
+def tile_geometry(width, height, level, col, row):
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    if not 0 <= level <= max_level or col < 0 or row < 0:
+        return None
+    
+    scale = 2.0 ** (level - max_level)
+    level_w, level_h = level_size(width, height, level)
+    
+    tx0, ty0 = col * TILE_SIZE, row * TILE_SIZE
+    if tx0 >= level_w or ty0 >= level_h:
+        return None
+    tx1, ty1 = min(tx0 + TILE_SIZE, level_w), min(ty0 + TILE_SIZE, level_h)
+    
+    # フル解像度の座標に換算
+    x0, y0 = int(tx0 / scale), int(ty0 / scale)
+    x1, y1 = min(width, math.ceil(tx1 / scale)), min(height, math.ceil(ty1 / scale))
+    return (x0, y0, x1, y1), (tx1 - tx0, ty1 - ty0)
+
+# スナップショットのタイルのファイルパス
+def tile_path(snapshot_id, level, col, row):
+    return os.path.join(TILE_DIR, snapshot_id[:2], snapshot_id, str(level), f'{col}_{row}.jpg')
+
+# スナップショットの指定レベルの縮小画像を取得（最近使ったレベルはメモリに保持）
+def get_pyramid_level(snapshot_id, level, width, height):
+    key = (snapshot_id, level)
+    with pyramid_lock:
+        img = pyramid_levels.get(key)
+        if img is not None:
+            pyramid_levels.move_to_end(key)
+            return img
+    
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    target_size = level_size(width, height, level)
+    factor = 2 ** (max_level - level)
+    
+    # 1/2〜1/8 はJPEGのDCTスケーリングで直接デコードし、それより小さいレベルは1/8のレベルから縮小する
+    reduced_flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+    if factor in reduced_flags:
+        img = cv2.imread(snapshot_path(snapshot_id), reduced_flags[factor])
+        if img is None:
+            raise ValueError('Failed to read snapshot')
+    else:
+        img = get_pyramid_level(snapshot_id, max_level - 3, width, height)
+    
+    if (img.shape[1], img.shape[0]) != target_size:
+        img = cv2.resize(img, target_size, interpolation=cv2.INTER_AREA)
+    
+    with pyramid_lock:
+        pyramid_levels[key] = img
+        while len(pyramid_levels) > PYRAMID_LEVEL_CACHE_SIZE:
+            pyramid_levels.popitem(last=False)
+    return img
+
+# スナップショットのタイルを取得（未生成ならその場で生成してディスクに保存する）
+def get_snapshot_tile(snapshot_id, level, col, row):
+    path = tile_path(snapshot_id, level, col, row)
+    if os.path.exists(path):
+        return path
+    
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    if tile_geometry(width, height, level, col, row) is None:
+        return None
+    
+    img = get_pyramid_level(snapshot_id, level, width, height)
+    tile = img[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE]
+    _, buffer = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, TILE_QUALITY])
+    write_file_atomic(path, buffer.tobytes())
+    return path
+
+# --- アノテーション ---
+
+# アノテーションのファイルパス
+def annotation_path(snapshot_id):
+    return os.path.join(ANNOTATION_DIR, f'{snapshot_id}.json')
+
+# アノテーションを読み込む（存在しない場合は空）
+def load_annotation(snapshot_id):
+    path = annotation_path(snapshot_id)
+    if not os.path.exists(path):
+        return {'snapshot_id': snapshot_id, 'version': 0, 'strokes': [], 'updated': None}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# アノテーションを保存し、版を更新する（annotation_lock を保持した状態で呼ぶこと）
+def save_annotation(snapshot_id, strokes):
+    annotation = load_annotation(snapshot_id)
+    annotation['strokes'] = strokes
+    annotation['version'] += 1
+    annotation['updated'] = time.time()
+    
+    os.makedirs(ANNOTATION_DIR, exist_ok=True)
+    path = annotation_path(snapshot_id)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(annotation, f)
+    os.replace(tmp_path, path)
+    
+    # 古い版のキャッシュを破棄
+    for key in [k for k in annotation_overlays if k[0] == snapshot_id]:
+        annotation_overlays.pop(key)
+    for key in [k for k in annotation_tiles if k[0] == snapshot_id]:
+        annotation_tiles.pop(key)
+    return annotation
+
+# ストロークの形式チェックと正規化（座標はフル解像度画像のピクセル座標）
+def validate_strokes(strokes):
+    if not isinstance(strokes, list):
+        raise ValueError('strokes must be a list')
+    
+    normalized = []
+    for stroke in strokes:
+        color = stroke.get('color', '#ff0000')
+        if not isinstance(color, str) or not re.match(r'^#[0-9a-fA-F]{6}$', color):
+            raise ValueError(f'Invalid stroke color: {color}')
+        width = float(stroke.get('width', 5))
+        if not 0 < width <= 500:
+            raise ValueError(f'Invalid stroke width: {width}')
+        points = [[float(x), float(y)] for x, y in stroke.get('points', [])]
+        if points:
+            normalized.append({'color': color, 'width': width, 'points': points})
+    return normalized
+
+# ストロークをフル解像度の透過オーバーレイ（BGRA）に描画（版ごとにキャッシュ）
+def get_annotation_overlay(annotation, width, height):
+    key = (annotation['snapshot_id'], annotation['version'])
+    with annotation_lock:
+        overlay = annotation_overlays.get(key)
+        if overlay is not None:
+            annotation_overlays.move_to_end(key)
+            return overlay
+    
+    overlay = np.zeros((height, width, 4), dtype=np.uint8)
+    for stroke in annotation['strokes']:
+        hex_color = stroke['color'].lstrip('#')
+        r, g, b = (int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+        thickness = max(1, int(round(stroke['width'])))
+        points = np.round(np.array(stroke['points'])).astype(np.int32)
+        if len(points) == 1:
+            cv2.circle(overlay, tuple(int(v) for v in points[0]), max(1, thickness // 2), (b, g, r, 255), -1, cv2.LINE_AA)
+        else:
+            cv2.polylines(overlay, [points], False, (b, g, r, 255), thickness, cv2.LINE_AA)
+    
+    with annotation_lock:
+        annotation_overlays[key] = overlay
+        while len(annotation_overlays) > ANNOTATION_OVERLAY_CACHE_SIZE:
+            annotation_overlays.popitem(last=False)
+    return overlay
+
+# オーバーレイのタイルをPNGで取得（キャッシュ済みならそれを返す）
+def get_annotation_tile(annotation, width, height, level, col, row):
+    key = (annotation['snapshot_id'], annotation['version'], level, col, row)
+    with annotation_lock:
+        tile = annotation_tiles.get(key)
+        if tile is not None:
+            annotation_tiles.move_to_end(key)
+            return tile
+    
+    geometry = tile_geometry(width, height, level, col, row)
+    if geometry is None:
+        return None
+    (x0, y0, x1, y1), out_size = geometry
+    
+    overlay = get_annotation_overlay(annotation, width, height)
+    region = overlay[y0:y1, x0:x1]
+    if (x1 - x0, y1 - y0) != out_size:
+        region = cv2.resize(region, out_size, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.png', region)
+    tile = buffer.tobytes()
+    
+    with annotation_lock:
+        annotation_tiles[key] = tile
+        while len(annotation_tiles) > ANNOTATION_TILE_CACHE_SIZE:
+            annotation_tiles.popitem(last=False)
+    return tile
+
+# --- 関心領域（ROI） ---
+
+# ROI（正規化座標 "x,y,w,h" または [x, y, w, h]）を検証して返す（未指定はNone）
+def parse_roi(value):
+    if value is None or value == '':
+        return None
+    parts = value.split(',') if isinstance(value, str) else value
+    try:
+        x, y, w, h = (float(v) for v in parts)
+    except (TypeError, ValueError):
+        raise ValueError('roi must be x,y,w,h in normalized coordinates')
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < w <= 1 and 0 < h <= 1 and x + w <= 1.0001 and y + h <= 1.0001):
+        raise ValueError('roi must be x,y,w,h in normalized coordinates')
+    return (x, y, w, h)
+
+# ROIを切り出す（NumPyのビューなのでコピーは発生しない）
+def crop_roi(img, roi):
+    if roi is None:
+        return img
+    height, width = img.shape[:2]
+    x, y, w, h = roi
+    x0, y0 = int(x * width), int(y * height)
+    x1 = min(width, max(x0 + 1, int(round((x + w) * width))))
+    y1 = min(height, max(y0 + 1, int(round((y + h) * height))))
+    return img[y0:y1, x0:x1]
+
+# 保存済みROIをファイルから読み込む
+def load_roi_presets():
+    global roi_presets
+    if not os.path.exists(ROI_FILE):
+        return
+    
+    try:
+        with open(ROI_FILE, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        with roi_lock:
+            roi_presets = loaded
+        logger.info(f"保存済みROIを読み込みました: {len(loaded)}台分")
+    except Exception as e:
+        logger.error(f"保存済みROIの読み込みエラー: {e}")
+
+# ROIをファイルに保存（roi_lockを保持して呼ぶ）
+def save_roi_presets():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = ROI_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(roi_presets, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, ROI_FILE)
+
+# カメラの保存済みROI（カメラ名で保存されているため再起動後も引き継がれる）
+def get_roi_presets(node_id):
+    name = cameras.get(node_id, {}).get('name', node_id)
+    with roi_lock:
+        return dict(roi_presets.get(name, {}))
+
+# ROIを保存（roi が None の場合は削除）
+def update_roi_preset(node_id, roi_name, roi):
+    if not ROI_NAME_PATTERN.match(roi_name):
+        raise ValueError('ROI name must be 1-32 characters of letters, digits, _ or -')
+    
+    name = cameras.get(node_id, {}).get('name', node_id)
+    with roi_lock:
+        presets = roi_presets.setdefault(name, {})
+        if roi is None:
+            presets.pop(roi_name, None)
+        else:
+            presets[roi_name] = list(roi)
+        save_roi_presets()
+    logger.info(f"カメラ {name} のROI {roi_name} を{'削除' if roi is None else '保存'}しました")
+
+# リクエストのROI指定（保存済みの名前または座標）を解決
+def resolve_roi(node_id, value):
+    if value is None or value == '':
+        return None
+    saved = get_roi_presets(node_id).get(value)
+    return parse_roi(saved if saved is not None else value)
+
+# --- 自動寸法測定 ---
+
+# 寸法測定設定をファイルから読み込む
+def load_dimension_configs():
+    global dimension_configs
+    if not os.path.exists(DIMENSION_CONFIG_FILE):
+        return
+    
+    try:
+        with open(DIMENSION_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        with dimension_config_lock:
+            dimension_configs = loaded
+        logger.info(f"寸法測定設定を読み込みました: {len(loaded)}台分")
+    except Exception as e:
+        logger.error(f"寸法測定設定の読み込みエラー: {e}")
 
-# ストリーミング用のフレーム生成（サーバーカメラ用）
-def generate_frames():
-    global frame
+# カメラの寸法測定設定を取得（カメラ名で保存されているため再起動後も引き継がれる）
+def get_dimension_config(node_id):
+    name = cameras.get(node_id, {}).get('name', node_id)
+    config = dict(DEFAULT_DIMENSION_CONFIG)
+    with dimension_config_lock:
+        config.update(dimension_configs.get(name, {}))
+    return config
+
+# カメラの寸法測定設定を検証して保存
+def update_dimension_config(node_id, updates):
+    unknown = set(updates) - set(DEFAULT_DIMENSION_CONFIG)
+    if unknown:
+        raise ValueError(f'Unknown config keys: {sorted(unknown)}')
     
-    while True:
-        # フレームが利用可能になるまで待機
-        if frame is None:
-            time.sleep(0.1)
-            continue
-        
-        try:
-            # 最新のフレームを取得
-            with frame_lock:
-                img = frame.copy()
-            
-            # フレームをJPEGとしてエンコード
-            ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])
-            if not ret:
-                continue
-            
-            # MJPEGフォーマットでフレームを返す
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        
-        except Exception as e:
-            logger.error(f"サーバーカメラのフレーム生成エラー: {e}")
-            time.sleep(0.5)
+    if 'roi' in updates:
+        roi = updates['roi']
+        if (not isinstance(roi, (list, tuple)) or len(roi) != 4
+                or not all(0.0 <= float(v) <= 1.0 for v in roi)
+                or float(roi[2]) <= 0 or float(roi[3]) <= 0):
+            raise ValueError('roi must be [x, y, w, h] in normalized coordinates')
+        updates['roi'] = [float(v) for v in roi]
+    
+    threshold = updates.get('threshold')
+    if threshold is not None and threshold not in ('otsu', 'adaptive'):
+        if not isinstance(threshold, (int, float)) or not 0 <= threshold <= 255:
+            raise ValueError("threshold must be 'otsu', 'adaptive' or 0-255")
+    
+    mm_per_px = updates.get('mm_per_px')
+    if mm_per_px is not None and (not isinstance(mm_per_px, (int, float)) or mm_per_px <= 0):
+        raise ValueError('mm_per_px must be a positive number')
+    
+    name = cameras.get(node_id, {}).get('name', node_id)
+    with dimension_config_lock:
+        saved = dimension_configs.setdefault(name, {})
+        saved.update(updates)
+        
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp_path = DIMENSION_CONFIG_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dimension_configs, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, DIMENSION_CONFIG_FILE)
+    
+    logger.info(f"カメラ {name} の寸法測定設定を更新しました: {updates}")
+    return get_dimension_config(node_id)
 
-# サーバー自身をカメラノードとして登録
-def register_server_camera():
-    global cameras
+# 画像から輪郭を抽出し、主要寸法を測定する
+# source_width: ROIで切り出した画像の場合は切り出し前の幅
+def measure_dimensions(img, config, source_width=None):
+    height, width = img.shape[:2]
     
-    server_info = {
-        'id': NODE_ID,
-        'name': NODE_NAME,
-        'ip': SERVER_IP,
-        'port': SERVER_PORT,
-        'status': 'running' if camera_running else 'error',
-        'resolution': RESOLUTION,
-        'last_heartbeat': time.time(),
-        'last_checked': time.time()
+    # 設定値は静止画解像度基準のため、入力画像の解像度に合わせて換算する
+    px_scale = STILL_RESOLUTION[0] / (source_width or width)
+    mm_per_px = config.get('mm_per_px')
+    unit = 'mm' if mm_per_px else 'px'
+    unit_per_px = px_scale * (mm_per_px or 1.0)
+    
+    # ROIの切り出し（NumPyのビューなのでコピーは発生しない）
+    rx, ry, rw, rh = config['roi']
+    x0, y0 = int(rx * width), int(ry * height)
+    x1, y1 = min(width, int((rx + rw) * width)), min(height, int((ry + rh) * height))
+    roi = img[y0:y1, x0:x1]
+    if roi.size == 0:
+        raise ValueError('ROI is empty')
+    
+    # 二値化
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    threshold_type = cv2.THRESH_BINARY_INV if config.get('invert') else cv2.THRESH_BINARY
+    threshold = config.get('threshold', 'otsu')
+    if threshold == 'otsu':
+        _, binary = cv2.threshold(gray, 0, 255, threshold_type | cv2.THRESH_OTSU)
+    elif threshold == 'adaptive':
+        block_size = max(3, (min(gray.shape[:2]) // 16) | 1)
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, threshold_type, block_size, 5)
+    else:
+        _, binary = cv2.threshold(gray, float(threshold), 255, threshold_type)
+    
+    # 外側の輪郭のみ抽出し、面積の大きい順に並べる
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = config.get('min_area', 0) / (px_scale ** 2)
+    contours = [c for c in contours if cv2.contourArea(c) >= min_area]
+    contours.sort(key=cv2.contourArea, reverse=True)
+    contours = contours[:config.get('max_objects', 20)]
+    
+    offset = np.array([x0, y0], dtype=np.float32)
+    objects = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        perimeter = cv2.arcLength(contour, True)
+        circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0.0
+        
+        # 最小外接矩形
+        (cx, cy), (box_w, box_h), angle = cv2.minAreaRect(contour)
+        box = cv2.boxPoints(((cx, cy), (box_w, box_h), angle)) + offset
+        
+        # 最小外接円
+        (ex, ey), radius = cv2.minEnclosingCircle(contour)
+        
+        # 主軸の直線フィッティング
+        vx, vy, lx, ly = cv2.fitLine(contour, cv2.DIST_L2, 0, 0.01, 0.01).ravel()
+        
+        # 多角形近似による各辺の長さ
+        approx = cv2.approxPolyDP(contour, 0.01 * perimeter, True).reshape(-1, 2)
+        edges = []
+        if circularity < 0.85 and 2 < len(approx) <= 12:
+            edges = [
+                round(float(np.hypot(*(approx[(i + 1) % len(approx)] - approx[i]))) * unit_per_px, 3)
+                for i in range(len(approx))
+            ]
+        
+        objects.append({
+            'shape': 'circle' if circularity >= 0.85 else 'polygon',
+            'center': [float(cx + x0), float(cy + y0)],
+            'box': box.tolist(),
+            'angle': float(angle),
+            'length': round(max(box_w, box_h) * unit_per_px, 3),
+            'width': round(min(box_w, box_h) * unit_per_px, 3),
+            'area': round(area * unit_per_px ** 2, 3),
+            'perimeter': round(perimeter * unit_per_px, 3),
+            'circularity': round(float(circularity), 4),
+            'circle': {
+                'center': [float(ex + x0), float(ey + y0)],
+                'radius': round(radius * unit_per_px, 3),
+                # 描画用の半径（center と同じ画像座標系のピクセル単位）
+                'radius_px': float(radius),
+                'diameter': round(2 * radius * unit_per_px, 3),
+                # 面積から求めた等価直径（エッジのノイズに強い）
+                'equivalent_diameter': round(2 * np.sqrt(area / np.pi) * unit_per_px, 3)
+            },
+            'line': {
+                'point': [float(lx + x0), float(ly + y0)],
+                'direction': [float(vx), float(vy)],
+                'angle': round(float(np.degrees(np.arctan2(vy, vx))), 3)
+            },
+            'edges': edges
+        })
+    
+    return {
+        'unit': unit,
+        'image_size': [width, height],
+        'roi': [x0, y0, x1 - x0, y1 - y0],
+        'objects': objects
     }
+
+# --- フリートメトリクス ---
+
+# 固定長のリングバッファ（時刻と各項目の値）
+def new_ring(size):
+    return {
+        'timestamps': np.full(size, np.nan),
+        'values': np.full((size, len(FLEET_FIELDS)), np.nan, dtype=np.float32),
+        'index': 0,
+        'count': 0
+    }
+
+def ring_append(ring, timestamp, values):
+    index = ring['index']
+    ring['timestamps'][index] = timestamp
+    ring['values'][index] = values
+    ring['index'] = (index + 1) % len(ring['timestamps'])
+    ring['count'] = min(ring['count'] + 1, len(ring['timestamps']))
+
+# 古い順に並べた (時刻, 値) を返す
+def ring_read(ring):
+    size = len(ring['timestamps'])
+    order = (np.arange(ring['count']) + ring['index'] - ring['count']) % size
+    return ring['timestamps'][order], ring['values'][order]
+
+# ヒストグラムの前回との差分から平均値を算出
+def histogram_mean(current, previous, name):
+    count = current['histograms'][name]['count'] - previous['histograms'][name]['count']
+    if count <= 0:
+        return np.nan
+    return (current['histograms'][name]['sum'] - previous['histograms'][name]['sum']) / count
+
+# ノードのメトリクス2回分から記録する値を算出（カウンターは差分から毎秒の値にする）
+def derive_fleet_values(current, previous):
+    values = dict.fromkeys(FLEET_FIELDS, np.nan)
+    values['fps'] = current['fps']
+    values['cpu_temp'] = np.nan if current['cpu_temp'] is None else current['cpu_temp']
+    values['throttled'] = np.nan if current['throttled'] is None else current['throttled'] & 0xF
+    values['stream_clients'] = current['stream_clients']
     
-    with camera_lock:
-        cameras[NODE_ID] = server_info
-        logger.info(f"サーバー自身をカメラノードとして登録しました: {NODE_ID}")
+    elapsed = current['timestamp'] - previous['timestamp'] if previous else 0
+    # カウンターが巻き戻っている場合（ノードの再起動）は差分を使わない
+    if elapsed > 0 and current['counters']['frames_captured_total'] >= previous['counters']['frames_captured_total']:
+        counters, last = current['counters'], previous['counters']
+        values['bytes_per_sec'] = (counters['stream_bytes_sent_total'] - last['stream_bytes_sent_total']) / elapsed
+        values['dropped_per_sec'] = (counters['stream_frames_dropped_total'] - last['stream_frames_dropped_total']) / elapsed
+        values['capture_errors_per_sec'] = (counters['capture_errors_total'] - last['capture_errors_total']) / elapsed
+        values['capture_ms'] = histogram_mean(current, previous, 'capture_seconds') * 1000
+        values['encode_ms'] = histogram_mean(current, previous, 'encode_seconds') * 1000
+        values['frame_kb'] = histogram_mean(current, previous, 'frame_bytes') / 1024
+    return [values[field] for field in FLEET_FIELDS]
 
-# サーバー自身のカメラステータスを更新するスレッド
-def server_camera_status_thread():
-    global camera_running, frame
+# 収集したメトリクスを時系列に記録（fleet_lockを保持して呼ぶ）
+def record_fleet_metrics(node_id, name, metrics, timestamp):
+    series = fleet_series.get(node_id)
+    if series is None:
+        series = fleet_series[node_id] = {
+            'name': name,
+            'previous': None,
+            'latest': None,
+            'tiers': {key: new_ring(size) for key, size in FLEET_RANGES.items()},
+            'rollup_sum': np.zeros(len(FLEET_FIELDS)),
+            'rollup_count': np.zeros(len(FLEET_FIELDS)),
+            'rollup_start': timestamp
+        }
     
-    logger.info("サーバーカメラステータス監視スレッドを開始しました")
+    values = np.array(derive_fleet_values(metrics, series['previous']), dtype=np.float64)
+    series['name'] = name
+    series['previous'] = metrics
+    series['latest'] = (timestamp, values)
+    ring_append(series['tiers']['1h'], timestamp, values)
     
+    # 欠損値を除いて集約し、一定間隔ごとに平均を24時間分の系列へ
+    valid = ~np.isnan(values)
+    series['rollup_sum'][valid] += values[valid]
+    series['rollup_count'][valid] += 1
+    if timestamp - series['rollup_start'] >= FLEET_ROLLUP_INTERVAL:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = series['rollup_sum'] / series['rollup_count']
+        ring_append(series['tiers']['24h'], series['rollup_start'] + FLEET_ROLLUP_INTERVAL / 2, mean)
+        series['rollup_sum'][:] = 0
+        series['rollup_count'][:] = 0
+        series['rollup_start'] = timestamp
+
+# 1ノードのメトリクスを取得
+def scrape_node_metrics(node_id):
+    data, _ = request_node(node_id, '/api/metrics?format=json', timeout=FLEET_SCRAPE_TIMEOUT)
+    return data
+
+# 全ノードのメトリクスを並列に収集するスレッド
+def fleet_metrics_thread():
+    executor = ThreadPoolExecutor(max_workers=FLEET_SCRAPE_MAX_WORKERS)
     while True:
+        started = time.time()
         try:
             with camera_lock:
-                if NODE_ID in cameras:
-                    # カメラが動作しているか確認
-                    if frame is None:
-                        camera_running = False
-                        cameras[NODE_ID]['status'] = 'error'
-                    else:
-                        with frame_lock:
-                            if frame is not None:
-                                camera_running = True
-                                cameras[NODE_ID]['status'] = 'running'
-                    
-                    # ハートビートを更新
-                    cameras[NODE_ID]['last_heartbeat'] = time.time()
-                    cameras[NODE_ID]['last_checked'] = time.time()
+                targets = {
+                    node_id: info.get('name') for node_id, info in cameras.items()
+                    if node_id != NODE_ID and info.get('status') != 'unreachable'
+                }
+                known = set(cameras)
+            
+            futures = {executor.submit(scrape_node_metrics, node_id): node_id for node_id in targets}
+            results = {}
+            for future in as_completed(futures):
+                metrics = future.result()
+                if metrics:
+                    results[futures[future]] = metrics
+            
+            timestamp = time.time()
+            with fleet_lock:
+                for node_id, metrics in results.items():
+                    record_fleet_metrics(node_id, targets[node_id], metrics, timestamp)
+                # 一覧から削除されたノードの時系列を破棄
+                for node_id in set(fleet_series) - known:
+                    fleet_series.pop(node_id, None)
+        
         except Exception as e:
-            logger.error(f"サーバーカメラステータス更新エラー: {e}")
+            logger.error(f"フリートメトリクスの収集エラー: {e}")
         
-        time.sleep(10)
+        time.sleep(max(0, FLEET_SCRAPE_INTERVAL - (time.time() - started)))
+
+# NaNをNoneに変換してJSONで返せるようにする
+def to_json_values(values):
+    return [None if np.isnan(v) else round(float(v), 3) for v in values]
+
+# 直近の値から警告を判定
+def fleet_alerts(latest):
+    alerts = []
+    if latest.get('dropped_per_sec') is not None and latest['dropped_per_sec'] >= FLEET_DROP_ALERT:
+        alerts.append('dropping_frames')
+    if latest.get('cpu_temp') is not None and latest['cpu_temp'] >= FLEET_TEMP_ALERT:
+        alerts.append('overheating')
+    if latest.get('throttled'):
+        alerts.append('throttled')
+    if latest.get('bytes_per_sec') is not None and latest['bytes_per_sec'] >= FLEET_NETWORK_ALERT:
+        alerts.append('network_saturated')
+    return alerts
+
+# --- 一括コマンド ---
+
+# セレクタに一致するノードを選ぶ（タグ・グループは索引から引く）
+#   ids: ノードIDのリスト、name: 名前のパターン（fnmatch形式）、tag: タグ（複数の場合はすべてに一致）、
+#   group: グループ、status: 状態。status を指定しない場合は接続不可のノードを除く
+#   ids が文字列のリストでない場合は ValueError（文字列のままだと部分一致になるため）
+def select_nodes(selector):
+    ids = selector.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(node_id, str) for node_id in ids):
+            raise ValueError('selector.ids must be a list of node IDs')
+        ids = set(ids)
+    pattern = selector.get('name')
+    tags = normalize_tags(selector.get('tag') or [])
+    status = selector.get('status')
+    
+    with camera_lock:
+        matched = lookup_nodes(tags, normalize_group(selector.get('group')))
+        candidates = cameras if matched is None else matched
+        return [
+            node_id for node_id in candidates
+            if (not ids or node_id in ids)
+            and (not pattern or fnmatch.fnmatchcase(cameras[node_id].get('name') or '', pattern))
+            and (cameras[node_id].get('status') == status if status else cameras[node_id].get('status') != 'unreachable')
+        ]
+
+# 1台のノードでコマンドを実行し (result, error) を返す
+def run_node_command(node_id, command, args, timeout):
+    if command == 'snapshot':
+        data, error, _ = take_snapshot(node_id, roi=parse_roi(args.get('roi')), timeout=timeout)
+        if data is None:
+            return None, error
+        persist_snapshot(node_id, data, args.get('purpose', 'fleet'))
+        return {key: data.get(key) for key in ('snapshot_id', 'image_url', 'thumbnail_url', 'timestamp')}, None
+    
+    if command == 'calibration_capture':
+        result, error, _ = capture_calibration_view(node_id)
+        return result, error
+    
+    if node_id == NODE_ID:
+        return None, f'{command} is not supported for the server camera'
+    method, endpoint = FLEET_COMMANDS[command]
+    data, status = request_node(node_id, endpoint, method=method, data=args if method != 'GET' else None, timeout=timeout)
+    if data is None:
+        return None, f'{command} failed: {status}'
+    return data, None
+
+# 各ノードの実行時間を計測してコマンドを実行
+def timed_node_command(node_id, command, args, timeout):
+    started = time.perf_counter()
+    try:
+        result, error = run_node_command(node_id, command, args, timeout)
+    except Exception as e:
+        result, error = None, str(e)
+    return result, error, time.perf_counter() - started
+
+# 複数ノードで並行してコマンドを実行し、完了した順に (ノードID, result, error, 所要時間) を返す
+# 全体の期限（待ち行列の分を含む）を過ぎても終わらないノードは期限切れとして返す
+def fan_out_command(node_ids, command, args, workers, timeout):
+    workers = min(workers, len(node_ids))
+    deadline = timeout * math.ceil(len(node_ids) / workers) + 1.0
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {
+        executor.submit(timed_node_command, node_id, command, args, timeout): node_id
+        for node_id in node_ids
+    }
+    pending = set(node_ids)
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            node_id = futures[future]
+            pending.discard(node_id)
+            result, error, elapsed = future.result()
+            yield node_id, result, error, elapsed
+    except FuturesTimeoutError:
+        for node_id in pending:
+            yield node_id, None, 'Deadline exceeded', deadline
+    finally:
+        # 期限切れのノードの完了は待たない
+        executor.shutdown(wait=False, cancel_futures=True)
 
 # --- APIエンドポイント ---
 
 # カメラノードの登録/ハートビート
 @app.route('/api/register', methods=['POST'])
 def register_camera():
+    # 時刻同期のためにリクエストの受信時刻を最初に記録する
+    received_at = time.time()
     logger.info(f"カメラ登録リクエストを受信しました: {request.remote_addr}")
     try:
         node_info = request.json
-        logger.info(f"登録データ: {node_info}")
+        logger.debug(f"登録データ: {node_info}")
         node_id = node_info.get('id')
+        clock_sync = node_info.pop('clock_sync', None)
         
         if not node_id:
             logger.error("Node IDがリクエストに含まれていません")
@@ -2606,117 +2256,692 @@ def register_camera():
         
         # タイムスタンプを更新
         node_info['last_heartbeat'] = time.time()
+        if 'tags' in node_info:
+            node_info['tags'] = normalize_tags(node_info['tags'])
+        if 'group' in node_info:
+            node_info['group'] = normalize_group(node_info['group'])
         
         # ノード情報を保存/更新
         with camera_lock:
+            record_heartbeat(node_id, node_info['last_heartbeat'])
             if node_id in cameras:
                 # 既存のノードを更新
                 cameras[node_id].update(node_info)
-                logger.info(f"ノード {node_id} ({node_info.get('name')}) のハートビートを受信しました")
+                logger.debug(f"ノード {node_id} ({node_info.get('name')}) のハートビートを受信しました")
             else:
                 # 新しいノードを登録
                 cameras[node_id] = node_info
                 logger.info(f"新しいノード {node_id} ({node_info.get('name')}) を登録しました")
+            reindex_node(node_id)
+            registered_info = dict(cameras[node_id])
             
             # デバッグ用：現在登録されているすべてのカメラを表示
-            logger.info(f"現在登録されているカメラ: {list(cameras.keys())}")
+            logger.debug(f"現在登録されているカメラ: {list(cameras.keys())}")
+        
+        # 再起動後に復元できるよう登録情報を保存
+        save_registry_entry(node_id, registered_info)
         
-        return jsonify({'status': 'registered', 'id': node_id})
+        # ノードの校正データが古い場合は最新のものを送信
+        calibration = calibrations.get(node_info.get('name'))
+        if calibration and node_info.get('calibration_id') != calibration['id']:
+            threading.Thread(target=push_calibration, args=(node_id, calibration), daemon=True).start()
+        
+        response = {'status': 'registered', 'id': node_id}
+        if clock_sync and 't0' in clock_sync:
+            # ノードが時刻オフセットを計算できるよう受信・送信時刻を返す
+            response['clock_sync'] = {'t0': clock_sync['t0'], 't1': received_at, 't2': time.time()}
+        return jsonify(response)
     
     except Exception as e:
         logger.error(f"カメラ登録処理中にエラーが発生しました: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# すべてのカメラノード情報を取得
+# カメラノード情報を取得（?tag= は複数指定でき、すべてのタグと ?group= に一致するノードに絞り込む）
 @app.route('/api/cameras', methods=['GET'])
 def get_cameras():
     active_cameras = {}
     
     with camera_lock:
-        for node_id, info in cameras.items():
+        # 索引と同じ形に正規化してから引く
+        matched = lookup_nodes(normalize_tags(request.args.getlist('tag')), normalize_group(request.args.get('group')))
+        for node_id in (cameras if matched is None else matched):
+            info = cameras[node_id]
             # 不要なデータをフィルタリング
             filtered_info = {
                 'id': info.get('id'),
                 'name': info.get('name'),
+                'group': info.get('group'),
+                'tags': info.get('tags') or [],
                 'ip': info.get('ip'),
                 'port': info.get('port'),
                 'status': info.get('status'),
                 'resolution': info.get('resolution'),
-                'url': f"http://{info.get('ip')}:{info.get('port')}/stream",
+                'url': f"{node_base_url(info)}/stream",
+                'thumbnail_url': f'/api/thumbnail/{node_id}',
+                'clock_offset_ms': round(info['clock_offset'] * 1000, 3) if info.get('clock_offset') is not None else None,
+                'clock_rtt_ms': round(info['clock_rtt'] * 1000, 3) if info.get('clock_rtt') is not None else None,
+                'fps': info.get('fps'),
+                'cpu_temp': info.get('cpu_temp'),
+                'phi': info.get('phi'),
+                'rois': get_roi_presets(node_id),
                 'last_seen': datetime.fromtimestamp(info.get('last_heartbeat', 0)).strftime('%Y-%m-%d %H:%M:%S')
             }
             active_cameras[node_id] = filtered_info
     
     return jsonify(active_cameras)
 
+# 登録されているタグとグループ（それぞれのノード数）
+@app.route('/api/tags', methods=['GET'])
+def list_tags():
+    with camera_lock:
+        return jsonify({
+            'tags': {tag: len(node_ids) for tag, node_ids in sorted(tag_index.items())},
+            'groups': {group: len(node_ids) for group, node_ids in sorted(group_index.items())}
+        })
+
+# カメラのライブサムネイル（キャッシュから即座に返すため、ノードへの負荷はない）
+@app.route('/api/thumbnail/<node_id>', methods=['GET'])
+def live_thumbnail(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    entry = get_live_thumbnail(node_id)
+    if entry is None:
+        return jsonify({'error': 'No frame available'}), 503
+    
+    response = Response(entry['jpeg'], mimetype='image/jpeg')
+    response.headers['Cache-Control'] = f'private, max-age={int(LIVE_THUMBNAIL_REFRESH_INTERVAL)}'
+    response.set_etag(f"{node_id}-{int(entry['updated'] * 1000)}")
+    return response.make_conditional(request)
+
+# フリート全体のメトリクスの概要
+@app.route('/api/fleet/metrics', methods=['GET'])
+def fleet_overview():
+    nodes = {}
+    with fleet_lock:
+        for node_id, series in fleet_series.items():
+            if series['latest'] is None:
+                continue
+            timestamp, values = series['latest']
+            latest = dict(zip(FLEET_FIELDS, to_json_values(values)))
+            nodes[node_id] = {
+                'name': series['name'],
+                'timestamp': timestamp,
+                'latest': latest,
+                'alerts': fleet_alerts(latest)
+            }
+    
+    return jsonify({
+        'interval': FLEET_SCRAPE_INTERVAL,
+        'nodes': nodes,
+        'total_bytes_per_sec': sum(n['latest']['bytes_per_sec'] or 0 for n in nodes.values()),
+        'alert_count': sum(len(n['alerts']) for n in nodes.values())
+    })
+
+# ノードのメトリクスの時系列（?range=1h|24h）
+@app.route('/api/fleet/metrics/<node_id>', methods=['GET'])
+def fleet_node_series(node_id):
+    range_key = request.args.get('range', '1h')
+    if range_key not in FLEET_RANGES:
+        return jsonify({'error': f'range must be one of {list(FLEET_RANGES)}'}), 400
+    
+    with fleet_lock:
+        series = fleet_series.get(node_id)
+        if series is None:
+            return jsonify({'error': 'No metrics for this node'}), 404
+        timestamps, values = ring_read(series['tiers'][range_key])
+        name = series['name']
+    
+    return jsonify({
+        'node_id': node_id,
+        'name': name,
+        'range': range_key,
+        'interval': FLEET_SCRAPE_INTERVAL if range_key == '1h' else FLEET_ROLLUP_INTERVAL,
+        'timestamps': [round(float(t), 3) for t in timestamps],
+        'series': {field: to_json_values(values[:, i]) for i, field in enumerate(FLEET_FIELDS)}
+    })
+
 # 特定のカメラノードからスナップショットを取得
 @app.route('/api/snapshot/<node_id>', methods=['GET'])
 def get_snapshot(node_id):
-    # サーバー自身のカメラの場合
-    if node_id == NODE_ID:
-        global frame, camera_running
-        if frame is None:
-            return jsonify({'error': 'No frame available'}), 404
-        
+    # ?roi= には保存済みROIの名前または正規化座標 x,y,w,h を指定できる
+    try:
+        roi = resolve_roi(node_id, request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 同時に届いた要求は1回の撮影・保存にまとめる（短時間の繰り返しにも同じ結果を返す）
+    # 用途ごとに索引へ登録するため、用途が異なる要求はまとめない
+    purpose = request.args.get('purpose', 'snapshot')
+    data, error, status_code = coalesce_snapshot(
+        (node_id, roi, purpose), lambda: take_and_persist_snapshot(node_id, roi, purpose)
+    )
+    if data is None:
+        return jsonify({'error': error}), status_code
+    # 共有された結果を以降の処理で書き換えないよう複製する
+    data = dict(data)
+    
+    # 自動寸法測定（リクエストで指定された場合、または設定で自動測定が有効な場合）
+    config = get_dimension_config(node_id)
+    if request.args.get('dimensions') == '1' or config.get('auto'):
         try:
-            # サーバーカメラでも高解像度撮影を試みる
-            if camera_running:
-                try:
-                    # 一時的に高解像度で撮影
-                    camera = Picamera2()
-                    high_res_config = camera.create_still_configuration(main={"size": (2592, 1944)})
-                    camera.configure(high_res_config)
-                    camera.start()
-                    time.sleep(0.5)
-                    high_res_img = camera.capture_array()
-                    camera.stop()
-                    
-                    # 必要に応じてBGRに変換
-                    channels = 1 if len(high_res_img.shape) == 2 else high_res_img.shape[2]
-                    if channels == 1:
-                        high_res_img = cv2.cvtColor(high_res_img, cv2.COLOR_GRAY2BGR)
-                    elif channels == 4:
-                        high_res_img = cv2.cvtColor(high_res_img, cv2.COLOR_BGRA2BGR)
-                    
-                    # 高解像度画像をエンコード
-                    ret, buffer = cv2.imencode('.jpg', high_res_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                    
-                    if not ret:
-                        with frame_lock:
-                            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                except Exception as e:
-                    logger.error(f"サーバー高解像度撮影エラー: {e}")
-                    with frame_lock:
-                        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            else:
-                with frame_lock:
-                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            
-            if not ret:
-                return jsonify({'error': 'Failed to encode image'}), 500
-            
-            # Base64でエンコード
-            img_str = base64.b64encode(buffer).decode('utf-8')
-            
-            return jsonify({
-                'success': True,
-                'timestamp': time.time(),
-                'image': img_str
-            })
-        
+            img = decode_snapshot_image(data)
+            source_width = round(img.shape[1] / roi[2]) if roi else None
+            data['dimensions'] = measure_dimensions(img, config, source_width)
         except Exception as e:
-            logger.error(f"サーバーカメラのスナップショットエラー: {e}")
-            return jsonify({'error': str(e)}), 500
+            logger.error(f"ノード {node_id} の自動寸法測定エラー: {e}")
+            data['dimensions'] = {'error': str(e)}
     
-    # 他のカメラノードの場合
+    # inline=0 の場合は画像本体を返さない（保存済み画像はURLで参照・キャッシュできる）
+    if request.args.get('inline') == '0' and 'snapshot_id' in data:
+        data.pop('image', None)
+    
+    return jsonify(data)
+
+# 一括同期撮影：全ノード（または指定ノード）に目標時刻を配信し、各ノードの直近フレームから同時刻の画像を集める
+@app.route('/api/capture_all', methods=['POST'])
+def capture_all():
+    data = request.json or {}
+    try:
+        delay = max(0.0, min(float(data.get('delay', CAPTURE_ALL_DELAY)), 5.0))
+        quality = int(data.get('quality', 95))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    purpose = data.get('purpose', 'multiview')
+    
+    with camera_lock:
+        node_ids = [
+            node_id for node_id, info in cameras.items()
+            if info.get('status') == 'running'
+        ]
+    if data.get('node_ids'):
+        node_ids = [node_id for node_id in data['node_ids'] if node_id in cameras]
+    if not node_ids:
+        return jsonify({'error': 'No cameras available'}), 404
+    
+    # 配信にかかる時間を見込んで少し先の時刻を目標にする
+    target_time = time.time() + delay
+    timeout = delay + 5.0
+    bundle_id = uuid.uuid4().hex[:12]
+    results, errors = {}, {}
+    
+    with ThreadPoolExecutor(max_workers=min(CAPTURE_ALL_MAX_WORKERS, len(node_ids))) as executor:
+        futures = {
+            executor.submit(capture_node_at, node_id, target_time, quality, timeout): node_id
+            for node_id in node_ids
+        }
+        for future in as_completed(futures):
+            node_id = futures[future]
+            try:
+                result, error = future.result()
+            except Exception as e:
+                result, error = None, str(e)
+            if result is None:
+                errors[node_id] = error
+                continue
+            
+            persist_snapshot(node_id, result, purpose)
+            results[node_id] = {
+                'snapshot_id': result.get('snapshot_id'),
+                'image_url': result.get('image_url'),
+                'thumbnail_url': result.get('thumbnail_url'),
+                'timestamp': result['timestamp'],
+                'skew_ms': round(result['skew'] * 1000, 3)
+            }
+    
+    timestamps = [r['timestamp'] for r in results.values()]
+    logger.info(f"一括撮影 {bundle_id}: 成功 {len(results)}台, 失敗 {len(errors)}台")
+    return jsonify({
+        'bundle_id': bundle_id,
+        'target_time': target_time,
+        'results': results,
+        'errors': errors,
+        'max_skew_ms': max((abs(r['skew_ms']) for r in results.values()), default=None),
+        'spread_ms': round((max(timestamps) - min(timestamps)) * 1000, 3) if timestamps else None
+    })
+
+# ノードの実行時設定を変更
+def push_node_config(node_id, config):
+    if node_id == NODE_ID:
+        return None, 'Runtime config is not supported for the server camera'
+    data, status = request_node(node_id, '/api/config', method='POST', data=config, timeout=CONFIG_TIMEOUT)
+    if data is None:
+        return None, f'Config failed: {status}'
+    return data, None
+
+# ノードの実行時設定の取得・変更
+@app.route('/api/config/<node_id>', methods=['GET', 'POST'])
+def node_config(node_id):
     if node_id not in cameras:
         return jsonify({'error': 'Camera not found'}), 404
     
-    data, status = request_node(node_id, '/api/snapshot')
-    if data:
+    if request.method == 'GET':
+        data, status = request_node(node_id, '/api/config')
+        if data is None:
+            return jsonify({'error': f'Failed to get config: {status}'}), 502
         return jsonify(data)
+    
+    data, error = push_node_config(node_id, request.json or {})
+    if data is None:
+        return jsonify({'error': error}), 502
+    return jsonify(data)
+
+# 複数ノードの実行時設定を一括変更（node_ids を省略すると全ノード）
+#   {"node_ids": ["..."], "config": {"controls": {"ExposureTime": 8000}}}
+@app.route('/api/config', methods=['POST'])
+def config_all():
+    data = request.json or {}
+    config = data.get('config')
+    if not isinstance(config, dict) or not config:
+        return jsonify({'error': 'config is required'}), 400
+    
+    with camera_lock:
+        node_ids = [
+            node_id for node_id, info in cameras.items()
+            if node_id != NODE_ID and info.get('status') != 'unreachable'
+        ]
+    if data.get('node_ids'):
+        node_ids = [node_id for node_id in data['node_ids'] if node_id in cameras]
+    if not node_ids:
+        return jsonify({'error': 'No cameras available'}), 404
+    
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=min(CONFIG_MAX_WORKERS, len(node_ids))) as executor:
+        futures = {executor.submit(push_node_config, node_id, config): node_id for node_id in node_ids}
+        for future in as_completed(futures):
+            node_id = futures[future]
+            try:
+                result, error = future.result()
+            except Exception as e:
+                result, error = None, str(e)
+            if result is None:
+                errors[node_id] = error
+            else:
+                results[node_id] = result
+    
+    logger.info(f"設定の一括変更: 成功 {len(results)}台, 失敗 {len(errors)}台")
+    return jsonify({'results': results, 'errors': errors})
+
+# 複数ノードへの一括コマンド（結果は完了したノードから順にNDJSONで返す。"stream": false の場合はまとめて返す）
+#   {"command": "config", "selector": {"name": "line1-*", "tag": "inspection"},
+#    "args": {"target_fps": 15}, "concurrency": 16, "timeout": 5}
+@app.route('/api/fleet/command', methods=['POST'])
+def fleet_command():
+    data = request.json or {}
+    command = data.get('command')
+    if command not in FLEET_COMMANDS and command not in ('snapshot', 'calibration_capture'):
+        return jsonify({'error': f'Unknown command: {command}'}), 400
+    args = data.get('args') or {}
+    selector = data.get('selector') or {}
+    if not isinstance(args, dict) or not isinstance(selector, dict):
+        return jsonify({'error': 'args and selector must be objects'}), 400
+    try:
+        workers = max(1, min(int(data.get('concurrency', FLEET_COMMAND_DEFAULT_WORKERS)), FLEET_COMMAND_MAX_WORKERS))
+        timeout = max(0.1, min(float(data.get('timeout', FLEET_COMMAND_TIMEOUT)), FLEET_COMMAND_MAX_TIMEOUT))
+        if command == 'snapshot':
+            parse_roi(args.get('roi'))
+        node_ids = select_nodes(selector)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not node_ids:
+        return jsonify({'error': 'No cameras matched'}), 404
+    logger.info(f"一括コマンド {command} を {len(node_ids)} 台に実行します")
+    
+    names = {node_id: cameras.get(node_id, {}).get('name') for node_id in node_ids}
+    results = fan_out_command(node_ids, command, args, workers, timeout)
+    
+    def node_result(node_id, result, error, elapsed):
+        entry = {'node_id': node_id, 'name': names.get(node_id), 'ok': error is None, 'elapsed_ms': round(elapsed * 1000, 1)}
+        if error is None:
+            entry['result'] = result
+        else:
+            entry['error'] = error
+        return entry
+    
+    if data.get('stream', True) is False:
+        entries = [node_result(*r) for r in results]
+        failed = sum(1 for entry in entries if not entry['ok'])
+        logger.info(f"一括コマンド {command}: 成功 {len(entries) - failed}台, 失敗 {failed}台")
+        return jsonify({'command': command, 'results': entries, 'succeeded': len(entries) - failed, 'failed': failed})
+    
+    def generate():
+        started = time.perf_counter()
+        succeeded = failed = 0
+        for r in results:
+            entry = node_result(*r)
+            if entry['ok']:
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(entry, ensure_ascii=False) + '\n'
+        logger.info(f"一括コマンド {command}: 成功 {succeeded}台, 失敗 {failed}台")
+        yield json.dumps({
+            'done': True,
+            'command': command,
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# 保存済みスナップショットの検索（ノード・用途・期間で絞り込み、新しい順）
+@app.route('/api/snapshots', methods=['GET'])
+def list_snapshots():
+    try:
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    records = query_snapshots(
+        node_id=request.args.get('node_id'),
+        node_name=request.args.get('node_name'),
+        purpose=request.args.get('purpose'),
+        start=start, end=end, limit=limit, offset=offset
+    )
+    return jsonify({'snapshots': records, 'count': len(records), 'limit': limit, 'offset': offset})
+
+# 保存済みスナップショットの撮影記録
+@app.route('/api/snapshots/<snapshot_id>', methods=['GET'])
+def snapshot_info(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    with snapshot_db_lock:
+        rows = snapshot_db.execute(
+            'SELECT * FROM snapshots WHERE snapshot_id = ? ORDER BY timestamp DESC', (snapshot_id,)
+        ).fetchall() if snapshot_db is not None else []
+    
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    return jsonify({
+        'snapshot_id': snapshot_id,
+        'width': width,
+        'height': height,
+        'image_url': f'/api/snapshots/{snapshot_id}/image',
+        'thumbnail_url': f'/api/snapshots/{snapshot_id}/thumbnail',
+        'captures': [snapshot_record(row) for row in rows]
+    })
+
+# 保存済みスナップショットの画像（内容が変わらないため長期キャッシュ可能）
+@app.route('/api/snapshots/<snapshot_id>/image', methods=['GET'])
+def snapshot_image(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    response = send_file(snapshot_path(snapshot_id), mimetype='image/jpeg', etag=snapshot_id)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# スナップショットのタイルピラミッド情報
+@app.route('/api/snapshots/<snapshot_id>/tiles', methods=['GET'])
+def snapshot_tile_info(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    info = pyramid_info(width, height)
+    info['url'] = f'/api/snapshots/{snapshot_id}/tiles/{{level}}/{{col}}_{{row}}.jpg'
+    return jsonify(info)
+
+# DeepZoom（DZI）形式の記述子（OpenSeadragonなどの既存ビューアからも参照できる）
+@app.route('/api/snapshots/<snapshot_id>/image.dzi', methods=['GET'])
+def snapshot_dzi(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    dzi = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="jpg" Overlap="0" TileSize="{TILE_SIZE}">'
+        f'<Size Width="{width}" Height="{height}"/></Image>'
+    )
+    return Response(dzi, mimetype='application/xml')
+
+# スナップショットのタイル（初回要求時に生成してディスクにキャッシュ）
+@app.route('/api/snapshots/<snapshot_id>/tiles/<int:level>/<int:col>_<int:row>.jpg', methods=['GET'])
+@app.route('/api/snapshots/<snapshot_id>/image_files/<int:level>/<int:col>_<int:row>.jpg', methods=['GET'])
+def snapshot_tile(snapshot_id, level, col, row):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    try:
+        path = get_snapshot_tile(snapshot_id, level, col, row)
+    except Exception as e:
+        logger.error(f"タイル生成エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    if path is None:
+        return jsonify({'error': 'Tile out of range'}), 404
+    
+    response = send_file(path, mimetype='image/jpeg', etag=f'{snapshot_id[:16]}-{level}-{col}-{row}')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# 保存済みスナップショットのサムネイル
+@app.route('/api/snapshots/<snapshot_id>/thumbnail', methods=['GET'])
+def snapshot_thumbnail(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    path = thumbnail_path(snapshot_id)
+    if not os.path.exists(path):
+        # 索引導入前に保存された画像などはここで一度だけ作成
+        with open(snapshot_path(snapshot_id), 'rb') as f:
+            write_file_atomic(path, create_thumbnail(f.read()))
+    
+    response = send_file(path, mimetype='image/jpeg', etag=f'{snapshot_id}-thumb')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# 自動寸法測定の設定を取得/更新
+@app.route('/api/dimension/config/<node_id>', methods=['GET', 'PUT'])
+def dimension_config(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    if request.method == 'GET':
+        return jsonify(get_dimension_config(node_id))
+    
+    try:
+        config = update_dimension_config(node_id, request.json or {})
+        return jsonify(config)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# カメラの保存済みROI一覧
+@app.route('/api/roi/<node_id>', methods=['GET'])
+def list_rois(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    return jsonify({'rois': get_roi_presets(node_id)})
+
+# ROIの保存・削除（{"roi": [x, y, w, h]}）
+@app.route('/api/roi/<node_id>/<roi_name>', methods=['PUT', 'DELETE'])
+def roi_preset(node_id, roi_name):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    try:
+        roi = None if request.method == 'DELETE' else parse_roi((request.json or {}).get('roi'))
+        if request.method == 'PUT' and roi is None:
+            raise ValueError('roi is required')
+        update_roi_preset(node_id, roi_name, roi)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'rois': get_roi_presets(node_id)})
+
+# ライブ寸法測定（現在のストリームフレームを縮小デコードして測定）
+@app.route('/api/dimension/<node_id>/live', methods=['GET'])
+def live_dimensions(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    img = fetch_live_frame(node_id, LIVE_DIMENSION_REDUCTION)
+    if img is None:
+        return jsonify({'error': 'No frame available'}), 500
+    
+    try:
+        result = measure_dimensions(img, get_dimension_config(node_id))
+    except Exception as e:
+        logger.error(f"ノード {node_id} のライブ寸法測定エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    result['timestamp'] = time.time()
+    return jsonify(result)
+
+# カメラ校正の状態を取得/校正データを削除
+@app.route('/api/calibration/<node_id>', methods=['GET', 'DELETE'])
+def calibration_status(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    name = cameras[node_id].get('name')
+    
+    if request.method == 'DELETE':
+        with calibration_lock:
+            removed = calibrations.pop(name, None)
+            calibration_sessions.pop(name, None)
+            if name == NODE_NAME:
+                undistort_maps.clear()
+            save_calibrations()
+        if removed:
+            push_calibration(node_id, None)
+            logger.info(f"カメラ {name} の校正データを削除しました")
+        return jsonify({'success': True, 'removed': removed is not None})
+    
+    with calibration_lock:
+        session = calibration_sessions.get(name)
+        return jsonify({
+            'calibration': calibrations.get(name),
+            'views': len(session['image_points']) if session else 0,
+            'min_views': MIN_CALIBRATION_VIEWS,
+            'checkerboard': list(CHECKERBOARD_SIZE),
+            'square_mm': CHECKERBOARD_SQUARE_MM
+        })
+
+# 校正用のチェッカーボード画像を撮影して検出結果を蓄積
+@app.route('/api/calibration/<node_id>/capture', methods=['POST'])
+def calibration_capture(node_id):
+    result, error, status_code = capture_calibration_view(node_id)
+    if result is None:
+        return jsonify({'error': error}), status_code
+    return jsonify(result)
+
+# 蓄積した検出結果から校正を実行し、ノードへ配布
+@app.route('/api/calibration/<node_id>/compute', methods=['POST'])
+def calibration_compute(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    try:
+        calibration = compute_calibration(cameras[node_id].get('name'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"カメラ校正エラー: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    pushed = push_calibration(node_id, calibration)
+    return jsonify({'success': True, 'calibration': calibration, 'pushed': pushed})
+
+# 撮影中の校正セッションを破棄
+@app.route('/api/calibration/<node_id>/session', methods=['DELETE'])
+def calibration_reset_session(node_id):
+    if node_id not in cameras:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    with calibration_lock:
+        calibration_sessions.pop(cameras[node_id].get('name'), None)
+    return jsonify({'success': True})
+
+# アノテーションの取得/置換/追加/削除
+@app.route('/api/annotations/<snapshot_id>', methods=['GET', 'PUT', 'POST', 'DELETE'])
+def annotations(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    if request.method == 'GET':
+        return jsonify(load_annotation(snapshot_id))
+    
+    try:
+        strokes = validate_strokes((request.json or {}).get('strokes', [])) if request.method != 'DELETE' else []
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with annotation_lock:
+        if request.method == 'POST':
+            strokes = load_annotation(snapshot_id)['strokes'] + strokes
+        annotation = save_annotation(snapshot_id, strokes)
+    
+    logger.info(f"スナップショット {snapshot_id[:12]} のアノテーションを保存しました (版: {annotation['version']}, ストローク数: {len(strokes)})")
+    return jsonify(annotation)
+
+# アノテーションを合成したフル解像度画像
+@app.route('/api/annotations/<snapshot_id>/render', methods=['GET'])
+def render_annotation(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    base = cv2.imread(snapshot_path(snapshot_id), cv2.IMREAD_COLOR)
+    if base is None:
+        return jsonify({'error': 'Failed to read snapshot'}), 500
+    
+    annotation = load_annotation(snapshot_id)
+    overlay = get_annotation_overlay(annotation, base.shape[1], base.shape[0])
+    
+    # アルファブレンド（ストロークのある画素のみ計算する）
+    mask = overlay[:, :, 3] > 0
+    alpha = overlay[:, :, 3][mask].astype(np.float32)[:, None] / 255.0
+    base[mask] = (overlay[:, :, :3][mask] * alpha + base[mask] * (1.0 - alpha)).astype(np.uint8)
+    
+    image_format = 'png' if request.args.get('format') == 'png' else 'jpg'
+    params = [cv2.IMWRITE_JPEG_QUALITY, 95] if image_format == 'jpg' else []
+    _, buffer = cv2.imencode(f'.{image_format}', base, params)
+    
+    response = Response(buffer.tobytes(), mimetype='image/png' if image_format == 'png' else 'image/jpeg')
+    response.headers['Content-Disposition'] = f'attachment; filename=annotation_{snapshot_id[:12]}_v{annotation["version"]}.{image_format}'
+    return response
+
+# オーバーレイタイルのピラミッド情報
+@app.route('/api/annotations/<snapshot_id>/tiles', methods=['GET'])
+def annotation_tile_info(snapshot_id):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    info = pyramid_info(width, height)
+    info['version'] = load_annotation(snapshot_id)['version']
+    info['url'] = f'/api/annotations/{snapshot_id}/tiles/{{level}}/{{col}}_{{row}}.png?v={info["version"]}'
+    return jsonify(info)
+
+# オーバーレイタイル（透過PNG）。ベース画像を再送せずにアノテーションだけを重ねて表示できる
+@app.route('/api/annotations/<snapshot_id>/tiles/<int:level>/<int:col>_<int:row>.png', methods=['GET'])
+def annotation_tile(snapshot_id, level, col, row):
+    if not snapshot_exists(snapshot_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    annotation = load_annotation(snapshot_id)
+    width, height = read_jpeg_size(snapshot_path(snapshot_id))
+    tile = get_annotation_tile(annotation, width, height, level, col, row)
+    if tile is None:
+        return jsonify({'error': 'Tile out of range'}), 404
+    
+    etag = f'{snapshot_id[:16]}-{annotation["version"]}-{level}-{col}-{row}'
+    if request.headers.get('If-None-Match') == f'"{etag}"':
+        return Response(status=304)
+    
+    response = Response(tile, mimetype='image/png')
+    response.headers['ETag'] = f'"{etag}"'
+    # 版番号付きのURLで参照されるため、版が同じなら長期キャッシュしてよい
+    if request.args.get('v') == str(annotation['version']):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     else:
-        return jsonify({'error': f'Failed to get snapshot: {status}'}), 500
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # サーバーカメラのストリーム
 @app.route('/stream')
@@ -2740,31 +2965,53 @@ def video_stream():
         except:
             pass
     
-    # 通常のストリームを返す
-    return Response(generate_frames(),
+    # 通常のストリームを返す（?roi= で切り出した範囲のみ）
+    try:
+        roi = resolve_roi(NODE_ID, request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(generate_frames(roi),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# 全カメラを並べたモザイク配信（?cols=列数&fps=フレームレート&group=グループ）
+@app.route('/mosaic')
+def mosaic_stream():
+    try:
+        columns = int(request.args.get('cols', MOSAIC_COLUMNS))
+        fps = float(request.args.get('fps', MOSAIC_FPS))
+    except ValueError:
+        return jsonify({'error': 'cols and fps must be numbers'}), 400
+    if columns < 0 or not 0 < fps <= MOSAIC_MAX_FPS:
+        return jsonify({'error': f'cols must be >= 0 and fps must be in (0, {MOSAIC_MAX_FPS}]'}), 400
+    
+    return Response(generate_mosaic(columns, fps, normalize_group(request.args.get('group'))),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # サーバーカメラのヘルスチェック
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    if camera_running:
+    if server_camera_status() == 'running':
         return jsonify({'status': 'ok', 'camera': 'running'})
     else:
         return jsonify({'status': 'error', 'camera': 'not running'}), 500
 
-# ロゴ画像のルート
+# ハッシュ付きのダッシュボードアセット
+@app.route('/assets/<name>')
+def dashboard_asset(name):
+    asset = assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return asset_response(asset, ASSET_CACHE_CONTROL)
+
+# ロゴ画像のルート（起動時に生成したものを返す）
 @app.route('/static/logo.png')
 def logo():
-    # 簡易的なロゴ画像を生成
-    img = np.ones((50, 150, 3), dtype=np.uint8) * 255
-    cv2.putText(img, "SCIEN", (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 98, 204), 2)
-    _, buffer = cv2.imencode('.png', img)
-    return Response(buffer.tobytes(), mimetype='image/png')
+    return asset_response(logo_asset, 'public, max-age=86400')
 
 # メインページ - ダッシュボードHTMLを返す
 @app.route('/')
 def index():
-    return DASHBOARD_HTML
+    return asset_response(dashboard_index, 'no-cache')
 
 if __name__ == '__main__':
     # static ディレクトリの作成とオフライン画像の作成
@@ -2776,6 +3023,25 @@ if __name__ == '__main__':
     cv2.putText(offline_img, "Camera Offline", (80, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
     cv2.imwrite('static/offline.jpg', offline_img)
     
+    # データディレクトリの作成と保存済み設定の読み込み
+    os.makedirs(DATA_DIR, exist_ok=True)
+    load_dimension_configs()
+    load_calibrations()
+    load_roi_presets()
+    init_snapshot_db()
+    build_assets()
+    
+    # 保存済みのノードを未確認として復元し、並行して稼働を確認
+    init_registry_db()
+    compact_registry()
+    restored_nodes = load_registry()
+    probe_thread = threading.Thread(target=probe_restored_nodes, args=(restored_nodes,))
+    probe_thread.daemon = True
+    probe_thread.start()
+    compaction_thread = threading.Thread(target=registry_compaction_thread)
+    compaction_thread.daemon = True
+    compaction_thread.start()
+    
     # サーバーカメラの初期化
     try:
         camera = initialize_camera()
@@ -2801,6 +3067,28 @@ if __name__ == '__main__':
     cleanup_thread.daemon = True
     cleanup_thread.start()
     
+    # UDPハートビート受信スレッドの開始
+    if UDP_HEARTBEAT_PORT:
+        udp_thread = threading.Thread(target=udp_heartbeat_thread)
+        udp_thread.daemon = True
+        udp_thread.start()
+    
+    # ライブサムネイル更新スレッドの開始
+    thumbnail_thread = threading.Thread(target=live_thumbnail_thread)
+    thumbnail_thread.daemon = True
+    thumbnail_thread.start()
+    
+    # フリートメトリクス収集スレッドの開始
+    fleet_thread = threading.Thread(target=fleet_metrics_thread)
+    fleet_thread.daemon = True
+    fleet_thread.start()
+    
+    # ノード検出スレッドの開始
+    if DISCOVERY_PORT:
+        discovery = threading.Thread(target=discovery_thread)
+        discovery.daemon = True
+        discovery.start()
+    
     # サーバーの開始
     logger.info(f"中央サーバーを開始します: http://{SERVER_IP}:{SERVER_PORT}")
     app.run(host='0.0.0.0', port=SERVER_PORT, threaded=True)
\ No newline at end of file
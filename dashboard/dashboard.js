@@ -0,0 +1,1842 @@
+// DOM要素の取得
+const sidebar = document.getElementById('sidebar');
+const sidebarToggle = document.getElementById('sidebar-toggle');
+const mobileMenuButton = document.getElementById('mobile-menu-button');
+const mobileOverlay = document.getElementById('mobile-overlay');
+const pageTitle = document.getElementById('page-title');
+const cameraGrid = document.getElementById('camera-grid');
+const annotationGrid = document.getElementById('annotation-grid');
+const dimensionGrid = document.getElementById('dimension-grid');
+const anomalyGrid = document.getElementById('anomaly-grid');
+const refreshBtn = document.getElementById('refresh-btn');
+const gridToggleBtn = document.getElementById('grid-toggle-btn');
+const snapshotModal = document.getElementById('snapshot-modal');
+const closeModalBtn = document.getElementById('close-modal');
+const snapshotImg = document.getElementById('snapshot-img');
+const snapshotTitle = document.getElementById('snapshot-title');
+const snapshotViewerContainer = document.getElementById('snapshot-viewer');
+const tabs = document.querySelectorAll('.tab');
+const tabContents = document.querySelectorAll('.tab-content');
+
+// カメラリスト
+let cameras = {};
+
+// グリッド列数
+let gridColumns = 'auto-fill';
+
+// 現在選択されているタブ
+let currentTab = 'streaming';
+
+// ストリーミングタブで表示中のグループ・タグとページ
+const CAMERA_PAGE_SIZE = 24;
+const UNGROUPED_LABEL = '未分類';
+let cameraGroupFilter = '';
+let cameraTagFilter = '';
+let cameraPage = 0;
+
+// サーバーに登録されているグループとタグ（/api/tags）
+let cameraFilters = { groups: {}, tags: {} };
+
+// 稼働状況タブで選択中のノード
+let fleetSelectedNode = null;
+
+const FLEET_ALERT_LABELS = {
+    dropping_frames: 'フレーム落ち',
+    overheating: '過熱',
+    throttled: 'スロットリング',
+    network_saturated: '帯域逼迫'
+};
+
+// 数値を表示用に整形（値がない場合は -）
+function formatMetric(value, digits, unit) {
+    return value === null || value === undefined ? '-' : `${value.toFixed(digits)}${unit}`;
+}
+
+function formatBandwidth(bytesPerSec) {
+    if (bytesPerSec === null || bytesPerSec === undefined) return '-';
+    return `${(bytesPerSec * 8 / 1e6).toFixed(1)} Mbps`;
+}
+
+// フリート全体のメトリクスを取得して一覧を更新
+async function fetchFleetMetrics() {
+    try {
+        const response = await fetch('/api/fleet/metrics');
+        if (!response.ok) {
+            throw new Error('サーバーからのレスポンスエラー');
+        }
+        const data = await response.json();
+        const nodes = Object.entries(data.nodes);
+
+        document.getElementById('fleet-node-count').textContent = nodes.length;
+        document.getElementById('fleet-total-bandwidth').textContent = formatBandwidth(data.total_bytes_per_sec);
+        document.getElementById('fleet-alert-count').textContent = data.alert_count;
+
+        const tbody = document.getElementById('fleet-table-body');
+        tbody.innerHTML = '';
+        nodes.sort((a, b) => a[1].name.localeCompare(b[1].name)).forEach(([nodeId, node]) => {
+            const m = node.latest;
+            const row = document.createElement('tr');
+            if (nodeId === fleetSelectedNode) row.classList.add('selected');
+            row.innerHTML = `
+                <td>${node.name}</td>
+                <td>${formatMetric(m.fps, 1, '')}</td>
+                <td>${formatMetric(m.cpu_temp, 1, '℃')}</td>
+                <td>${formatBandwidth(m.bytes_per_sec)}</td>
+                <td>${formatMetric(m.dropped_per_sec, 1, '/s')}</td>
+                <td>${formatMetric(m.encode_ms, 1, 'ms')}</td>
+                <td>${m.stream_clients === null ? '-' : m.stream_clients}</td>
+                <td>${node.alerts.map(a => `<span class="fleet-alert">${FLEET_ALERT_LABELS[a] || a}</span>`).join('')}</td>
+            `;
+            row.addEventListener('click', () => {
+                fleetSelectedNode = nodeId;
+                document.getElementById('fleet-chart-title').textContent = node.name;
+                document.getElementById('fleet-chart-panel').style.display = 'block';
+                tbody.querySelectorAll('tr').forEach(r => r.classList.remove('selected'));
+                row.classList.add('selected');
+                fetchFleetSeries();
+            });
+            tbody.appendChild(row);
+        });
+
+        if (nodes.length === 0) {
+            tbody.innerHTML = '<tr><td colspan="8">メトリクスを収集中です...</td></tr>';
+        }
+        if (fleetSelectedNode) {
+            fetchFleetSeries();
+        }
+    } catch (error) {
+        console.error('メトリクス取得エラー:', error);
+    }
+}
+
+// 選択中のノードの時系列を取得してグラフを描画
+async function fetchFleetSeries() {
+    const field = document.getElementById('fleet-chart-field').value;
+    const range = document.getElementById('fleet-chart-range').value;
+    try {
+        const response = await fetch(`/api/fleet/metrics/${fleetSelectedNode}?range=${range}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        drawFleetChart(document.getElementById('fleet-chart'), data.timestamps, data.series[field]);
+    } catch (error) {
+        console.error('時系列取得エラー:', error);
+    }
+}
+
+// 折れ線グラフを描画（欠損値の区間は線を切る）
+function drawFleetChart(canvas, timestamps, values) {
+    const ratio = window.devicePixelRatio || 1;
+    canvas.width = canvas.clientWidth * ratio;
+    canvas.height = canvas.clientHeight * ratio;
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    const pad = 40;
+    ctx.clearRect(0, 0, width, height);
+
+    const points = timestamps.map((t, i) => [t, values[i]]).filter(p => p[1] !== null);
+    if (points.length === 0) {
+        ctx.fillStyle = '#6c757d';
+        ctx.fillText('データがありません', pad, height / 2);
+        return;
+    }
+
+    const tMin = timestamps[0];
+    const tMax = timestamps[timestamps.length - 1];
+    let vMin = Math.min(...points.map(p => p[1]));
+    let vMax = Math.max(...points.map(p => p[1]));
+    if (vMax === vMin) { vMax += 1; vMin = Math.max(0, vMin - 1); }
+    const x = t => pad + (tMax === tMin ? 0 : (t - tMin) / (tMax - tMin)) * (width - pad * 2);
+    const y = v => height - pad + (pad * 2 - height) * (v - vMin) / (vMax - vMin);
+
+    // 軸と目盛り
+    ctx.strokeStyle = 'rgba(0,0,0,0.1)';
+    ctx.fillStyle = '#6c757d';
+    ctx.font = '11px sans-serif';
+    [vMin, (vMin + vMax) / 2, vMax].forEach(v => {
+        ctx.beginPath();
+        ctx.moveTo(pad, y(v));
+        ctx.lineTo(width - pad, y(v));
+        ctx.stroke();
+        ctx.fillText(v.toFixed(1), 4, y(v) + 4);
+    });
+    [tMin, tMax].forEach((t, i) => {
+        const label = new Date(t * 1000).toLocaleTimeString();
+        ctx.fillText(label, i === 0 ? pad : width - pad - ctx.measureText(label).width, height - pad / 2);
+    });
+
+    ctx.strokeStyle = '#0062cc';
+    ctx.lineWidth = 2;
+    ctx.beginPath();
+    let drawing = false;
+    timestamps.forEach((t, i) => {
+        if (values[i] === null) {
+            drawing = false;
+            return;
+        }
+        if (drawing) {
+            ctx.lineTo(x(t), y(values[i]));
+        } else {
+            ctx.moveTo(x(t), y(values[i]));
+            drawing = true;
+        }
+    });
+    ctx.stroke();
+}
+
+document.getElementById('fleet-chart-field').addEventListener('change', fetchFleetSeries);
+document.getElementById('fleet-chart-range').addEventListener('change', fetchFleetSeries);
+
+// 高解像度画像をタイル単位で表示するビューア（表示範囲・倍率に必要なタイルのみ取得する）
+class TileViewer {
+    constructor(container) {
+        this.container = container;
+        this.canvas = document.createElement('canvas');
+        container.insertBefore(this.canvas, container.firstChild);
+        this.ctx = this.canvas.getContext('2d');
+        this.tiles = new Map();
+        this.info = null;
+        this.scale = 1;
+        this.fitScale = 1;
+        this.offsetX = 0;
+        this.offsetY = 0;
+        this.pixelRatio = 1;
+        this.drawPending = false;
+        this.setupEvents();
+    }
+
+    // ピラミッド情報を取得して全体表示にする
+    async open(infoUrl) {
+        const response = await fetch(infoUrl);
+        if (!response.ok) {
+            throw new Error('タイル情報の取得に失敗しました');
+        }
+        this.info = await response.json();
+        this.tiles.clear();
+        this.resize();
+        this.reset();
+    }
+
+    close() {
+        this.info = null;
+        this.tiles.clear();
+    }
+
+    resize() {
+        // モーダルの拡大アニメーションの影響を受けないよう clientWidth を使う
+        this.pixelRatio = window.devicePixelRatio || 1;
+        this.canvas.width = Math.max(1, Math.round(this.container.clientWidth * this.pixelRatio));
+        this.canvas.height = Math.max(1, Math.round(this.container.clientHeight * this.pixelRatio));
+    }
+
+    // 画像全体が収まる倍率に戻す
+    reset() {
+        if (!this.info) return;
+        this.fitScale = Math.min(this.canvas.width / this.info.width, this.canvas.height / this.info.height);
+        this.scale = this.fitScale;
+        this.offsetX = (this.canvas.width - this.info.width * this.scale) / 2;
+        this.offsetY = (this.canvas.height - this.info.height * this.scale) / 2;
+        this.draw();
+    }
+
+    // キャンバス上の点 (cx, cy) を中心に拡大縮小
+    zoomAt(factor, cx, cy) {
+        if (!this.info) return;
+        const newScale = Math.min(Math.max(this.scale * factor, this.fitScale), 4 * this.pixelRatio);
+        const ratio = newScale / this.scale;
+        this.offsetX = cx - (cx - this.offsetX) * ratio;
+        this.offsetY = cy - (cy - this.offsetY) * ratio;
+        this.scale = newScale;
+        this.draw();
+    }
+
+    zoomCenter(factor) {
+        this.zoomAt(factor, this.canvas.width / 2, this.canvas.height / 2);
+    }
+
+    pan(dx, dy) {
+        this.offsetX += dx * this.pixelRatio;
+        this.offsetY += dy * this.pixelRatio;
+        this.draw();
+    }
+
+    // 表示倍率以上の解像度を持つ最小のレベル
+    levelFor(scale) {
+        return Math.max(0, Math.min(this.info.max_level, this.info.max_level + Math.ceil(Math.log2(scale))));
+    }
+
+    getTile(level, col, row) {
+        const key = `${level}/${col}_${row}`;
+        let tile = this.tiles.get(key);
+        if (!tile) {
+            tile = new Image();
+            tile.onload = () => this.draw();
+            tile.src = this.info.url.replace('{level}', level).replace('{col}', col).replace('{row}', row);
+            this.tiles.set(key, tile);
+        }
+        return tile.complete && tile.naturalWidth > 0 ? tile : null;
+    }
+
+    // 指定レベルの表示範囲内のタイルを描画
+    drawLevel(level) {
+        const info = this.info;
+        const levelScale = Math.pow(2, level - info.max_level);
+        const size = info.tile_size;
+        const k = this.scale / levelScale;  // レベル座標 -> キャンバス座標
+        const cols = Math.ceil(Math.ceil(info.width * levelScale) / size);
+        const rows = Math.ceil(Math.ceil(info.height * levelScale) / size);
+        const c0 = Math.max(0, Math.floor(-this.offsetX / k / size));
+        const r0 = Math.max(0, Math.floor(-this.offsetY / k / size));
+        const c1 = Math.min(cols - 1, Math.floor((this.canvas.width - this.offsetX) / k / size));
+        const r1 = Math.min(rows - 1, Math.floor((this.canvas.height - this.offsetY) / k / size));
+
+        for (let row = r0; row <= r1; row++) {
+            for (let col = c0; col <= c1; col++) {
+                const tile = this.getTile(level, col, row);
+                if (!tile) continue;
+                this.ctx.drawImage(
+                    tile,
+                    this.offsetX + col * size * k, this.offsetY + row * size * k,
+                    tile.naturalWidth * k, tile.naturalHeight * k
+                );
+            }
+        }
+    }
+
+    draw() {
+        if (!this.info || this.drawPending) return;
+        this.drawPending = true;
+        requestAnimationFrame(() => {
+            this.drawPending = false;
+            if (!this.info) return;
+            this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+            // 読み込み中のタイルの代わりに、全体表示用の粗いレベルを下に描く
+            const baseLevel = this.levelFor(this.fitScale);
+            const level = this.levelFor(this.scale);
+            if (level !== baseLevel) {
+                this.drawLevel(baseLevel);
+            }
+            this.drawLevel(level);
+        });
+    }
+
+    setupEvents() {
+        const canvas = this.canvas;
+        let dragging = false;
+        let lastX = 0;
+        let lastY = 0;
+        let lastDist = 0;
+
+        canvas.addEventListener('wheel', (e) => {
+            e.preventDefault();
+            const rect = canvas.getBoundingClientRect();
+            this.zoomAt(e.deltaY < 0 ? 1.25 : 0.8,
+                (e.clientX - rect.left) * this.pixelRatio, (e.clientY - rect.top) * this.pixelRatio);
+        }, {passive: false});
+
+        canvas.addEventListener('mousedown', (e) => {
+            dragging = true;
+            lastX = e.clientX;
+            lastY = e.clientY;
+        });
+
+        window.addEventListener('mousemove', (e) => {
+            if (!dragging) return;
+            this.pan(e.clientX - lastX, e.clientY - lastY);
+            lastX = e.clientX;
+            lastY = e.clientY;
+        });
+
+        window.addEventListener('mouseup', () => {
+            dragging = false;
+        });
+
+        canvas.addEventListener('touchstart', (e) => {
+            e.preventDefault();
+            if (e.touches.length === 1) {
+                lastX = e.touches[0].clientX;
+                lastY = e.touches[0].clientY;
+            } else if (e.touches.length === 2) {
+                lastDist = Math.hypot(
+                    e.touches[1].clientX - e.touches[0].clientX,
+                    e.touches[1].clientY - e.touches[0].clientY
+                );
+            }
+        }, {passive: false});
+
+        canvas.addEventListener('touchmove', (e) => {
+            e.preventDefault();
+            if (e.touches.length === 1) {
+                this.pan(e.touches[0].clientX - lastX, e.touches[0].clientY - lastY);
+                lastX = e.touches[0].clientX;
+                lastY = e.touches[0].clientY;
+            } else if (e.touches.length === 2) {
+                const rect = canvas.getBoundingClientRect();
+                const dist = Math.hypot(
+                    e.touches[1].clientX - e.touches[0].clientX,
+                    e.touches[1].clientY - e.touches[0].clientY
+                );
+                const cx = ((e.touches[0].clientX + e.touches[1].clientX) / 2 - rect.left) * this.pixelRatio;
+                const cy = ((e.touches[0].clientY + e.touches[1].clientY) / 2 - rect.top) * this.pixelRatio;
+                if (lastDist > 0) {
+                    this.zoomAt(dist / lastDist, cx, cy);
+                }
+                lastDist = dist;
+            }
+        }, {passive: false});
+
+        canvas.addEventListener('touchend', (e) => {
+            // 2本指から1本指に戻ったときの位置の跳びを防ぐ
+            if (e.touches.length === 1) {
+                lastX = e.touches[0].clientX;
+                lastY = e.touches[0].clientY;
+            }
+            lastDist = 0;
+        });
+
+        window.addEventListener('resize', () => {
+            if (!this.info) return;
+            this.resize();
+            this.reset();
+        });
+    }
+}
+
+const snapshotViewer = new TileViewer(snapshotViewerContainer);
+
+// スナップショット応答から画像のURLを取得（保存済みならサーバーのURL、それ以外はデータURL）
+function snapshotSrc(data) {
+    return data.image_url || `data:image/jpeg;base64,${data.image}`;
+}
+
+// 撮影された画像データを保存するオブジェクト
+let capturedImages = {
+    annotation: {},
+    dimension: {},
+    anomaly: {}
+};
+
+// サイドバーの切り替え
+sidebarToggle.addEventListener('click', () => {
+    sidebar.classList.toggle('expanded');
+});
+
+// モバイルメニュー
+mobileMenuButton.addEventListener('click', () => {
+    sidebar.classList.toggle('mobile-visible');
+    mobileOverlay.classList.toggle('visible');
+});
+
+mobileOverlay.addEventListener('click', () => {
+    sidebar.classList.remove('mobile-visible');
+    mobileOverlay.classList.remove('visible');
+});
+
+// タブの切り替え
+tabs.forEach(tab => {
+    tab.addEventListener('click', () => {
+        // 現在のアクティブなタブを非アクティブにする
+        document.querySelector('.tab.active').classList.remove('active');
+        document.querySelector('.tab-content.active').classList.remove('active');
+
+        // クリックされたタブをアクティブにする
+        tab.classList.add('active');
+        currentTab = tab.dataset.tab;
+        pageTitle.textContent = tab.querySelector('.tab-text').textContent;
+        document.getElementById(`${currentTab}-tab`).classList.add('active');
+
+        // モバイルメニューを閉じる
+        sidebar.classList.remove('mobile-visible');
+        mobileOverlay.classList.remove('visible');
+
+        // タブが変更されたときに必要な処理
+        if (currentTab === 'fleet') {
+            fetchFleetMetrics();
+        } else if (currentTab === 'streaming') {
+            fetchCameras();
+        } else if (Object.keys(cameras).length === 0) {
+            fetchCameras().then(() => {
+                updateFunctionGrid(currentTab);
+            });
+        } else {
+            updateFunctionGrid(currentTab);
+        }
+    });
+});
+
+// カメラ情報を取得する関数
+async function fetchCameras() {
+    try {
+        // ストリーミングタブではグループ・タグの絞り込みをサーバー側の索引で行う
+        const params = new URLSearchParams();
+        if (currentTab === 'streaming') {
+            if (cameraGroupFilter) params.set('group', cameraGroupFilter);
+            if (cameraTagFilter) params.set('tag', cameraTagFilter);
+        }
+        const [response, filtersResponse] = await Promise.all([
+            fetch(`/api/cameras?${params}`),
+            fetch('/api/tags')
+        ]);
+        if (!response.ok || !filtersResponse.ok) {
+            throw new Error('サーバーからのレスポンスエラー');
+        }
+
+        cameras = await response.json();
+        cameraFilters = await filtersResponse.json();
+
+        if (currentTab === 'streaming') {
+            renderCameraGrid();
+        } else {
+            updateFunctionGrid(currentTab);
+        }
+
+        return cameras;
+    } catch (error) {
+        console.error('カメラ情報取得エラー:', error);
+        const errorMessage = `
+            <div class="placeholder">
+                <div class="placeholder-icon">⚠️</div>
+                <p>カメラ情報の取得に失敗しました。</p>
+                <p>${error.message}</p>
+            </div>
+        `;
+
+        cameraGrid.innerHTML = errorMessage;
+        annotationGrid.innerHTML = errorMessage;
+        dimensionGrid.innerHTML = errorMessage;
+        anomalyGrid.innerHTML = errorMessage;
+    }
+}
+
+// 機能タブのグリッドを更新する関数
+function updateFunctionGrid(tabName) {
+    const grid = document.getElementById(`${tabName}-grid`);
+
+    if (Object.keys(cameras).length === 0) {
+        grid.innerHTML = `
+            <div class="placeholder">
+                <div class="placeholder-icon">⚠️</div>
+                <p>カメラが見つかりません。</p>
+                <p>カメラノードを起動して、このサーバーに接続してください。</p>
+            </div>
+        `;
+        return;
+    }
+
+    let gridHTML = '';
+
+    for (const [nodeId, camera] of Object.entries(cameras)) {
+        if (camera.status !== 'running') continue;
+
+        let functionContent = '';
+
+        // 各タブごとの特有のコンテンツ
+        if (tabName === 'annotation') {
+            functionContent = `
+                <div class="function-card-content">
+                    <button id="capture-annotation-${nodeId}" class="capture-btn">静止画を撮影</button>
+                    <img id="annotation-preview-${nodeId}" class="function-preview" src="${camera.thumbnail_url}" alt="${camera.name}のプレビュー">
+                    <div id="annotation-container-${nodeId}" class="annotation-container" style="display: none;">
+                        <img id="annotation-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
+                        <canvas id="annotation-canvas-${nodeId}" class="annotation-canvas"></canvas>
+                        <div class="zoom-annotation-controls">
+                            <button id="zoom-in-annotation-${nodeId}">+</button>
+                            <button id="zoom-out-annotation-${nodeId}">-</button>
+                            <button id="zoom-reset-annotation-${nodeId}">↺</button>
+                        </div>
+                    </div>
+                    <div id="annotation-controls-${nodeId}" class="annotation-controls" style="display: none;">
+                        <div>
+                            <button id="clear-annotation-${nodeId}">消去</button>
+                            <button id="save-annotation-${nodeId}">保存</button>
+                            <button id="recapture-annotation-${nodeId}">再撮影</button>
+                        </div>
+                        <div class="size-control">
+                            <label for="color-${nodeId}">色:</label>
+                            <input type="color" id="color-${nodeId}" class="color-picker" value="#ff0000">
+                            <label for="size-${nodeId}">太さ:</label>
+                            <input type="range" id="size-${nodeId}" min="1" max="20" value="5">
+                        </div>
+                    </div>
+                </div>
+            `;
+        } else if (tabName === 'dimension') {
+            functionContent = `
+                <div class="function-card-content">
+                    <button id="capture-dimension-${nodeId}" class="capture-btn">静止画を撮影</button>
+                    <img id="dimension-preview-${nodeId}" class="function-preview" src="${camera.thumbnail_url}" alt="${camera.name}のプレビュー">
+                    <div id="dimension-container-${nodeId}" class="dimension-container" style="display: none;">
+                        <img id="dimension-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
+                        <canvas id="dimension-canvas-${nodeId}" class="dimension-canvas"></canvas>
+                        <div class="zoom-annotation-controls">
+                            <button id="zoom-in-dimension-${nodeId}">+</button>
+                            <button id="zoom-out-dimension-${nodeId}">-</button>
+                            <button id="zoom-reset-dimension-${nodeId}">↺</button>
+                        </div>
+                    </div>
+                    <div id="dimension-controls-${nodeId}" class="dimension-controls" style="display: none;">
+                        <button id="clear-dimension-${nodeId}">リセット</button>
+                        <button id="auto-dimension-${nodeId}">自動寸法測定</button>
+                        <button id="recapture-dimension-${nodeId}">再撮影</button>
+                    </div>
+                    <div id="dimension-info-${nodeId}" class="dimension-info" style="display: none;">
+                        <p>2点間の距離を測定するには、画像上で2点をクリックしてください。</p>
+                        <p id="dimension-result-${nodeId}">測定結果: まだ測定されていません</p>
+                    </div>
+                </div>
+            `;
+        } else if (tabName === 'anomaly') {
+            functionContent = `
+                <div class="function-card-content">
+                    <button id="capture-anomaly-${nodeId}" class="capture-btn">静止画を撮影</button>
+                    <img id="anomaly-preview-${nodeId}" class="function-preview" src="${camera.thumbnail_url}" alt="${camera.name}のプレビュー">
+                    <div id="anomaly-container-${nodeId}" class="anomaly-container" style="display: none;">
+                        <img id="anomaly-img-${nodeId}" class="annotation-image" src="" alt="${camera.name}の画像" />
+                        <canvas id="anomaly-canvas-${nodeId}" class="heatmap-canvas"></canvas>
+                        <div class="zoom-annotation-controls">
+                            <button id="zoom-in-anomaly-${nodeId}">+</button>
+                            <button id="zoom-out-anomaly-${nodeId}">-</button>
+                            <button id="zoom-reset-anomaly-${nodeId}">↺</button>
+                        </div>
+                    </div>
+                    <div id="anomaly-controls-${nodeId}" class="anomaly-controls" style="display: none;">
+                        <button id="detect-anomaly-${nodeId}">異常検知実行</button>
+                        <button id="recapture-anomaly-${nodeId}">再撮影</button>
+                    </div>
+                    <div id="anomaly-info-${nodeId}" class="anomaly-info" style="display: none;">
+                        <p>異常検知の結果がここに表示されます。</p>
+                        <p id="anomaly-result-${nodeId}">検知結果: まだ実行されていません</p>
+                    </div>
+                </div>
+            `;
+        }
+
+        gridHTML += `
+            <div class="function-card" data-id="${nodeId}">
+                <h3>${camera.name}</h3>
+                ${functionContent}
+            </div>
+        `;
+    }
+
+    if (gridHTML === '') {
+        grid.innerHTML = `
+            <div class="placeholder">
+                <div class="placeholder-icon">⚠️</div>
+                <p>利用可能なカメラがありません。</p>
+                <p>カメラノードを起動して、このサーバーに接続してください。</p>
+            </div>
+        `;
+    } else {
+        grid.innerHTML = gridHTML;
+
+        // 各タブごとのイベントリスナーを設定
+        if (tabName === 'annotation') {
+            setupAnnotationEvents();
+        } else if (tabName === 'dimension') {
+            setupDimensionEvents();
+        } else if (tabName === 'anomaly') {
+            setupAnomalyEvents();
+        }
+    }
+}
+
+// アノテーションタブのイベントセットアップ
+function setupAnnotationEvents() {
+    for (const [nodeId, camera] of Object.entries(cameras)) {
+        if (camera.status !== 'running') continue;
+
+        const captureBtn = document.getElementById(`capture-annotation-${nodeId}`);
+        const preview = document.getElementById(`annotation-preview-${nodeId}`);
+        const container = document.getElementById(`annotation-container-${nodeId}`);
+        const controls = document.getElementById(`annotation-controls-${nodeId}`);
+        const clearBtn = document.getElementById(`clear-annotation-${nodeId}`);
+        const saveBtn = document.getElementById(`save-annotation-${nodeId}`);
+        const recaptureBtn = document.getElementById(`recapture-annotation-${nodeId}`);
+        const canvas = document.getElementById(`annotation-canvas-${nodeId}`);
+        const img = document.getElementById(`annotation-img-${nodeId}`);
+        const colorPicker = document.getElementById(`color-${nodeId}`);
+        const sizeSlider = document.getElementById(`size-${nodeId}`);
+
+        if (!captureBtn) continue;
+
+        // 撮影ボタンのイベント
+        captureBtn.addEventListener('click', async () => {
+            try {
+                const response = await fetch(`/api/snapshot/${nodeId}?inline=0&purpose=annotation`);
+                if (!response.ok) {
+                    throw new Error('スナップショット取得エラー');
+                }
+
+                const data = await response.json();
+
+                if (data.success && (data.image || data.image_url)) {
+                    // 画像データを保存
+                    capturedImages.annotation[nodeId] = snapshotSrc(data);
+                    canvas.snapshotId = data.snapshot_id || null;
+
+                    // 画像を表示
+                    img.src = capturedImages.annotation[nodeId];
+                    container.style.display = 'block';
+                    controls.style.display = 'flex';
+                    captureBtn.style.display = 'none';
+                    preview.style.display = 'none';
+
+                    // 画像読み込み完了後にキャンバスをセットアップ
+                    img.onload = () => {
+                        setupCanvas(canvas, img, nodeId);
+                    };
+                } else {
+                    alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
+                }
+            } catch (error) {
+                console.error('スナップショットエラー:', error);
+                alert('スナップショット取得エラー: ' + error.message);
+            }
+        });
+
+        // クリアボタンのイベント
+        clearBtn.addEventListener('click', () => {
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            canvas.strokes = [];
+        });
+
+        // 保存ボタンのイベント
+        saveBtn.addEventListener('click', async () => {
+            // サーバーに保存できない場合（スナップショットIDなし）はブラウザで合成してダウンロード
+            if (!canvas.snapshotId) {
+                const annotatedImage = combineImageAndCanvas(img, canvas);
+                const link = document.createElement('a');
+                link.download = `annotation_${camera.name}_${new Date().toISOString()}.png`;
+                link.href = annotatedImage;
+                link.click();
+                alert('アノテーションを保存しました');
+                return;
+            }
+
+            try {
+                // ストロークをフル解像度座標のベクターとしてサーバーに保存
+                const response = await fetch(`/api/annotations/${canvas.snapshotId}`, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({strokes: canvas.strokes || []})
+                });
+                if (!response.ok) {
+                    throw new Error('アノテーション保存エラー');
+                }
+
+                // サーバーでフル解像度に合成した画像をダウンロード
+                const link = document.createElement('a');
+                link.download = `annotation_${camera.name}_${new Date().toISOString()}.jpg`;
+                link.href = `/api/annotations/${canvas.snapshotId}/render`;
+                link.click();
+                alert('アノテーションを保存しました');
+            } catch (error) {
+                console.error('アノテーション保存エラー:', error);
+                alert('アノテーション保存エラー: ' + error.message);
+            }
+        });
+
+        // 再撮影ボタンのイベント
+        recaptureBtn.addEventListener('click', () => {
+            container.style.display = 'none';
+            controls.style.display = 'none';
+            captureBtn.style.display = 'block';
+            preview.src = `${camera.thumbnail_url}?t=${new Date().getTime()}`;
+            preview.style.display = 'block';
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            canvas.strokes = [];
+            canvas.snapshotId = null;
+        });
+    }
+}
+
+// 寸法検知タブのイベントセットアップ
+function setupDimensionEvents() {
+    for (const [nodeId, camera] of Object.entries(cameras)) {
+        if (camera.status !== 'running') continue;
+
+        const captureBtn = document.getElementById(`capture-dimension-${nodeId}`);
+        const preview = document.getElementById(`dimension-preview-${nodeId}`);
+        const container = document.getElementById(`dimension-container-${nodeId}`);
+        const controls = document.getElementById(`dimension-controls-${nodeId}`);
+        const infoBox = document.getElementById(`dimension-info-${nodeId}`);
+        const clearBtn = document.getElementById(`clear-dimension-${nodeId}`);
+        const recaptureBtn = document.getElementById(`recapture-dimension-${nodeId}`);
+        const autoBtn = document.getElementById(`auto-dimension-${nodeId}`);
+        const canvas = document.getElementById(`dimension-canvas-${nodeId}`);
+        const img = document.getElementById(`dimension-img-${nodeId}`);
+        const resultText = document.getElementById(`dimension-result-${nodeId}`);
+
+        if (!captureBtn) continue;
+
+        // 撮影ボタンのイベント
+        captureBtn.addEventListener('click', async () => {
+            try {
+                // 自動寸法測定の結果も合わせて取得
+                const response = await fetch(`/api/snapshot/${nodeId}?dimensions=1&inline=0&purpose=dimension`);
+                if (!response.ok) {
+                    throw new Error('スナップショット取得エラー');
+                }
+
+                const data = await response.json();
+
+                if (data.success && (data.image || data.image_url)) {
+                    // 画像データを保存
+                    capturedImages.dimension[nodeId] = snapshotSrc(data);
+                    canvas.autoDimensions = data.dimensions || null;
+
+                    // 画像を表示
+                    img.src = capturedImages.dimension[nodeId];
+                    container.style.display = 'block';
+                    controls.style.display = 'flex';
+                    infoBox.style.display = 'block';
+                    captureBtn.style.display = 'none';
+                    preview.style.display = 'none';
+
+                    // 画像読み込み完了後にキャンバスをセットアップ
+                    img.onload = () => {
+                        setupDimensionCanvas(canvas, img, nodeId, resultText);
+                    };
+                } else {
+                    alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
+                }
+            } catch (error) {
+                console.error('スナップショットエラー:', error);
+                alert('スナップショット取得エラー: ' + error.message);
+            }
+        });
+
+        // クリアボタンのイベント
+        clearBtn.addEventListener('click', () => {
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            resultText.textContent = '測定結果: まだ測定されていません';
+            // 測定点をリセット
+            canvas.points = [];
+        });
+
+        // 自動寸法測定ボタンのイベント
+        autoBtn.addEventListener('click', () => {
+            drawAutoDimensions(canvas, resultText);
+        });
+
+        // 再撮影ボタンのイベント
+        recaptureBtn.addEventListener('click', () => {
+            container.style.display = 'none';
+            controls.style.display = 'none';
+            infoBox.style.display = 'none';
+            captureBtn.style.display = 'block';
+            preview.src = `${camera.thumbnail_url}?t=${new Date().getTime()}`;
+            preview.style.display = 'block';
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+        });
+    }
+}
+
+// 異常検知タブのイベントセットアップ
+function setupAnomalyEvents() {
+    for (const [nodeId, camera] of Object.entries(cameras)) {
+        if (camera.status !== 'running') continue;
+
+        const captureBtn = document.getElementById(`capture-anomaly-${nodeId}`);
+        const preview = document.getElementById(`anomaly-preview-${nodeId}`);
+        const container = document.getElementById(`anomaly-container-${nodeId}`);
+        const controls = document.getElementById(`anomaly-controls-${nodeId}`);
+        const infoBox = document.getElementById(`anomaly-info-${nodeId}`);
+        const detectBtn = document.getElementById(`detect-anomaly-${nodeId}`);
+        const recaptureBtn = document.getElementById(`recapture-anomaly-${nodeId}`);
+        const canvas = document.getElementById(`anomaly-canvas-${nodeId}`);
+        const img = document.getElementById(`anomaly-img-${nodeId}`);
+        const resultText = document.getElementById(`anomaly-result-${nodeId}`);
+
+        if (!captureBtn) continue;
+
+        // 撮影ボタンのイベント
+        captureBtn.addEventListener('click', async () => {
+            try {
+                const response = await fetch(`/api/snapshot/${nodeId}?inline=0&purpose=anomaly`);
+                if (!response.ok) {
+                    throw new Error('スナップショット取得エラー');
+                }
+
+                const data = await response.json();
+
+                if (data.success && (data.image || data.image_url)) {
+                    // 画像データを保存
+                    capturedImages.anomaly[nodeId] = snapshotSrc(data);
+
+                    // 画像を表示
+                    img.src = capturedImages.anomaly[nodeId];
+                    container.style.display = 'block';
+                    controls.style.display = 'flex';
+                    infoBox.style.display = 'block';
+                    captureBtn.style.display = 'none';
+                    preview.style.display = 'none';
+
+                    // 画像読み込み完了後にキャンバスをセットアップ
+                    img.onload = () => {
+                        setupAnomalyCanvas(canvas, img);
+                    };
+                } else {
+                    alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
+                }
+            } catch (error) {
+                console.error('スナップショットエラー:', error);
+                alert('スナップショット取得エラー: ' + error.message);
+            }
+        });
+
+        // 異常検知ボタンのイベント
+        detectBtn.addEventListener('click', () => {
+            // 異常検知の実行（サンプルとして擬似的なヒートマップを生成）
+            detectAnomalies(canvas, img, resultText);
+        });
+
+        // 再撮影ボタンのイベント
+        recaptureBtn.addEventListener('click', () => {
+            container.style.display = 'none';
+            controls.style.display = 'none';
+            infoBox.style.display = 'none';
+            captureBtn.style.display = 'block';
+            preview.src = `${camera.thumbnail_url}?t=${new Date().getTime()}`;
+            preview.style.display = 'block';
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            resultText.textContent = '検知結果: まだ実行されていません';
+        });
+    }
+}
+
+// アノテーション用キャンバスのセットアップ
+function setupCanvas(canvas, img, nodeId) {
+    const rect = img.getBoundingClientRect();
+    canvas.width = rect.width;
+    canvas.height = rect.height;
+
+    const ctx = canvas.getContext('2d');
+    let isDrawing = false;
+    let lastX = 0;
+    let lastY = 0;
+    let scale = 1;
+    let translateX = 0;
+    let translateY = 0;
+    let startDist = 0;
+
+    // サーバー保存用のストローク（元画像のピクセル座標で記録する）
+    canvas.strokes = [];
+
+    function beginStroke(x, y) {
+        const ratio = img.naturalWidth / canvas.width;
+        canvas.strokes.push({
+            color: document.getElementById(`color-${nodeId}`).value,
+            width: document.getElementById(`size-${nodeId}`).value * ratio,
+            points: [[x * ratio, y * ratio]]
+        });
+    }
+
+    function extendStroke(x, y) {
+        const ratio = img.naturalWidth / canvas.width;
+        const stroke = canvas.strokes[canvas.strokes.length - 1];
+        if (stroke) stroke.points.push([x * ratio, y * ratio]);
+    }
+
+    // タッチでの描画
+    canvas.addEventListener('touchstart', function(e) {
+        if (e.touches.length === 1) {
+            // 1本指の場合は描画
+            e.preventDefault();
+            const touch = e.touches[0];
+            const rect = canvas.getBoundingClientRect();
+            lastX = (touch.clientX - rect.left) / scale - translateX;
+            lastY = (touch.clientY - rect.top) / scale - translateY;
+            isDrawing = true;
+            beginStroke(lastX, lastY);
+        } else if (e.touches.length === 2) {
+            // 2本指の場合はズーム
+            e.preventDefault();
+            const touch1 = e.touches[0];
+            const touch2 = e.touches[1];
+            startDist = Math.hypot(
+                touch2.clientX - touch1.clientX,
+                touch2.clientY - touch1.clientY
+            );
+        }
+    });
+
+    canvas.addEventListener('touchmove', function(e) {
+        if (e.touches.length === 1 && isDrawing) {
+            // 1本指の場合は描画
+            e.preventDefault();
+            const touch = e.touches[0];
+            const rect = canvas.getBoundingClientRect();
+            const x = (touch.clientX - rect.left) / scale - translateX;
+            const y = (touch.clientY - rect.top) / scale - translateY;
+
+            ctx.beginPath();
+            ctx.moveTo(lastX, lastY);
+            ctx.lineTo(x, y);
+            ctx.strokeStyle = document.getElementById(`color-${nodeId}`).value;
+            ctx.lineWidth = document.getElementById(`size-${nodeId}`).value;
+            ctx.lineCap = 'round';
+            ctx.stroke();
+            extendStroke(x, y);
+
+            lastX = x;
+            lastY = y;
+        } else if (e.touches.length === 2) {
+            // 2本指の場合はズーム
+            e.preventDefault();
+            const touch1 = e.touches[0];
+            const touch2 = e.touches[1];
+            const dist = Math.hypot(
+                touch2.clientX - touch1.clientX,
+                touch2.clientY - touch1.clientY
+            );
+
+            const newScale = scale * (dist / startDist);
+            if (newScale > 0.5 && newScale < 5) {  // スケール制限
+                scale = newScale;
+
+                // 中心点を計算
+                const centerX = (touch1.clientX + touch2.clientX) / 2;
+                const centerY = (touch1.clientY + touch2.clientY) / 2;
+                const rect = canvas.getBoundingClientRect();
+                const canvasCenterX = (centerX - rect.left) / scale - translateX;
+                const canvasCenterY = (centerY - rect.top) / scale - translateY;
+
+                // 変換を更新
+                img.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
+                canvas.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
+            }
+
+            startDist = dist;
+        }
+    });
+
+    canvas.addEventListener('touchend', function(e) {
+        if (e.touches.length === 0) {
+            isDrawing = false;
+        }
+    });
+
+    // マウスでの描画（デスクトップ用）
+    canvas.addEventListener('mousedown', function(e) {
+        const rect = canvas.getBoundingClientRect();
+        lastX = (e.clientX - rect.left) / scale - translateX;
+        lastY = (e.clientY - rect.top) / scale - translateY;
+        isDrawing = true;
+        beginStroke(lastX, lastY);
+    });
+
+    canvas.addEventListener('mousemove', function(e) {
+        if (!isDrawing) return;
+
+        const rect = canvas.getBoundingClientRect();
+        const x = (e.clientX - rect.left) / scale - translateX;
+        const y = (e.clientY - rect.top) / scale - translateY;
+
+        ctx.beginPath();
+        ctx.moveTo(lastX, lastY);
+        ctx.lineTo(x, y);
+        ctx.strokeStyle = document.getElementById(`color-${nodeId}`).value;
+        ctx.lineWidth = document.getElementById(`size-${nodeId}`).value;
+        ctx.lineCap = 'round';
+        ctx.stroke();
+        extendStroke(x, y);
+
+        lastX = x;
+        lastY = y;
+    });
+
+    canvas.addEventListener('mouseup', function() {
+        isDrawing = false;
+    });
+
+    canvas.addEventListener('mouseout', function() {
+        isDrawing = false;
+    });
+}
+
+// 寸法検知用キャンバスのセットアップ
+function setupDimensionCanvas(canvas, img, nodeId, resultText) {
+    const rect = img.getBoundingClientRect();
+    canvas.width = rect.width;
+    canvas.height = rect.height;
+
+    const ctx = canvas.getContext('2d');
+    canvas.points = [];
+
+    // クリックイベント（タッチ含む）
+    function handleClick(e) {
+        e.preventDefault();
+
+        const rect = canvas.getBoundingClientRect();
+        let x, y;
+
+        if (e.type === 'touchstart') {
+            x = e.touches[0].clientX - rect.left;
+            y = e.touches[0].clientY - rect.top;
+        } else {
+            x = e.clientX - rect.left;
+            y = e.clientY - rect.top;
+        }
+
+        // 点の描画
+        ctx.beginPath();
+        ctx.arc(x, y, 5, 0, Math.PI * 2);
+        ctx.fillStyle = 'red';
+        ctx.fill();
+
+        // テキスト
+        ctx.fillStyle = 'white';
+        ctx.strokeStyle = 'black';
+        ctx.lineWidth = 2;
+        ctx.font = '12px Arial';
+        ctx.strokeText(`点${canvas.points.length + 1}`, x + 10, y - 10);
+        ctx.fillText(`点${canvas.points.length + 1}`, x + 10, y - 10);
+
+        // 点を保存
+        canvas.points.push({x, y});
+
+        // 2点目が追加されたら線を引く
+        if (canvas.points.length === 2) {
+            const p1 = canvas.points[0];
+            const p2 = canvas.points[1];
+
+            // 線を引く
+            ctx.beginPath();
+            ctx.moveTo(p1.x, p1.y);
+            ctx.lineTo(p2.x, p2.y);
+            ctx.strokeStyle = 'yellow';
+            ctx.lineWidth = 2;
+            ctx.stroke();
+
+            // 距離の計算
+            const distance = Math.sqrt(Math.pow(p2.x - p1.x, 2) + Math.pow(p2.y - p1.y, 2));
+
+            // 中間点に距離を表示
+            const midX = (p1.x + p2.x) / 2;
+            const midY = (p1.y + p2.y) / 2;
+
+            ctx.fillStyle = 'white';
+            ctx.strokeStyle = 'black';
+            ctx.font = '14px Arial';
+
+            const dimensionText = `${distance.toFixed(1)}px`;
+            ctx.strokeText(dimensionText, midX, midY - 10);
+            ctx.fillText(dimensionText, midX, midY - 10);
+
+            // 結果テキストの更新
+            resultText.textContent = `測定結果: 2点間の距離は ${distance.toFixed(1)}px です`;
+
+            // リセットする（次の測定のため）
+            setTimeout(() => {
+                canvas.points = [];
+            }, 500);
+        }
+    }
+
+    canvas.addEventListener('mousedown', handleClick);
+    canvas.addEventListener('touchstart', handleClick);
+}
+
+// 自動寸法測定の結果を描画する関数
+function drawAutoDimensions(canvas, resultText) {
+    const result = canvas.autoDimensions;
+    if (!result || result.error) {
+        resultText.textContent = '測定結果: 自動寸法測定に失敗しました' + (result ? ` (${result.error})` : '');
+        return;
+    }
+
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+
+    // 測定画像の座標からキャンバス座標への変換係数
+    const sx = canvas.width / result.image_size[0];
+    const sy = canvas.height / result.image_size[1];
+
+    // 測定領域
+    const [rx, ry, rw, rh] = result.roi;
+    ctx.setLineDash([6, 4]);
+    ctx.strokeStyle = 'rgba(0, 98, 204, 0.8)';
+    ctx.lineWidth = 1;
+    ctx.strokeRect(rx * sx, ry * sy, rw * sx, rh * sy);
+    ctx.setLineDash([]);
+
+    result.objects.forEach((obj, i) => {
+        ctx.lineWidth = 2;
+        ctx.strokeStyle = 'yellow';
+        ctx.beginPath();
+        if (obj.shape === 'circle') {
+            ctx.arc(obj.circle.center[0] * sx, obj.circle.center[1] * sy, obj.circle.radius_px * sx, 0, Math.PI * 2);
+        } else {
+            obj.box.forEach(([x, y], j) => {
+                if (j === 0) ctx.moveTo(x * sx, y * sy);
+                else ctx.lineTo(x * sx, y * sy);
+            });
+            ctx.closePath();
+        }
+        ctx.stroke();
+
+        // 寸法ラベル
+        const label = obj.shape === 'circle'
+            ? `#${i + 1} φ${obj.circle.equivalent_diameter.toFixed(1)}${result.unit}`
+            : `#${i + 1} ${obj.length.toFixed(1)}×${obj.width.toFixed(1)}${result.unit}`;
+        ctx.fillStyle = 'white';
+        ctx.strokeStyle = 'black';
+        ctx.font = '12px Arial';
+        ctx.strokeText(label, obj.center[0] * sx, obj.center[1] * sy);
+        ctx.fillText(label, obj.center[0] * sx, obj.center[1] * sy);
+    });
+
+    resultText.textContent = result.objects.length === 0
+        ? '測定結果: 輪郭が検出されませんでした'
+        : `測定結果: ${result.objects.length}個の輪郭を測定しました（単位: ${result.unit}）`;
+}
+
+// 異常検知用キャンバスのセットアップ
+function setupAnomalyCanvas(canvas, img) {
+    const rect = img.getBoundingClientRect();
+    canvas.width = rect.width;
+    canvas.height = rect.height;
+}
+
+// 異常検知実行関数（サンプル実装）
+function detectAnomalies(canvas, img, resultText) {
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+
+    // サンプルとして擬似的なヒートマップを生成
+    const gradients = [
+        {pos: [0.2, 0.3], radius: 30, intensity: 0.8},
+        {pos: [0.5, 0.6], radius: 40, intensity: 0.6},
+        {pos: [0.8, 0.2], radius: 25, intensity: 0.9}
+    ];
+
+    // ヒートマップの描画
+    for (const grad of gradients) {
+        const centerX = canvas.width * grad.pos[0];
+        const centerY = canvas.height * grad.pos[1];
+
+        const grd = ctx.createRadialGradient(
+            centerX, centerY, 1,
+            centerX, centerY, grad.radius
+        );
+
+        grd.addColorStop(0, `rgba(255, 0, 0, ${grad.intensity})`);
+        grd.addColorStop(1, 'rgba(255, 0, 0, 0)');
+
+        ctx.fillStyle = grd;
+        ctx.beginPath();
+        ctx.arc(centerX, centerY, grad.radius, 0, Math.PI * 2);
+        ctx.fill();
+    }
+
+    // 結果テキストの更新
+    resultText.textContent = `検知結果: ${gradients.length}箇所の異常が検出されました`;
+}
+
+// 画像とキャンバスを合成する関数
+function combineImageAndCanvas(img, canvas) {
+    const combinedCanvas = document.createElement('canvas');
+    combinedCanvas.width = canvas.width;
+    combinedCanvas.height = canvas.height;
+
+    const ctx = combinedCanvas.getContext('2d');
+    ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+    ctx.drawImage(canvas, 0, 0);
+
+    return combinedCanvas.toDataURL('image/png');
+}
+
+// 表示範囲に入ったカメラのみストリームを開き、外れたらサーバーのサムネイルに切り替える
+// （タブが非表示の間も交差しない扱いになるため、ストリームは自動的に閉じられる）
+const streamObserver = new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            startStream(entry.target.dataset.id);
+        } else {
+            pauseStream(entry.target.dataset.id);
+        }
+    });
+}, { rootMargin: '200px 0px' });
+
+function startStream(nodeId) {
+    const streamContainer = document.getElementById(`stream-${nodeId}`);
+    const img = streamContainer && streamContainer.querySelector('img');
+    if (!img || !streamContainer.classList.contains('paused')) return;
+
+    streamContainer.classList.remove('paused');
+    img.src = img.dataset.stream;
+}
+
+function pauseStream(nodeId) {
+    const streamContainer = document.getElementById(`stream-${nodeId}`);
+    const img = streamContainer && streamContainer.querySelector('img');
+    if (!img || streamContainer.classList.contains('paused') || !cameras[nodeId]) return;
+
+    // srcを差し替えるとMJPEGの接続が閉じられる
+    streamContainer.classList.add('paused');
+    img.src = `${cameras[nodeId].thumbnail_url}?t=${new Date().getTime()}`;
+}
+
+// ストリーム表示部分のHTML（最初はサムネイルを表示し、表示範囲に入ったらストリームに切り替える）
+function streamContent(nodeId, camera, streamUrl) {
+    return `
+        <div class="loading">読み込み中...</div>
+        ${camera.status === 'running'
+            ? `<img src="${camera.thumbnail_url}" data-stream="${streamUrl}" alt="${camera.name}" onerror="handleStreamError('${nodeId}')">`
+            : `<div class="error-overlay">カメラ接続エラー</div>`
+        }
+        <div class="zoom-controls">
+            <button class="zoom-in-btn" data-id="${nodeId}">+</button>
+            <button class="zoom-out-btn" data-id="${nodeId}">-</button>
+            <button class="zoom-reset-btn" data-id="${nodeId}">↺</button>
+        </div>
+    `;
+}
+
+// カメラのグループ名
+function cameraGroup(camera) {
+    return camera.group || UNGROUPED_LABEL;
+}
+
+// 絞り込みの選択肢を更新（選択中の値がなくなった場合は空に戻した値を返す）
+function updateFilterSelect(selectId, allLabel, counts, current) {
+    const select = document.getElementById(selectId);
+    const values = Object.keys(counts);
+    if (current && !values.includes(current)) {
+        current = '';
+        cameraPage = 0;
+    }
+    select.innerHTML = `<option value="">${allLabel}</option>` +
+        values.map(value => `<option value="${value}">${value} (${counts[value]})</option>`).join('');
+    select.value = current;
+    return current;
+}
+
+function updatePager(pageCount) {
+    document.getElementById('camera-page-label').textContent = `${cameraPage + 1} / ${pageCount}`;
+    document.getElementById('camera-page-prev').disabled = cameraPage === 0;
+    document.getElementById('camera-page-next').disabled = cameraPage >= pageCount - 1;
+}
+
+// カメラグリッドを描画する関数
+function renderCameraGrid() {
+    const cameraCount = Object.keys(cameras).length;
+    streamObserver.disconnect();
+    cameraGroupFilter = updateFilterSelect('camera-group-select', 'すべてのグループ', cameraFilters.groups, cameraGroupFilter);
+    cameraTagFilter = updateFilterSelect('camera-tag-select', 'すべてのタグ', cameraFilters.tags, cameraTagFilter);
+
+    if (cameraCount === 0) {
+        updatePager(1);
+        cameraGrid.innerHTML = cameraGroupFilter || cameraTagFilter ? `
+            <div class="placeholder">
+                <div class="placeholder-icon">🔍</div>
+                <p>条件に一致するカメラがありません。</p>
+            </div>
+        ` : `
+            <div class="placeholder">
+                <div class="placeholder-icon">🎥</div>
+                <p>カメラが見つかりません。</p>
+                <p>カメラノードを起動して、このサーバーに接続してください。</p>
+            </div>
+        `;
+        return;
+    }
+
+    // グループ・名前順に並べ、ページ内のカメラだけを描画する（絞り込みはサーバー側で済んでいる）
+    const groups = [...new Set(Object.values(cameras).map(cameraGroup))];
+    const entries = Object.entries(cameras)
+        .sort((a, b) => cameraGroup(a[1]).localeCompare(cameraGroup(b[1])) || a[1].name.localeCompare(b[1].name));
+    const pageCount = Math.max(1, Math.ceil(entries.length / CAMERA_PAGE_SIZE));
+    cameraPage = Math.min(cameraPage, pageCount - 1);
+    updatePager(pageCount);
+
+    let gridHTML = '';
+    let lastGroup = null;
+
+    for (const [nodeId, camera] of entries.slice(cameraPage * CAMERA_PAGE_SIZE, (cameraPage + 1) * CAMERA_PAGE_SIZE)) {
+        if (!cameraGroupFilter && groups.length > 1 && cameraGroup(camera) !== lastGroup) {
+            lastGroup = cameraGroup(camera);
+            gridHTML += `<h2 class="camera-group-header">${lastGroup}</h2>`;
+        }
+        gridHTML += `
+            <div class="camera-card" data-id="${nodeId}">
+                <div class="camera-header">
+                    <h3 class="camera-title">
+                        <span class="status-indicator status-${camera.status}"></span>
+                        ${camera.name}
+                    </h3>
+                    <div class="camera-actions">
+                        <button class="refresh-stream-btn" data-id="${nodeId}">リフレッシュ</button>
+                        <button class="snapshot-btn" data-id="${nodeId}">スナップショット</button>
+                    </div>
+                </div>
+                <div class="camera-stream paused" id="stream-${nodeId}" data-id="${nodeId}" data-zoom="1" data-translate-x="0" data-translate-y="0">
+                    ${streamContent(nodeId, camera, camera.url)}
+                </div>
+                <div class="camera-info">
+                    <p><strong>ID</strong> ${nodeId}</p>
+                    <p><strong>解像度</strong> ${camera.resolution ? camera.resolution.join(' x ') : '不明'}</p>
+                    <p><strong>ステータス</strong> ${getStatusText(camera.status)}</p>
+                    <p><strong>最終確認</strong> ${camera.last_seen}</p>
+                </div>
+            </div>
+        `;
+    }
+
+    cameraGrid.innerHTML = gridHTML;
+
+    // イベントリスナーを追加
+    document.querySelectorAll('.refresh-stream-btn').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            const nodeId = e.target.dataset.id;
+            refreshStream(nodeId);
+        });
+    });
+
+    document.querySelectorAll('.snapshot-btn').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            const nodeId = e.target.dataset.id;
+            takeSnapshot(nodeId);
+        });
+    });
+
+    cameraGrid.querySelectorAll('.camera-stream').forEach(el => streamObserver.observe(el));
+
+    // ズームコントロールのイベントリスナーを設定
+    setupZoomControls();
+}
+
+// ズームコントロールの設定
+function setupZoomControls() {
+    // ストリーミングタブのズームコントロール
+    document.querySelectorAll('.zoom-in-btn').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            const nodeId = e.target.dataset.id;
+            const streamContainer = document.getElementById(`stream-${nodeId}`);
+            const img = streamContainer.querySelector('img');
+            if (!img) return;
+
+            let scale = parseFloat(streamContainer.dataset.zoom || 1);
+            scale = Math.min(scale + 0.2, 3);  // 最大ズーム3倍
+            streamContainer.dataset.zoom = scale;
+            img.style.transform = `scale(${scale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
+        });
+    });
+
+    document.querySelectorAll('.zoom-out-btn').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            const nodeId = e.target.dataset.id;
+            const streamContainer = document.getElementById(`stream-${nodeId}`);
+            const img = streamContainer.querySelector('img');
+            if (!img) return;
+
+            let scale = parseFloat(streamContainer.dataset.zoom || 1);
+            scale = Math.max(scale - 0.2, 1);  // 最小ズーム等倍
+            streamContainer.dataset.zoom = scale;
+            img.style.transform = `scale(${scale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
+
+            // ズームアウト時に位置をリセットする場合
+            if (scale === 1) {
+                streamContainer.dataset.translateX = 0;
+                streamContainer.dataset.translateY = 0;
+            }
+        });
+    });
+
+    document.querySelectorAll('.zoom-reset-btn').forEach(btn => {
+        btn.addEventListener('click', (e) => {
+            const nodeId = e.target.dataset.id;
+            const streamContainer = document.getElementById(`stream-${nodeId}`);
+            const img = streamContainer.querySelector('img');
+            if (!img) return;
+
+            streamContainer.dataset.zoom = 1;
+            streamContainer.dataset.translateX = 0;
+            streamContainer.dataset.translateY = 0;
+            img.style.transform = 'scale(1) translate(0px, 0px)';
+        });
+    });
+
+    // ストリーミングタブでの画像ドラッグ機能
+    document.querySelectorAll('.camera-stream img').forEach(img => {
+        let isDragging = false;
+        let startX, startY;
+        let translateX = 0;
+        let translateY = 0;
+
+        // ドラッグ開始
+        img.addEventListener('mousedown', (e) => {
+            const streamContainer = e.target.closest('.camera-stream');
+            const scale = parseFloat(streamContainer.dataset.zoom || 1);
+            if (scale <= 1) return;  // ズームインしていない場合はドラッグ無効
+
+            isDragging = true;
+            startX = e.clientX;
+            startY = e.clientY;
+            translateX = parseFloat(streamContainer.dataset.translateX || 0);
+            translateY = parseFloat(streamContainer.dataset.translateY || 0);
+
+            streamContainer.classList.add('zoomed');
+        });
+
+        // ドラッグ中
+        window.addEventListener('mousemove', (e) => {
+            if (!isDragging) return;
+
+            const x = e.clientX;
+            const y = e.clientY;
+            const deltaX = (x - startX) / 5;
+            const deltaY = (y - startY) / 5;
+
+            const newTranslateX = translateX + deltaX;
+            const newTranslateY = translateY + deltaY;
+
+            const streamContainer = img.closest('.camera-stream');
+            const scale = parseFloat(streamContainer.dataset.zoom || 1);
+
+            streamContainer.dataset.translateX = newTranslateX;
+            streamContainer.dataset.translateY = newTranslateY;
+
+            img.style.transform = `scale(${scale}) translate(${newTranslateX}px, ${newTranslateY}px)`;
+        });
+
+        // ドラッグ終了
+        window.addEventListener('mouseup', () => {
+            isDragging = false;
+            document.querySelectorAll('.camera-stream.zoomed').forEach(el => {
+                el.classList.remove('zoomed');
+            });
+        });
+    });
+
+    // タッチデバイス用の処理
+    document.querySelectorAll('.camera-stream img').forEach(img => {
+        const streamContainer = img.closest('.camera-stream');
+
+        // ピンチズーム用の変数
+        let initialDistance = 0;
+        let initialScale = 1;
+
+        // タッチ開始
+        streamContainer.addEventListener('touchstart', (e) => {
+            if (e.touches.length === 2) {
+                // ピンチズームの場合
+                const touch1 = e.touches[0];
+                const touch2 = e.touches[1];
+                initialDistance = Math.hypot(
+                    touch2.clientX - touch1.clientX,
+                    touch2.clientY - touch1.clientY
+                );
+                initialScale = parseFloat(streamContainer.dataset.zoom || 1);
+                e.preventDefault();
+            } else if (e.touches.length === 1) {
+                // ドラッグの場合
+                const scale = parseFloat(streamContainer.dataset.zoom || 1);
+                if (scale <= 1) return;  // ズームインしていない場合はドラッグ無効
+
+                const touch = e.touches[0];
+                streamContainer.dataset.startX = touch.clientX;
+                streamContainer.dataset.startY = touch.clientY;
+                streamContainer.dataset.translateStartX = parseFloat(streamContainer.dataset.translateX || 0);
+                streamContainer.dataset.translateStartY = parseFloat(streamContainer.dataset.translateY || 0);
+                streamContainer.classList.add('zoomed');
+                e.preventDefault();
+            }
+        });
+
+        // タッチ移動
+        streamContainer.addEventListener('touchmove', (e) => {
+            if (e.touches.length === 2) {
+                // ピンチズームの場合
+                const touch1 = e.touches[0];
+                const touch2 = e.touches[1];
+                const currentDistance = Math.hypot(
+                    touch2.clientX - touch1.clientX,
+                    touch2.clientY - touch1.clientY
+                );
+
+                // スケールの計算
+                let newScale = initialScale * (currentDistance / initialDistance);
+                newScale = Math.max(1, Math.min(3, newScale));  // 1～3倍に制限
+
+                streamContainer.dataset.zoom = newScale;
+                img.style.transform = `scale(${newScale}) translate(${streamContainer.dataset.translateX || 0}px, ${streamContainer.dataset.translateY || 0}px)`;
+
+                e.preventDefault();
+            } else if (e.touches.length === 1) {
+                // ドラッグの場合
+                const scale = parseFloat(streamContainer.dataset.zoom || 1);
+                if (scale <= 1) return;
+
+                const touch = e.touches[0];
+                const startX = parseFloat(streamContainer.dataset.startX || 0);
+                const startY = parseFloat(streamContainer.dataset.startY || 0);
+                const translateStartX = parseFloat(streamContainer.dataset.translateStartX || 0);
+                const translateStartY = parseFloat(streamContainer.dataset.translateStartY || 0);
+
+                const deltaX = (touch.clientX - startX) / 5;
+                const deltaY = (touch.clientY - startY) / 5;
+
+                const newTranslateX = translateStartX + deltaX;
+                const newTranslateY = translateStartY + deltaY;
+
+                streamContainer.dataset.translateX = newTranslateX;
+                streamContainer.dataset.translateY = newTranslateY;
+
+                img.style.transform = `scale(${scale}) translate(${newTranslateX}px, ${newTranslateY}px)`;
+
+                e.preventDefault();
+            }
+        });
+
+        // タッチ終了
+        streamContainer.addEventListener('touchend', () => {
+            streamContainer.classList.remove('zoomed');
+        });
+    });
+
+    // アノテーション、寸法、異常検知のズームコントロール
+    ['annotation', 'dimension', 'anomaly'].forEach(tabType => {
+        for (const [nodeId, camera] of Object.entries(cameras)) {
+            const zoomInBtn = document.getElementById(`zoom-in-${tabType}-${nodeId}`);
+            const zoomOutBtn = document.getElementById(`zoom-out-${tabType}-${nodeId}`);
+            const zoomResetBtn = document.getElementById(`zoom-reset-${tabType}-${nodeId}`);
+            const img = document.getElementById(`${tabType}-img-${nodeId}`);
+            const canvas = document.getElementById(`${tabType}-canvas-${nodeId}`);
+
+            if (!zoomInBtn || !zoomOutBtn || !zoomResetBtn || !img || !canvas) continue;
+
+            let scale = 1;
+            let translateX = 0;
+            let translateY = 0;
+
+            // ズームイン
+            zoomInBtn.addEventListener('click', () => {
+                scale = Math.min(scale + 0.2, 3);
+                updateTransform();
+            });
+
+            // ズームアウト
+            zoomOutBtn.addEventListener('click', () => {
+                scale = Math.max(scale - 0.2, 1);
+                if (scale === 1) {
+                    translateX = 0;
+                    translateY = 0;
+                }
+                updateTransform();
+            });
+
+            // リセット
+            zoomResetBtn.addEventListener('click', () => {
+                scale = 1;
+                translateX = 0;
+                translateY = 0;
+                updateTransform();
+            });
+
+            // 変換を更新する関数
+            function updateTransform() {
+                img.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
+                canvas.style.transform = `scale(${scale}) translate(${translateX}px, ${translateY}px)`;
+            }
+        }
+    });
+}
+
+// ストリームをリフレッシュする関数
+function refreshStream(nodeId) {
+    if (!cameras[nodeId]) return;
+
+    const streamContainer = document.getElementById(`stream-${nodeId}`);
+    const camera = cameras[nodeId];
+
+    if (camera.status === 'running') {
+        streamContainer.innerHTML = streamContent(nodeId, camera, `${camera.url}?t=${new Date().getTime()}`);
+        streamContainer.classList.add('paused');
+
+        // 監視し直すと、表示範囲内であればすぐにストリームが開かれる
+        streamObserver.unobserve(streamContainer);
+        streamObserver.observe(streamContainer);
+
+        // ズームコントロールを再設定
+        setupZoomControls();
+    }
+}
+
+// スナップショットを取得する関数
+async function takeSnapshot(nodeId) {
+    if (!cameras[nodeId]) return;
+
+    try {
+        const response = await fetch(`/api/snapshot/${nodeId}?inline=0`);
+        if (!response.ok) {
+            throw new Error('スナップショット取得エラー');
+        }
+
+        const data = await response.json();
+
+        if (data.success && (data.image || data.image_url)) {
+            // スナップショットをモーダルに表示
+            snapshotTitle.textContent = `スナップショット: ${cameras[nodeId].name}`;
+            // 保存済みの画像はタイル表示（表示範囲のタイルのみ取得）、それ以外は画像をそのまま表示
+            if (data.snapshot_id) {
+                snapshotImg.style.display = 'none';
+                snapshotViewerContainer.classList.add('visible');
+                showModal(snapshotModal);
+                await snapshotViewer.open(`/api/snapshots/${data.snapshot_id}/tiles`);
+            } else {
+                snapshotViewerContainer.classList.remove('visible');
+                snapshotImg.style.display = 'block';
+                snapshotImg.src = snapshotSrc(data);
+                showModal(snapshotModal);
+            }
+        } else {
+            alert('スナップショット取得エラー: ' + (data.error || '不明なエラー'));
+        }
+    } catch (error) {
+        console.error('スナップショットエラー:', error);
+        alert('スナップショット取得エラー: ' + error.message);
+    }
+}
+
+// ストリームエラーを処理する関数
+function handleStreamError(nodeId) {
+    if (!cameras[nodeId]) return;
+
+    const streamContainer = document.getElementById(`stream-${nodeId}`);
+
+    // サムネイルが未取得なだけの場合はエラー表示にしない
+    if (streamContainer && !streamContainer.classList.contains('paused')) {
+        streamContainer.innerHTML = `
+            <div class="error-overlay">
+                ストリーム読み込みエラー
+                <button onclick="refreshStream('${nodeId}')">
+                    再試行
+                </button>
+            </div>
+            <div class="zoom-controls">
+                <button class="zoom-in-btn" data-id="${nodeId}">+</button>
+                <button class="zoom-out-btn" data-id="${nodeId}">-</button>
+                <button class="zoom-reset-btn" data-id="${nodeId}">↺</button>
+            </div>
+        `;
+    }
+}
+
+// ステータスのテキストを取得する関数
+function getStatusText(status) {
+    switch (status) {
+        case 'running': return '正常';
+        case 'error': return 'エラー';
+        case 'initializing': return '初期化中';
+        case 'unreachable': return '接続不可';
+        case 'unverified': return '確認中';
+        default: return status;
+    }
+}
+
+// グリッドの列数を切り替える関数
+function toggleGridColumns() {
+    if (gridColumns === 'auto-fill') {
+        gridColumns = '1';
+        cameraGrid.style.gridTemplateColumns = '1fr';
+        document.querySelectorAll('.camera-grid-function').forEach(grid => {
+            grid.style.gridTemplateColumns = '1fr';
+        });
+    } else {
+        gridColumns = 'auto-fill';
+        cameraGrid.style.gridTemplateColumns = 'repeat(auto-fill, minmax(450px, 1fr))';
+        document.querySelectorAll('.camera-grid-function').forEach(grid => {
+            grid.style.gridTemplateColumns = 'repeat(auto-fill, minmax(500px, 1fr))';
+        });
+    }
+}
+
+// モーダルの表示/非表示切り替え関数
+function showModal(modal) {
+    modal.style.display = 'flex';
+    setTimeout(() => {
+        modal.classList.add('visible');
+    }, 10);
+}
+
+function hideModal(modal) {
+    modal.classList.remove('visible');
+    setTimeout(() => {
+        modal.style.display = 'none';
+    }, 300);
+}
+
+// イベントリスナー
+refreshBtn.addEventListener('click', fetchCameras);
+gridToggleBtn.addEventListener('click', toggleGridColumns);
+
+// グループ・タグの絞り込みとページ切り替え
+document.getElementById('camera-group-select').addEventListener('change', (e) => {
+    cameraGroupFilter = e.target.value;
+    cameraPage = 0;
+    fetchCameras();
+});
+document.getElementById('camera-tag-select').addEventListener('change', (e) => {
+    cameraTagFilter = e.target.value;
+    cameraPage = 0;
+    fetchCameras();
+});
+document.getElementById('camera-page-prev').addEventListener('click', () => {
+    cameraPage = Math.max(0, cameraPage - 1);
+    renderCameraGrid();
+});
+document.getElementById('camera-page-next').addEventListener('click', () => {
+    cameraPage += 1;
+    renderCameraGrid();
+});
+
+// スナップショットビューアのズームボタン
+document.getElementById('snapshot-zoom-in').addEventListener('click', () => snapshotViewer.zoomCenter(1.25));
+document.getElementById('snapshot-zoom-out').addEventListener('click', () => snapshotViewer.zoomCenter(0.8));
+document.getElementById('snapshot-zoom-reset').addEventListener('click', () => snapshotViewer.reset());
+
+// モーダルを閉じる
+closeModalBtn.addEventListener('click', () => {
+    hideModal(snapshotModal);
+    snapshotViewer.close();
+});
+
+// モーダル外をクリックして閉じる
+snapshotModal.addEventListener('click', (e) => {
+    if (e.target === snapshotModal) {
+        hideModal(snapshotModal);
+        snapshotViewer.close();
+    }
+});
+
+// グローバル関数を定義（グローバルスコープでアクセスできるように）
+window.handleStreamError = handleStreamError;
+window.refreshStream = refreshStream;
+
+// ページロード時にカメラ情報を取得
+document.addEventListener('DOMContentLoaded', () => {
+    fetchCameras();
+
+    // 1分ごとに自動更新（ストリーミングタブがアクティブの場合のみ）
+    setInterval(() => {
+        if (currentTab === 'streaming') {
+            fetchCameras();
+        }
+    }, 60000);
+
+    // 稼働状況タブがアクティブな間はメトリクスを定期的に更新
+    setInterval(() => {
+        if (currentTab === 'fleet') {
+            fetchFleetMetrics();
+        }
+    }, 10000);
+});